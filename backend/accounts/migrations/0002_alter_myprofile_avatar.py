@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:02
+
+import blobs.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='myprofile',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, storage=blobs.storage.get_content_addressed_storage, upload_to='avatar/'),
+        ),
+    ]
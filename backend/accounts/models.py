@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from blobs.storage import get_content_addressed_storage
 
 class CustomUser(AbstractUser):
     email = models.EmailField(unique=True)
@@ -30,6 +31,7 @@ class MyProfile(models.Model):
     follow = models.ForeignKey(Follower, on_delete=models.CASCADE, null=True, blank=True)
     avatar = models.ImageField(
         upload_to='avatar/',
+        storage=get_content_addressed_storage,
         blank=True,
         null=True
     )
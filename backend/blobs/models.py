@@ -0,0 +1,12 @@
+from django.db import models
+
+
+class Blob(models.Model):
+    """One stored file in ContentAddressedStorage and how many fields point at it."""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField()
+    refcount = models.PositiveIntegerField(default=0) # type: ignore
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} refs)"
@@ -0,0 +1,43 @@
+from django.apps import apps
+from django.db import models, transaction
+from django.db.models.signals import post_delete, pre_save
+from .storage import ContentAddressedStorage
+
+
+def content_addressed_fields(model):
+    return [
+        field for field in model._meta.get_fields()
+        if isinstance(field, models.FileField) and isinstance(field.storage, ContentAddressedStorage)
+    ]
+
+
+def release_on_commit(field, name):
+    if name:
+        transaction.on_commit(lambda: field.storage.delete(name))
+
+
+def release_replaced_files(sender, instance, raw=False, **kwargs):
+    # A replaced file (e.g. a new avatar) gives up its reference to the old blob
+    if raw or instance.pk is None:
+        return
+    fields = content_addressed_fields(sender)
+    old = sender._default_manager.filter(pk=instance.pk).values(*[f.attname for f in fields]).first()
+    if old is None:
+        return
+    for field in fields:
+        old_name = old[field.attname]
+        if old_name and old_name != getattr(instance, field.attname).name:
+            release_on_commit(field, old_name)
+
+
+def release_deleted_files(sender, instance, **kwargs):
+    for field in content_addressed_fields(sender):
+        release_on_commit(field, getattr(instance, field.attname).name)
+
+
+def connect_file_fields():
+    """Wire reference counting for every model with a content-addressed file field."""
+    for model in apps.get_models():
+        if content_addressed_fields(model):
+            pre_save.connect(release_replaced_files, sender=model, dispatch_uid=f'blobs_pre_save_{model._meta.label}')
+            post_delete.connect(release_deleted_files, sender=model, dispatch_uid=f'blobs_post_delete_{model._meta.label}')
@@ -0,0 +1,103 @@
+"""
+Content-addressed, deduplicated file storage.
+
+Uploads are hashed (SHA-256) while they stream to a temporary file, then moved
+to blobs/<h[:2]>/<h[2:4]>/<hash><ext>. Uploading the same bytes again reuses
+the existing file and only bumps Blob.refcount; delete() drops one reference
+and removes the file once nothing points at it any more.
+"""
+import hashlib
+import os
+import tempfile
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+BLOB_PREFIX = 'blobs'
+
+
+@deconstructible(path='blobs.storage.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is derived from the content in _save, never from `name`
+        return name
+
+    def blob_name(self, digest, name):
+        ext = os.path.splitext(name)[1].lower()
+        return f'{BLOB_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{ext}'
+
+    def _save(self, name, content):
+        from .models import Blob
+
+        tmp_dir = os.path.join(self.location, BLOB_PREFIX, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+
+        # Hash while spooling so the upload is read exactly once
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+
+            blob_name = self.blob_name(digest.hexdigest(), name)
+            with transaction.atomic():
+                blob, created = Blob.objects.select_for_update().get_or_create(
+                    name=blob_name, defaults={'size': size}
+                )
+                Blob.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1)
+                full_path = self.path(blob_name)
+                if created or not os.path.exists(full_path):
+                    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(tmp_path, self.file_permissions_mode)
+                    os.replace(tmp_path, full_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+        return blob_name
+
+    def delete(self, name):
+        """Release one reference to `name`; the file goes when the last one does."""
+        from .models import Blob
+
+        if not name:
+            raise ValueError('The name must be given to delete().')
+        if not name.startswith(f'{BLOB_PREFIX}/'):
+            # Files written before this storage was in place have a single owner
+            return super().delete(name)
+
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(name=name).first()
+            if blob is None:
+                return
+            if blob.refcount > 1:
+                Blob.objects.filter(pk=blob.pk).update(refcount=F('refcount') - 1)
+                return
+            blob.delete()
+            transaction.on_commit(lambda: self.unlink_unreferenced(name))
+
+    def unlink_unreferenced(self, name):
+        """Remove the file of a deleted Blob unless the same bytes were uploaded again meanwhile."""
+        from .models import Blob
+
+        with transaction.atomic():
+            if Blob.objects.select_for_update().filter(name=name).exists():
+                # _save recreated the row and rewrote the file after the delete
+                return
+            super().delete(name)
+
+
+content_addressed_storage = ContentAddressedStorage()
+
+
+def get_content_addressed_storage():
+    return content_addressed_storage
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from accounts.models import MyProfile
+from posts.models import ArtPost, ArtImage
+from .models import Blob
+from .storage import get_content_addressed_storage
+
+User = get_user_model()
+
+
+def temp_dir(test):
+    """Create a directory that is removed when the test ends."""
+    path = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, path, ignore_errors=True)
+    return path
+
+
+class ContentAddressedStorageTest(TestCase):
+    def setUp(self):
+        self.enterContext(override_settings(MEDIA_ROOT=temp_dir(self)))
+        self.user = User.objects.create_user(username='uploader', email='uploader@test.com', password='testpass123')
+        self.post = ArtPost.objects.create(user=self.user, description='Twice uploaded')
+        self.storage = get_content_addressed_storage()
+
+    def upload(self, data=b'same bytes', name='picture.JPG'):
+        return SimpleUploadedFile(name, data, content_type='image/jpeg')
+
+    def test_identical_uploads_share_one_sharded_blob(self):
+        first = ArtImage.objects.create(art=self.post, image=self.upload(name='a.jpg'))
+        second = ArtImage.objects.create(art=self.post, image=self.upload(name='b.jpg'))
+
+        self.assertEqual(first.image.name, second.image.name)
+        digest = os.path.splitext(os.path.basename(first.image.name))[0]
+        self.assertEqual(first.image.name, f'blobs/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        self.assertEqual(Blob.objects.get(name=first.image.name).refcount, 2)
+
+    def test_file_is_deleted_with_its_last_reference(self):
+        first = ArtImage.objects.create(art=self.post, image=self.upload())
+        second = ArtImage.objects.create(art=self.post, image=self.upload())
+        path = first.image.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(Blob.objects.get(name=second.image.name).refcount, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(Blob.objects.exists())
+
+    def test_reupload_before_commit_keeps_the_file(self):
+        first = ArtImage.objects.create(art=self.post, image=self.upload())
+        path = first.image.path
+
+        with self.captureOnCommitCallbacks() as releases:
+            first.delete()
+        # Releasing the last reference drops the row and defers the unlink
+        with self.captureOnCommitCallbacks() as unlinks:
+            for release in releases:
+                release()
+        self.assertFalse(Blob.objects.exists())
+
+        # The same bytes arrive again before the deferred unlink runs
+        second = ArtImage.objects.create(art=self.post, image=self.upload())
+        for unlink in unlinks:
+            unlink()
+
+        self.assertEqual(second.image.path, path)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(Blob.objects.get(name=second.image.name).refcount, 1)
+
+    def test_replacing_a_file_releases_the_old_blob(self):
+        profile = MyProfile.objects.create(user=self.user, avatar=self.upload(b'old avatar'))
+        old_path = profile.avatar.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.avatar = self.upload(b'new avatar')
+            profile.save()
+
+        self.assertFalse(os.path.exists(old_path))
+        self.assertTrue(os.path.exists(profile.avatar.path))
@@ -7,6 +7,7 @@ django.setup()  # هنا تهيئة Django لازم تكون قبل أي است
 
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
+from posts.middleware import JWTAuthMiddleware
 from posts.routing import websocket_urlpatterns
 
 logger = logging.getLogger(__name__)
@@ -18,8 +19,10 @@ logger.info(f"WebSocket patterns: {websocket_urlpatterns}")
 
 application = ProtocolTypeRouter({
     'http': django_asgi_app,
-    'websocket': URLRouter(
-        websocket_urlpatterns
+    'websocket': JWTAuthMiddleware(
+        URLRouter(
+            websocket_urlpatterns
+        )
     ),
 })
 
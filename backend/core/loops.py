@@ -0,0 +1,30 @@
+"""
+Objects that belong to one asyncio event loop.
+
+asyncio queues, futures and timers only work on the loop that created them,
+and an ASGI server or a test run may have several loops over a process's
+life, so such singletons are kept per loop instead of per process.
+"""
+import asyncio
+import functools
+import weakref
+
+
+def per_event_loop(factory):
+    """
+    Decorate a factory to return one instance per running event loop, the way
+    functools.lru_cache does per process. An instance goes away with its loop;
+    cache_clear() drops them all.
+    """
+    instances = weakref.WeakKeyDictionary()
+
+    @functools.wraps(factory)
+    def get():
+        loop = asyncio.get_running_loop()
+        instance = instances.get(loop)
+        if instance is None:
+            instance = instances[loop] = factory()
+        return instance
+
+    get.cache_clear = instances.clear
+    return get
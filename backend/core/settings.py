@@ -46,6 +46,8 @@ INSTALLED_APPS = [
     'posts',
     'story',
     'courses',  # Added courses app
+    'blobs',  # content-addressed media storage
+    'uploads',  # resumable chunked uploads
 
     # django channels
     'channels',
@@ -282,6 +284,74 @@ LOGGING = {
     },
 }
 
+# Home timeline (posts.timeline)
+# Redis URL for the per-user timelines; without it an in-process store is used
+TIMELINE_REDIS_URL = os.getenv('TIMELINE_REDIS_URL')
+TIMELINE_MAX_LENGTH = 800        # entries kept per user timeline
+TIMELINE_FANOUT_LIMIT = 10000    # above this many followers, merge on read instead
+
+# Art image derivatives (posts.images)
+ART_IMAGE_DERIVATIVE_WIDTHS = [320, 640, 1080]
+ART_IMAGE_WORKERS = int(os.getenv('ART_IMAGE_WORKERS', 2))
+
+# Write-behind like buffer (posts.likes)
+# Replay logs are runtime state, kept outside the source tree; point this at
+# persistent storage in production so logs survive a restart
+LIKE_BUFFER_LOG_DIR = os.getenv('LIKE_BUFFER_LOG_DIR', os.path.join('/var/tmp', 'arzuma', 'like_log'))
+LIKE_BUFFER_FLUSH_INTERVAL = 1.0   # seconds; None disables the background flusher
+LIKE_BUFFER_FSYNC = True           # fsync the replay log on every toggle
+
+# Trending feed (ArtViewSet.trending)
+TRENDING_WEIGHTS = {'like_count': 1.0, 'comment_count': 3.0}   # score added per like/comment
+TRENDING_HALF_LIFE_HOURS = 6
+TRENDING_DECAY_INTERVAL_MINUTES = 10   # how often decay_trending_scores is scheduled
+TRENDING_MIN_SCORE = 0.05              # decayed below this, a post drops out of trending
+TRENDING_LIMIT = 50
+
+# Art post websocket (posts.consumers.ArtPostConsumer)
+ARTPOST_WS_MAX_SUBSCRIPTIONS = 100   # posts one connection may follow at once
+ARTPOST_WS_COALESCE_WINDOW = 0.5     # seconds of likes/comments merged per delta frame; 0 sends each at once
+ARTPOST_WS_COALESCE_MAX_COMMENTS = 5 # comment bodies carried by one delta frame
+ARTPOST_WS_WRITE_BATCH_SIZE = 200    # likes/comments persisted per batch
+ARTPOST_WS_WRITE_BATCH_WINDOW = 0.05 # seconds the writer waits for a batch to fill
+ARTPOST_WS_WRITE_QUEUE_SIZE = 5000   # queued writes before senders are made to wait
+
+# Slow websocket readers (posts.protocols)
+WS_OUTBOUND_QUEUE_SIZE = 256          # frames queued per connection before the policy applies
+WS_SLOW_CLIENT_POLICY = 'drop_oldest' # 'drop_oldest', 'summary' or 'close'
+WS_SLOW_CLIENT_CLOSE_CODE = 4008
+WS_SLOW_CLIENT_SEND_TIMEOUT = 10      # seconds an undroppable frame waits for room before the client is closed
+
+# Chat history (posts.consumers.ChatConsumer)
+CHAT_RESUME_LIMIT = 500   # missed messages replayed on reconnect; older ones come from the history endpoint
+# Chat presence (posts.presence); without a Redis URL an in-process store is used
+PRESENCE_REDIS_URL = os.getenv('PRESENCE_REDIS_URL')
+PRESENCE_TTL = 60                     # seconds a connection stays online without a heartbeat
+PRESENCE_TYPING_TTL = 6               # seconds "typing" lasts without another typing frame
+PRESENCE_TYPING_MIN_INTERVAL = 1.0    # seconds between typing broadcasts for one connection
+
+# Resumable chunked uploads (uploads app)
+CHUNKED_UPLOAD_DIR = os.path.join(BASE_DIR, 'upload_sessions')
+CHUNKED_UPLOAD_MAX_SIZE = 500 * 1024 * 1024     # whole file
+CHUNKED_UPLOAD_MAX_CHUNK = 16 * 1024 * 1024     # one PUT
+CHUNKED_UPLOAD_EXPIRY_HOURS = 24
+
+# Stories (story app)
+STORY_LIFETIME_HOURS = 24
+STORY_REAPER_BATCH_SIZE = 500   # stories deleted per transaction by reap_stories
+STORY_TRAY_LIMIT = 100          # followed authors shown in the story tray
+STORY_TRAY_CACHE_TTL = 30       # seconds one viewer's tray is cached
+
+# Story video processing (story.processing)
+STORY_VIDEO_WORKERS = int(os.getenv('STORY_VIDEO_WORKERS', 2))   # ffmpeg runs at once per process
+STORY_HLS_SEGMENT_SECONDS = 4
+# HLS renditions by short side (720 is 720 wide in portrait); levels above the source's short side are skipped
+STORY_HLS_LEVELS = [
+    {'height': 360, 'video_bitrate': '800k', 'audio_bitrate': '96k'},
+    {'height': 540, 'video_bitrate': '1400k', 'audio_bitrate': '128k'},
+    {'height': 720, 'video_bitrate': '2800k', 'audio_bitrate': '128k'},
+]
+
 # Stripe Configuration
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', 'sk_test_your_stripe_secret_key')
 STRIPE_PUBLISHABLE_KEY = os.getenv('STRIPE_PUBLISHABLE_KEY', 'pk_test_your_stripe_publishable_key')
@@ -9,6 +9,7 @@ urlpatterns = [
     path('api/posts/', include('posts.urls')),
     path('api/stories/', include('story.urls')),
     path('api/courses/', include('courses.urls')),  # Added courses URLs
+    path('api/uploads/', include('uploads.urls')),
 ]
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -0,0 +1,40 @@
+"""
+Shared thread pools for background work that uses the database.
+
+Each named pool is created on first use with the worker count its caller
+passes (usually a setting), so every kind of job is throttled on its own.
+Tasks run between close_old_connections() calls, since pool threads never
+see a request's end to drop dead or expired connections, and a task that
+raises is logged instead of vanishing inside its future.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_executors = {}
+_lock = threading.Lock()
+
+
+def get_executor(name, max_workers):
+    with _lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        return _executors[name]
+
+
+def run_task(func, *args):
+    close_old_connections()
+    try:
+        return func(*args)
+    except Exception as e:
+        logger.error(f"Background task {func.__name__}{args} failed: {e}")
+    finally:
+        close_old_connections()
+
+
+def submit(pool, max_workers, func, *args):
+    """Run func(*args) on the named pool; returns its future."""
+    return get_executor(pool, max_workers).submit(run_task, func, *args)
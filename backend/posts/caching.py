@@ -0,0 +1,37 @@
+"""
+Generation-versioned cache keys for per-post comment pages.
+
+Every cached page key carries the post's current generation. A new or deleted
+comment bumps the generation instead of deleting keys, so readers simply move
+on to fresh keys and the old pages age out through their TTL.
+"""
+import time
+from django.core.cache import cache
+
+COMMENT_PAGE_TTL = 60 * 5
+
+
+def comment_generation_key(post_id):
+    return f'comments_gen_{post_id}'
+
+
+def get_comment_generation(post_id):
+    key = comment_generation_key(post_id)
+    generation = cache.get(key)
+    if generation is None:
+        # Seed from the clock so an evicted counter never reuses old page keys
+        cache.add(key, time.time_ns(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_comment_generation(post_id):
+    key = comment_generation_key(post_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def comment_page_key(post_id, cursor):
+    return f'comments_{post_id}_g{get_comment_generation(post_id)}_{cursor or "first"}'
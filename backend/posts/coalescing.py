@@ -0,0 +1,94 @@
+"""
+Coalesced like/comment broadcasts for ArtPostConsumer.
+
+Instead of one group_send per like, events for a post are gathered for
+ARTPOST_WS_COALESCE_WINDOW seconds and sent to the post's group as a single
+delta frame: {"likes": +n, "like_count": latest, "comments": +m,
+"recent_comments": [...last few...]}. A burst of 500 likes on one post costs
+one channel-layer message and one frame per subscriber per window.
+
+State is per process and per event loop; each worker flushes what it saw.
+"""
+import asyncio
+from django.conf import settings
+from channels.layers import get_channel_layer # type: ignore
+from core.loops import per_event_loop
+
+
+def post_group(art_post_id):
+    return f"artpost_{art_post_id}"
+
+
+class PendingDelta:
+    __slots__ = ('likes', 'like_count', 'comments', 'recent_comments')
+
+    def __init__(self):
+        self.likes = 0
+        self.like_count = None
+        self.comments = 0
+        self.recent_comments = []
+
+    def as_event(self, art_post_id):
+        return {
+            "type": "post_delta",
+            "art_post_id": art_post_id,
+            "likes": self.likes,
+            "like_count": self.like_count,
+            "comments": self.comments,
+            "recent_comments": self.recent_comments,
+        }
+
+
+class EventCoalescer:
+    def __init__(self, window, max_comments, channel_layer=None):
+        self.window = window
+        self.max_comments = max_comments
+        self.channel_layer = channel_layer or get_channel_layer()
+        self.pending = {}
+
+    def pending_for(self, art_post_id):
+        delta = self.pending.get(art_post_id)
+        if delta is None:
+            delta = self.pending[art_post_id] = PendingDelta()
+            if self.window > 0:
+                # The first event of a window arms the flush for that post
+                loop = asyncio.get_running_loop()
+                loop.call_later(self.window, lambda: asyncio.ensure_future(self.flush(art_post_id)))
+        return delta
+
+    async def add_like(self, art_post_id, like_count=None, change=1):
+        """Count one acked like; `change` is what it did to like_count (0 for a repeat)."""
+        delta = self.pending_for(art_post_id)
+        delta.likes += change
+        if like_count is not None:
+            delta.like_count = like_count
+        await self.flush_now_if_unbuffered(art_post_id)
+
+    async def add_comment(self, art_post_id, comment):
+        delta = self.pending_for(art_post_id)
+        delta.comments += 1
+        delta.recent_comments.append(comment)
+        del delta.recent_comments[:-self.max_comments]
+        await self.flush_now_if_unbuffered(art_post_id)
+
+    async def flush_now_if_unbuffered(self, art_post_id):
+        if self.window <= 0:
+            await self.flush(art_post_id)
+
+    async def flush(self, art_post_id):
+        delta = self.pending.pop(art_post_id, None)
+        if delta is not None:
+            await self.channel_layer.group_send(post_group(art_post_id), delta.as_event(art_post_id))
+
+    async def flush_all(self):
+        for art_post_id in list(self.pending):
+            await self.flush(art_post_id)
+
+
+@per_event_loop
+def get_coalescer():
+    """The coalescer of the running event loop."""
+    return EventCoalescer(
+        settings.ARTPOST_WS_COALESCE_WINDOW,
+        settings.ARTPOST_WS_COALESCE_MAX_COMMENTS,
+    )
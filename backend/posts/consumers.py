@@ -1,87 +1,152 @@
 # consumers.py
-from channels.generic.websocket import AsyncJsonWebsocketConsumer # type: ignore
 from channels.db import database_sync_to_async # type: ignore
-from .models import ArtLike, ArtComment, ArtPost
-from django.contrib.auth import get_user_model
+from asgiref.sync import sync_to_async
+from urllib.parse import parse_qs
+import asyncio
+import time
+from django.db import transaction
+from .models import ChatMessage, Conversation
+from .permissions import is_conversation_participant
+from .presence import get_presence_store
+from .protocols import NegotiatedWebsocketConsumer
+from .coalescing import get_coalescer, post_group
+from .write_queue import WriteRejected, get_write_queue
+from django.conf import settings
 import json
 
-User = get_user_model()
 
-class ArtPostConsumer(AsyncJsonWebsocketConsumer):
+class ArtPostConsumer(NegotiatedWebsocketConsumer):
+    """
+    Live likes/comments, routed per post. Clients subscribe to the posts on
+    screen ({"type": "subscribe", "art_post_ids": [...]}) and unsubscribe when
+    they scroll away; events reach only the subscribers of that post.
+    """
     async def connect(self):
-        self.group_name = "artposts"
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        self.subscriptions = set()
         await self.accept()
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        for art_post_id in self.subscriptions:
+            await self.channel_layer.group_discard(post_group(art_post_id), self.channel_name)
+        self.subscriptions.clear()
+
+    async def subscribe(self, art_post_ids):
+        rejected = []
+        for art_post_id in art_post_ids:
+            if art_post_id in self.subscriptions:
+                continue
+            if len(self.subscriptions) >= settings.ARTPOST_WS_MAX_SUBSCRIPTIONS:
+                rejected.append(art_post_id)
+                continue
+            self.subscriptions.add(art_post_id)
+            await self.channel_layer.group_add(post_group(art_post_id), self.channel_name)
+        if rejected:
+            await self.send_json({
+                "type": "error",
+                "detail": f"Subscription limit of {settings.ARTPOST_WS_MAX_SUBSCRIPTIONS} posts reached",
+                "art_post_ids": rejected,
+            })
+
+    async def unsubscribe(self, art_post_ids):
+        for art_post_id in art_post_ids:
+            if art_post_id in self.subscriptions:
+                self.subscriptions.discard(art_post_id)
+                await self.channel_layer.group_discard(post_group(art_post_id), self.channel_name)
 
     async def receive_json(self, content):
         event_type = content.get('type')
 
-        if event_type == 'like':
-            art_post_id = content.get('art_post_id')
-            user_id = content.get('user_id')
-            await self.create_like(user_id, art_post_id) # type: ignore
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    "type": "like_event",
-                    "art_post_id": art_post_id,
-                    "user_id": user_id,
-                }
-            )
+        if event_type in ('subscribe', 'unsubscribe'):
+            art_post_ids = content.get('art_post_ids')
+            if not isinstance(art_post_ids, list) or not all(
+                isinstance(i, int) and not isinstance(i, bool) and i > 0 for i in art_post_ids
+            ):
+                await self.send_json({"type": "error", "detail": "art_post_ids must be a list of post ids"})
+                return
+            if event_type == 'subscribe':
+                await self.subscribe(art_post_ids)
+            else:
+                await self.unsubscribe(art_post_ids)
+            await self.send_json({"type": "subscriptions", "art_post_ids": sorted(self.subscriptions)})
 
-        elif event_type == 'comment':
-            art_post_id = content.get('art_post_id')
-            user_id = content.get('user_id')
-            comment_text = content.get('content')
-            comment = await self.create_comment(user_id, art_post_id, comment_text)
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    "type": "comment_event",
-                    "art_post_id": art_post_id,
-                    "user_id": user_id,
-                    "content": comment_text,
-                }
-            )
+        elif event_type in ('like', 'comment'):
+            await self.write(event_type, content)
 
-    async def like_event(self, event):
-        await self.send_json({
-            "type": "like",
-            "art_post_id": event['art_post_id'],
-            "user_id": event['user_id'],
-        })
+    async def write(self, kind, content):
+        # The client may tag a write with "ref" to match it with its ack
+        ref = content.get('ref')
+        try:
+            art_post_id = int(content.get('art_post_id'))
+            user_id = int(content.get('user_id'))
+        except (TypeError, ValueError):
+            await self.send_json({"type": "error", "ref": ref, "detail": "art_post_id and user_id are required"})
+            return
+        comment_text = content.get('content')
+        if kind == 'comment' and not (isinstance(comment_text, str) and comment_text.strip()):
+            await self.send_json({"type": "error", "ref": ref, "detail": "content is required"})
+            return
 
-    async def comment_event(self, event):
+        try:
+            # Resolves once the batch holding this write has been saved
+            result = await get_write_queue().submit(kind, user_id, art_post_id, comment_text)
+        except WriteRejected as e:
+            await self.send_json({"type": "error", "ref": ref, "detail": str(e)})
+            return
+
+        await self.send_json({"type": "ack", "ref": ref, "kind": kind, "art_post_id": art_post_id, **result})
+        # Subscribers get one delta frame per post per coalescing window
+        if kind == 'like':
+            await get_coalescer().add_like(art_post_id, result['like_count'], result['change'])
+        else:
+            await get_coalescer().add_comment(art_post_id, result)
+
+    async def post_delta(self, event):
         await self.send_json({
-            "type": "comment",
+            "type": "delta",
             "art_post_id": event['art_post_id'],
-            "user_id": event['user_id'],
-            "content": event['content'],
+            "likes": event['likes'],
+            "like_count": event['like_count'],
+            "comments": event['comments'],
+            "recent_comments": event['recent_comments'],
         })
 
-    @database_sync_to_async
-    def create_like(self, user_id, art_post_id):
-        user = User.objects.get(id=user_id)
-        art_post = ArtPost.objects.get(id=art_post_id) # type: ignore
-        if not ArtLike.objects.filter(user=user, art_post=art_post).exists(): # type: ignore
-            ArtLike.objects.create(user=user, art_post=art_post) # type: ignore
-
-    @database_sync_to_async
-    def create_comment(self, user_id, art_post_id, content):
-        user = User.objects.get(id=user_id)
-        art_post = ArtPost.objects.get(id=art_post_id) # type: ignore
-        return ArtComment.objects.create(user=user, art_post=art_post, content=content) # type: ignore
 
+class ChatConsumer(NegotiatedWebsocketConsumer):
+    """
+    Conversations with stored history, open only to their participants as
+    authenticated by ?token= (JWTAuthMiddleware). Messages are saved to
+    ChatMessage before they are relayed, and carry their `seq`. A client
+    reconnecting with ?since=<last seq it saw> first receives the messages it
+    missed.
 
-class ChatConsumer(AsyncJsonWebsocketConsumer):
+    Typing and online state go through posts.presence: the room only hears
+    about a user when their state flips, typing flips are sent at most once
+    per PRESENCE_TYPING_MIN_INTERVAL, and joiners get a presence snapshot.
+    Presence belongs to the authenticated user, never to a name the client
+    sends. Clients send {"type": "heartbeat"} (or any frame) at least every
+    PRESENCE_TTL seconds to stay online.
+    """
     async def connect(self):
         self.conversation_id = self.scope['url_route']['kwargs']['conversation_id']
         self.room_group_name = f'chat_{self.conversation_id}'
+        # seqs already sent by the resume backfill, so the live copy is skipped
+        self.replayed_seqs = set()
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        user = self.scope.get('user')
+        # Identity comes from the token, never from what the client claims
+        self.username = user.username if user is not None and user.is_authenticated else None
+        self.typing = False          # this user's typing state as last stored
+        self.typing_sent = False     # ... and as last broadcast
+        self.typing_sent_at = 0.0
+        self.typing_flush = None
+        self.typing_expiry = None
+
+        if not await database_sync_to_async(is_conversation_participant)(user, self.conversation_id):
+            # Outsiders get neither history nor live messages
+            await self.close(code=4003)
+            return
 
-        # Join room group
+        # Join room group before reading the backlog so nothing falls in between
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
@@ -89,7 +154,126 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
 
         await self.accept()
 
+        if self.username:
+            if await self.presence('touch', 'online', settings.PRESENCE_TTL):
+                await self.broadcast_presence(True)
+        await self.send_json({
+            'type': 'presence_snapshot',
+            'online': await self.presence('members', 'online'),
+            'typing': await self.presence('members', 'typing'),
+        })
+
+        since = query.get('since', [None])[0]
+        if since is not None:
+            try:
+                await self.resume(int(since))
+            except ValueError:
+                await self.send_json({'type': 'error', 'detail': 'since must be a message seq'})
+
+    async def resume(self, since):
+        limit = settings.CHAT_RESUME_LIMIT
+        missed = await self.get_messages_after(since, limit + 1)
+        for message in missed[:limit]:
+            self.replayed_seqs.add(message.id)
+            await self.send_json(self.message_frame(message))
+        await self.send_json({
+            'type': 'resumed',
+            'last_seq': missed[:limit][-1].id if missed else since,
+            # Anything beyond the limit has to be paged from the history endpoint
+            'has_more': len(missed) > limit,
+        })
+
+    @database_sync_to_async
+    def get_messages_after(self, since, limit):
+        return list(
+            ChatMessage.objects.filter(conversation_id=self.conversation_id, id__gt=since).order_by('id')[:limit]
+        )
+
+    @database_sync_to_async
+    def save_message(self, sender_username, content):
+        with transaction.atomic():
+            # Writers to one conversation take turns, so seqs commit in order
+            # and a resume never skips a message that committed late
+            Conversation.objects.select_for_update().filter(id=self.conversation_id).first()
+            return ChatMessage.objects.create(
+                conversation_id=self.conversation_id,
+                sender_username=sender_username,
+                content=content,
+            )
+
+    @staticmethod
+    def message_frame(message):
+        return {
+            'type': 'message',
+            'seq': message.id,
+            'content': message.content,
+            'sender_username': message.sender_username,
+            'timestamp': message.created_at.isoformat(),
+        }
+
+    async def presence(self, method, kind, *args):
+        store = get_presence_store()
+        if method == 'members':
+            return await sync_to_async(store.members, thread_sensitive=False)(self.conversation_id, kind)
+        return await sync_to_async(getattr(store, method), thread_sensitive=False)(
+            self.conversation_id, kind, self.username, self.channel_name, *args
+        )
+
+    async def broadcast_presence(self, online):
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {'type': 'presence_update', 'username': self.username, 'online': online}
+        )
+
+    async def set_typing(self, is_typing):
+        if is_typing:
+            flipped = await self.presence('touch', 'typing', settings.PRESENCE_TYPING_TTL)
+            # Clients that never send is_typing=false are timed out
+            if self.typing_expiry:
+                self.typing_expiry.cancel()
+            self.typing_expiry = asyncio.get_running_loop().call_later(
+                settings.PRESENCE_TYPING_TTL, lambda: asyncio.ensure_future(self.set_typing(False))
+            )
+        else:
+            flipped = await self.presence('remove', 'typing')
+        if flipped or is_typing != self.typing:
+            self.typing = is_typing
+            await self.send_typing_state()
+
+    async def send_typing_state(self, from_timer=False):
+        """Broadcast the stored typing state, at most once per min interval."""
+        if from_timer:
+            self.typing_flush = None
+        if self.typing == self.typing_sent:
+            return
+        wait = self.typing_sent_at + settings.PRESENCE_TYPING_MIN_INTERVAL - time.monotonic()
+        if wait > 0:
+            # Trailing edge: a start/stop pair inside the interval cancels out
+            if self.typing_flush is None:
+                self.typing_flush = asyncio.get_running_loop().call_later(
+                    wait, lambda: asyncio.ensure_future(self.send_typing_state(from_timer=True))
+                )
+            return
+        self.typing_sent = self.typing
+        self.typing_sent_at = time.monotonic()
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {'type': 'typing_indicator', 'username': self.username, 'is_typing': self.typing}
+        )
+
     async def disconnect(self, close_code):
+        for timer in (self.typing_flush, self.typing_expiry):
+            if timer:
+                timer.cancel()
+        if self.username:
+            if await self.presence('remove', 'typing') and self.typing_sent:
+                await self.channel_layer.group_send(
+                    self.room_group_name,
+                    {'type': 'typing_indicator', 'username': self.username, 'is_typing': False}
+                )
+            # Also after an unannounced expiry, or the room would show them online for good
+            if await self.presence('remove', 'online'):
+                await self.broadcast_presence(False)
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
@@ -98,36 +282,41 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
 
     async def receive_json(self, content):
         message_type = content.get('type')
-        
+        if self.username:
+            # Every frame doubles as a heartbeat; one after an expiry brings the user back
+            if await self.presence('touch', 'online', settings.PRESENCE_TTL):
+                await self.broadcast_presence(True)
+
         if message_type == 'message':
+            if not self.username:
+                # History is permanent; it is never written under a name the client picked
+                await self.send_json({'type': 'error', 'detail': 'authentication is required to send messages'})
+                return
+            text = content.get('content')
+            if not isinstance(text, str) or not text.strip():
+                await self.send_json({'type': 'error', 'detail': 'content is required'})
+                return
+            message = await self.save_message(self.username, text)
             # Send message to room group
             await self.channel_layer.group_send(
                 self.room_group_name,
-                {
-                    'type': 'chat_message',
-                    'content': content.get('content'),
-                    'sender_username': content.get('sender_username', 'Unknown'),
-                    'timestamp': content.get('timestamp'),
-                }
+                {**self.message_frame(message), 'type': 'chat_message'}
             )
         elif message_type == 'typing':
-            # Send typing indicator to room group
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'typing_indicator',
-                    'username': content.get('username', 'Unknown'),
-                    'is_typing': content.get('is_typing', False),
-                }
-            )
+            if self.username:
+                await self.set_typing(bool(content.get('is_typing', False)))
 
     async def chat_message(self, event):
+        if event['seq'] in self.replayed_seqs:
+            return
         # Send message to WebSocket
+        await self.send_json({**event, 'type': 'message'})
+
+    async def presence_update(self, event):
         await self.send_json({
-            'type': 'message',
-            'content': event['content'],
-            'sender_username': event['sender_username'],
-            'timestamp': event['timestamp'],
+            'type': 'presence',
+            'username': event['username'],
+            'online': event['online'],
         })
 
     async def typing_indicator(self, event):
@@ -0,0 +1,84 @@
+"""
+Resized derivatives for ArtImage uploads.
+
+After a post is created its images are handed to a small thread pool that
+writes WebP and JPEG copies at ART_IMAGE_DERIVATIVE_WIDTHS with Pillow and
+records them on ArtImage.derivatives. Until that finishes the serializer keeps
+serving the original upload. The files are deleted with their ArtImage, and
+regenerating replaces the old set.
+"""
+import io
+import logging
+import os
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+from core import workers
+from .models import ArtImage
+
+logger = logging.getLogger(__name__)
+
+# Pillow encoder name and options for each derivative format
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+def schedule_derivatives(image_ids):
+    """Queue derivative generation once the current transaction commits."""
+    image_ids = list(image_ids)
+
+    def submit():
+        for image_id in image_ids:
+            workers.submit('art-image', settings.ART_IMAGE_WORKERS, generate_or_fail, image_id)
+
+    transaction.on_commit(submit)
+
+
+def generate_or_fail(image_id):
+    try:
+        generate_derivatives(image_id)
+    except Exception as e:
+        logger.error(f"Derivative generation failed for ArtImage {image_id}: {e}")
+        ArtImage.objects.filter(id=image_id).update(derivatives_status='failed')
+
+
+def delete_derivative_files(derivatives):
+    """Remove the files listed in an ArtImage.derivatives value."""
+    for derivative in derivatives:
+        default_storage.delete(derivative['name'])
+
+
+def generate_derivatives(image_id):
+    """Write every configured width/format of one ArtImage and record them."""
+    art_image = ArtImage.objects.get(id=image_id)
+    if art_image.derivatives:
+        # Regenerating: serve the original while the old set is replaced
+        ArtImage.objects.filter(id=image_id).update(derivatives=[], derivatives_status='pending')
+        delete_derivative_files(art_image.derivatives)
+    stem = os.path.splitext(os.path.basename(art_image.image.name))[0]
+    derivatives = []
+
+    with art_image.image.open('rb') as source:
+        with Image.open(source) as original:
+            original = ImageOps.exif_transpose(original)
+            for width in settings.ART_IMAGE_DERIVATIVE_WIDTHS:
+                if width >= original.width:
+                    # Never upscale; the original already covers this width
+                    continue
+                height = round(original.height * width / original.width)
+                resized = original.resize((width, height), Image.Resampling.LANCZOS)
+                for fmt, (encoder, options) in DERIVATIVE_FORMATS.items():
+                    buffer = io.BytesIO()
+                    image = resized.convert('RGB') if encoder == 'JPEG' else resized
+                    image.save(buffer, encoder, **options)
+                    name = default_storage.save(
+                        f'art_images/derivatives/{image_id}/{stem}_{width}w.{fmt}',
+                        ContentFile(buffer.getvalue()),
+                    )
+                    derivatives.append({'width': width, 'format': fmt, 'name': name})
+
+    ArtImage.objects.filter(id=image_id).update(derivatives=derivatives, derivatives_status='ready')
+    return derivatives
@@ -0,0 +1,271 @@
+"""
+Write-behind buffer for likes.
+
+Like toggles from the REST and websocket paths are recorded here and answered
+straight away with the projected state and count; nothing is written to
+ArtLike on the request path. A background flusher applies the buffered
+toggles in one transaction per batch (bulk_create / bulk delete plus one
+counter update per post).
+
+Every toggle is first appended (and fsynced) to a per-process replay log
+named after the host and pid. Entries are desired end states ("user u likes
+post p: yes/no"), so replaying a log twice is harmless; `manage.py
+replay_like_log` applies logs left behind by processes of this host that are
+no longer running.
+"""
+import atexit
+import functools
+import glob
+import json
+import logging
+import os
+import re
+import socket
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, transaction
+from .models import ArtLike, ArtPost
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+# likes-<host>-<pid>.log, and likes-<host>-<pid>.flushing-<n> while it is applied
+LOG_NAME = re.compile(r'^likes-(?P<host>.+)-(?P<pid>\d+)\.(log|flushing-\d+)$')
+
+
+def read_log(path):
+    """Collapse a replay log into {(user_id, post_id): liked}, last entry wins."""
+    batch = {}
+    with open(path) as log:
+        for line in log:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A torn final line from a crash mid-write
+                continue
+            batch[(entry['u'], entry['p'])] = bool(entry['l'])
+    return batch
+
+
+def apply_batch(batch):
+    """Bring ArtLike rows and like_count counters in line with `batch`."""
+    if not batch:
+        return 0
+    user_ids = {user_id for user_id, _ in batch}
+    post_ids = {post_id for _, post_id in batch}
+
+    with transaction.atomic():
+        # Users or posts deleted since the toggle would fail the whole batch
+        live_users = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+        live_posts = set(ArtPost.objects.filter(id__in=post_ids).values_list('id', flat=True))
+        existing = {
+            (user_id, post_id): (like_id, created_at)
+            for like_id, user_id, post_id, created_at in ArtLike.objects.filter(
+                user_id__in=user_ids, art_post_id__in=post_ids
+            ).values_list('id', 'user_id', 'art_post_id', 'created_at')
+        }
+        to_create = []
+        to_delete = []
+        added = defaultdict(int)
+        # created_at of each removed like, so trending_score loses only its decayed weight
+        removed_at = defaultdict(list)
+        for (user_id, post_id), liked in batch.items():
+            if user_id not in live_users or post_id not in live_posts:
+                continue
+            if liked and (user_id, post_id) not in existing:
+                to_create.append(ArtLike(user_id=user_id, art_post_id=post_id))
+                added[post_id] += 1
+            elif not liked and (user_id, post_id) in existing:
+                like_id, created_at = existing[(user_id, post_id)]
+                to_delete.append(like_id)
+                removed_at[post_id].append(created_at)
+
+        # unique_together still guards against a concurrent flush of the same like
+        ArtLike.objects.bulk_create(to_create, ignore_conflicts=True)
+        ArtLike.objects.filter(id__in=to_delete).delete()
+        for post_id, count in added.items():
+            ArtPost.bump_counter(post_id, 'like_count', count)
+        for post_id, created_ats in removed_at.items():
+            ArtPost.bump_counter(post_id, 'like_count', -len(created_ats), removed_at=created_ats)
+
+    cache.delete_many([f'likes_{post_id}' for post_id in post_ids])
+    return len(to_create) + len(to_delete)
+
+
+class LikeBuffer:
+    def __init__(self, log_dir, flush_interval=None, fsync=True):
+        self.log_dir = log_dir
+        self.fsync = fsync
+        # Reentrant: toggle holds it across current_state and record
+        self.lock = threading.RLock()
+        self.flush_lock = threading.Lock()
+        # (user_id, post_id) -> liked; `inflight` is the batch being flushed
+        self.pending = {}
+        self.inflight = {}
+        self.deltas = defaultdict(int)
+        self.inflight_deltas = defaultdict(int)
+
+        os.makedirs(log_dir, exist_ok=True)
+        self.log_prefix = os.path.join(log_dir, f'likes-{socket.gethostname()}-{os.getpid()}')
+        self.log_path = f'{self.log_prefix}.log'
+        # Files under our own name were left by an earlier process that had the
+        # same pid (common in containers); queue them for the next flush
+        leftovers = sorted(glob.glob(f'{self.log_prefix}.flushing-*'))
+        self.flush_seq = int(leftovers[-1].rsplit('-', 1)[1]) if leftovers else 0
+        if os.path.exists(self.log_path):
+            self.flush_seq += 1
+            os.replace(self.log_path, f'{self.log_prefix}.flushing-{self.flush_seq:08d}')
+        self.log_fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+        if flush_interval:
+            self.stop_event = threading.Event()
+            thread = threading.Thread(target=self.run, args=(flush_interval,), name='like-flusher', daemon=True)
+            thread.start()
+
+    def current_state(self, user_id, post_id):
+        """Liked state as the client should see it: buffer first, then the database."""
+        key = (user_id, post_id)
+        with self.lock:
+            for buffered in (self.pending, self.inflight):
+                if key in buffered:
+                    return buffered[key]
+        return ArtLike.objects.filter(user_id=user_id, art_post_id=post_id).exists()
+
+    def current_states(self, keys):
+        """current_state for many (user_id, post_id) keys with one query."""
+        states = {}
+        with self.lock:
+            for key in keys:
+                for buffered in (self.pending, self.inflight):
+                    if key in buffered:
+                        states[key] = buffered[key]
+                        break
+        missing = [key for key in keys if key not in states]
+        if missing:
+            stored = set(ArtLike.objects.filter(
+                user_id__in={user_id for user_id, _ in missing},
+                art_post_id__in={post_id for _, post_id in missing},
+            ).values_list('user_id', 'art_post_id'))
+            for key in missing:
+                states[key] = key in stored
+        return states
+
+    def record(self, user_id, post_id, liked, current, stored_count=None):
+        if stored_count is None:
+            stored_count = ArtPost.objects.filter(pk=post_id).values_list('like_count', flat=True).first()
+            if stored_count is None:
+                raise ArtPost.DoesNotExist(f'ArtPost {post_id} does not exist')
+
+        key = (user_id, post_id)
+        with self.lock:
+            os.write(self.log_fd, (json.dumps({'u': user_id, 'p': post_id, 'l': int(liked)}) + '\n').encode())
+            if self.fsync:
+                os.fsync(self.log_fd)
+            previous = self.pending.get(key, current)
+            self.deltas[post_id] += int(liked) - int(previous)
+            self.pending[key] = liked
+            delta = self.deltas[post_id] + self.inflight_deltas[post_id]
+        return liked, max(stored_count + delta, 0)
+
+    def set_like(self, user_id, post_id, liked, stored_count=None):
+        """
+        Record the desired state for one like; returns (liked, projected
+        like_count). Pass the post's stored like_count if it is already loaded.
+        """
+        with self.lock:
+            current = self.current_state(user_id, post_id)
+            return self.record(user_id, post_id, liked, current, stored_count)
+
+    def toggle(self, user_id, post_id, stored_count=None):
+        # Read and write under one lock, or two toggles could both flip the same state
+        with self.lock:
+            current = self.current_state(user_id, post_id)
+            return self.record(user_id, post_id, not current, current, stored_count)
+
+    def flush(self):
+        """Apply everything buffered so far; returns the number of rows changed."""
+        with self.flush_lock:
+            # Logs from earlier failed flushes go first; entries are idempotent
+            for path in sorted(glob.glob(f'{self.log_prefix}.flushing-*')):
+                apply_batch(read_log(path))
+                os.unlink(path)
+
+            with self.lock:
+                if not self.pending:
+                    return 0
+                self.flush_seq += 1
+                flushing_path = f'{self.log_prefix}.flushing-{self.flush_seq:08d}'
+                os.close(self.log_fd)
+                try:
+                    os.replace(self.log_path, flushing_path)
+                finally:
+                    # Reopened even if the rename failed, so later records still have a log
+                    self.log_fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                # Only now that their log is set aside do the toggles leave pending
+                self.inflight, self.pending = self.pending, {}
+                self.inflight_deltas, self.deltas = self.deltas, defaultdict(int)
+
+            try:
+                changed = apply_batch(self.inflight)
+                os.unlink(flushing_path)
+            finally:
+                # On failure the .flushing log stays on disk and is retried first
+                with self.lock:
+                    self.inflight = {}
+                    self.inflight_deltas = defaultdict(int)
+            return changed
+
+    def run(self, interval):
+        while not self.stop_event.wait(interval):
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Like buffer flush failed: {e}")
+            finally:
+                close_old_connections()
+
+
+@functools.lru_cache(maxsize=None)
+def get_like_buffer():
+    like_buffer = LikeBuffer(
+        settings.LIKE_BUFFER_LOG_DIR,
+        flush_interval=settings.LIKE_BUFFER_FLUSH_INTERVAL,
+        fsync=settings.LIKE_BUFFER_FSYNC,
+    )
+    atexit.register(like_buffer.flush)
+    return like_buffer
+
+
+def process_is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Alive, just owned by another user
+        return True
+    return True
+
+
+def replay_logs(log_dir):
+    """
+    Apply the replay logs in `log_dir` of processes on this host that are no
+    longer running (crash recovery); returns files replayed. Logs of live
+    workers, and of other hosts, are left to their owners.
+    """
+    hostname = socket.gethostname()
+    replayed = 0
+    # Per process, .flushing-N logs sort before the live .log, i.e. oldest first
+    for path in sorted(glob.glob(os.path.join(log_dir, 'likes-*'))):
+        match = LOG_NAME.match(os.path.basename(path))
+        if match is None or match['host'] != hostname or process_is_running(int(match['pid'])):
+            continue
+        apply_batch(read_log(path))
+        os.unlink(path)
+        replayed += 1
+    return replayed
@@ -0,0 +1,71 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from posts.protocols import pack, unpack
+
+# Typical frames sent by ArtPostConsumer and ChatConsumer
+SAMPLE_FRAMES = {
+    'like ack': {"type": "ack", "ref": "c1-42", "kind": "like", "art_post_id": 48213, "like_count": 1934},
+    'delta': {
+        "type": "delta", "art_post_id": 48213, "likes": 37, "like_count": 1971, "comments": 3,
+        "recent_comments": [
+            {"id": 902311 + i, "user_id": 5120 + i, "content": "Beautiful colours, love the light here"}
+            for i in range(3)
+        ],
+    },
+    'chat message': {
+        "type": "message", "seq": 7741203, "content": "مرحبا! see you at the gallery tomorrow?",
+        "sender_username": "layla_art", "timestamp": "2026-10-17T19:14:02.123456+00:00",
+    },
+    'typing': {"type": "typing", "username": "layla_art", "is_typing": True},
+    'presence snapshot': {
+        "type": "presence_snapshot",
+        "online": [f"artist_{i}" for i in range(25)],
+        "typing": ["artist_3"],
+    },
+}
+
+
+def json_encode(content):
+    # Text frames go over the wire as UTF-8
+    return json.dumps(content).encode('utf-8')
+
+
+def json_decode(data):
+    return json.loads(data)
+
+
+CODECS = {
+    'json': (json_encode, json_decode),
+    'msgpack': (pack, unpack),
+}
+
+
+def rate(func, arg, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func(arg)
+    return iterations / (time.perf_counter() - started)
+
+
+class Command(BaseCommand):
+    help = 'Compare JSON and MessagePack websocket frames: size and encode/decode throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=100000,
+                            help='Encodes and decodes timed per frame and codec')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        self.stdout.write(
+            f"{'frame':<18} {'codec':<8} {'bytes':>6} {'saved':>6} {'encode/s':>11} {'decode/s':>11}"
+        )
+        for name, frame in SAMPLE_FRAMES.items():
+            json_size = len(json_encode(frame))
+            for codec, (encode, decode) in CODECS.items():
+                data = encode(frame)
+                saved = f'{1 - len(data) / json_size:.0%}' if codec != 'json' else ''
+                self.stdout.write(
+                    f"{name:<18} {codec:<8} {len(data):>6} {saved:>6} "
+                    f"{rate(encode, frame, iterations):>11,.0f} {rate(decode, data, iterations):>11,.0f}"
+                )
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from posts.models import ArtPost, TrendingDecay
+
+
+class Command(BaseCommand):
+    help = 'Decay ArtPost.trending_score by the time elapsed since the last run; schedule it every TRENDING_DECAY_INTERVAL_MINUTES'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--elapsed-minutes', type=float, default=None,
+                            help='Minutes of decay to apply (defaults to the time since the last run)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of posts updated per statement')
+
+    def elapsed_minutes(self, override):
+        """Claim the span since the last run, so a late, skipped or overlapping run decays by what really passed."""
+        now = timezone.now()
+        with transaction.atomic():
+            state = TrendingDecay.objects.select_for_update().first()
+            if state is None:
+                # First run: nothing recorded, assume one scheduling interval
+                elapsed = settings.TRENDING_DECAY_INTERVAL_MINUTES
+                TrendingDecay.objects.create(decayed_at=now)
+            else:
+                elapsed = max((now - state.decayed_at).total_seconds() / 60, 0)
+                state.decayed_at = now
+                state.save(update_fields=['decayed_at'])
+        return elapsed if override is None else override
+
+    def handle(self, *args, **options):
+        # Every scored post is decayed by the same factor, so ranks stay
+        # consistent between runs; only engagement since the last run is
+        # briefly over-weighted by at most one interval of decay.
+        elapsed = self.elapsed_minutes(options['elapsed_minutes'])
+        factor = 0.5 ** (elapsed / 60 / settings.TRENDING_HALF_LIFE_HOURS)
+        batch_size = options['batch_size']
+        last_id = 0
+        decayed = 0
+
+        while True:
+            batch = list(
+                ArtPost.objects.filter(trending_score__gt=0, pk__gt=last_id)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1]
+            decayed += ArtPost.objects.filter(pk__in=batch).update(trending_score=F('trending_score') * factor)
+
+        # Drop the long tail so the trending index only holds live posts
+        dropped = ArtPost.objects.filter(
+            trending_score__gt=0, trending_score__lt=settings.TRENDING_MIN_SCORE
+        ).update(trending_score=0)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Decayed {decayed} trending scores by {factor:.4f} ({elapsed:.1f} minutes). '
+            f'Dropped {dropped} below the minimum.'
+        ))
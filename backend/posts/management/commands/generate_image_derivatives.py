@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from posts.images import generate_derivatives
+from posts.models import ArtImage
+
+
+class Command(BaseCommand):
+    help = 'Generate resized derivatives for ArtImage rows that are still pending or failed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true',
+                            help='Also retry images whose previous attempt failed')
+
+    def handle(self, *args, **options):
+        statuses = ['pending', 'failed'] if options['retry_failed'] else ['pending']
+        image_ids = ArtImage.objects.filter(derivatives_status__in=statuses).values_list('id', flat=True)
+
+        done = failed = 0
+        for image_id in image_ids.iterator(chunk_size=500):
+            try:
+                generate_derivatives(image_id)
+                done += 1
+            except Exception as e:
+                ArtImage.objects.filter(id=image_id).update(derivatives_status='failed')
+                self.stderr.write(f'ArtImage {image_id}: {e}')
+                failed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Generated derivatives for {done} images, {failed} failed.'))
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from channels.layers import DEFAULT_CHANNEL_LAYER, InMemoryChannelLayer, channel_layers # type: ignore
+from channels.testing import WebsocketCommunicator # type: ignore
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework_simplejwt.tokens import AccessToken
+from posts.models import ArtPost, Conversation
+
+User = get_user_model()
+
+
+def percentile(samples, p):
+    if not samples:
+        return None
+    return samples[min(int(len(samples) * p), len(samples) - 1)]
+
+
+class Client:
+    """One simulated websocket client and what it received."""
+
+    def __init__(self, communicator, stats):
+        self.communicator = communicator
+        self.stats = stats
+        self.reader = None
+
+    async def read(self):
+        while True:
+            output = await self.communicator.receive_output(timeout=3600)
+            if output['type'] != 'websocket.send':
+                return
+            self.stats.record(json.loads(output['text']))
+
+
+class Stats:
+    def __init__(self):
+        self.frames = 0
+        self.sent = {}            # ref -> send time of a like/comment
+        self.ack_latency = []
+        self.delivery_latency = []
+
+    def record(self, frame):
+        now = time.perf_counter()
+        self.frames += 1
+        kind = frame.get('type')
+        if kind == 'ack' and frame.get('ref') in self.sent:
+            self.ack_latency.append(now - self.sent[frame['ref']])
+        elif kind == 'delta':
+            # Comment bodies carry their send time, so coalesced frames can be timed too
+            for comment in frame['recent_comments']:
+                self.delivery_latency.append(now - float(comment['content']))
+        elif kind == 'message':
+            self.delivery_latency.append(now - float(frame['content']))
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test ws/artposts/ and ws/chat/ in-process: core.asgi on an in-memory channel layer '
+        'and a throwaway test database, reporting latency percentiles, frames/sec and memory per connection'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', choices=['artposts', 'chat'], default='artposts')
+        parser.add_argument('--clients', type=int, default=1000, help='Concurrent websocket clients')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds of traffic')
+        parser.add_argument('--rate', type=float, default=200, help='Likes/comments or chat messages sent per second')
+        parser.add_argument('--posts', type=int, default=50, help='Posts (artposts) or conversations (chat) to spread clients over')
+        parser.add_argument('--subscriptions', type=int, default=10, help='Posts each artposts client subscribes to')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        # Writes go to a throwaway database, never the configured one
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+        try:
+            channel_layers.set(DEFAULT_CHANNEL_LAYER, InMemoryChannelLayer(capacity=10000))
+            report = asyncio.run(self.run(options))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.print_report(options, report)
+
+    def create_fixtures(self, options):
+        author = User.objects.create_user(username='loadtest_author', email='author@loadtest.invalid')
+        writers = User.objects.bulk_create([
+            User(username=f'loadtest_{i}', email=f'loadtest_{i}@loadtest.invalid') for i in range(200)
+        ])
+        posts = ArtPost.objects.bulk_create([
+            ArtPost(user=author, description=f'Load test post {i}') for i in range(options['posts'])
+        ])
+        # Chat clients authenticate as the writers, the way the app passes ?token=,
+        # and every writer is a participant of every conversation
+        tokens = [str(AccessToken.for_user(user)) for user in writers]
+        conversations = Conversation.objects.bulk_create([Conversation() for _ in range(options['posts'])])
+        for conversation in conversations:
+            conversation.participants.add(*writers)
+        return [user.id for user in writers], [post.id for post in posts], tokens, [c.id for c in conversations]
+
+    async def run(self, options):
+        from asgiref.sync import sync_to_async
+        from core.asgi import application
+
+        writer_ids, post_ids, tokens, conversation_ids = await sync_to_async(self.create_fixtures)(options)
+        stats = Stats()
+        clients = []
+
+        # Heap growth while connecting, divided by connections
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for i in range(options['clients']):
+            if options['scenario'] == 'chat':
+                path = f'/ws/chat/{random.choice(conversation_ids)}/?token={tokens[i % len(tokens)]}'
+            else:
+                path = '/ws/artposts/'
+            communicator = WebsocketCommunicator(application, path)
+            connected, _ = await communicator.connect(timeout=10)
+            if not connected:
+                raise RuntimeError(f'Client {i} was refused')
+            if options['scenario'] == 'artposts':
+                await communicator.send_json_to({
+                    'type': 'subscribe',
+                    'art_post_ids': random.sample(post_ids, min(options['subscriptions'], len(post_ids))),
+                })
+            client = Client(communicator, stats)
+            client.reader = asyncio.ensure_future(client.read())
+            clients.append(client)
+        await asyncio.sleep(0.5)
+        memory_per_connection = (tracemalloc.get_traced_memory()[0] - before) / len(clients)
+        tracemalloc.stop()
+        stats.frames = 0
+
+        started = time.perf_counter()
+        sent = 0
+        interval = 1 / options['rate']
+        while time.perf_counter() - started < options['duration']:
+            client = random.choice(clients)
+            ref = str(sent)
+            stats.sent[ref] = time.perf_counter()
+            if options['scenario'] == 'chat':
+                frame = {'type': 'message', 'content': repr(time.perf_counter())}
+            elif random.random() < 0.8:
+                frame = {'type': 'like', 'ref': ref, 'art_post_id': random.choice(post_ids),
+                         'user_id': random.choice(writer_ids)}
+            else:
+                frame = {'type': 'comment', 'ref': ref, 'art_post_id': random.choice(post_ids),
+                         'user_id': random.choice(writer_ids), 'content': repr(time.perf_counter())}
+            await client.communicator.send_json_to(frame)
+            sent += 1
+            await asyncio.sleep(interval)
+
+        # Let in-flight batches and coalescing windows drain
+        await asyncio.sleep(2)
+        elapsed = time.perf_counter() - started
+        for client in clients:
+            client.reader.cancel()
+            await client.communicator.disconnect()
+
+        return {
+            'sent': sent,
+            'elapsed': elapsed,
+            'frames': stats.frames,
+            'memory_per_connection': memory_per_connection,
+            'ack_latency': sorted(stats.ack_latency),
+            'delivery_latency': sorted(stats.delivery_latency),
+        }
+
+    def print_report(self, options, report):
+        def latency_line(name, samples):
+            if not samples:
+                return f'{name}: no samples'
+            ms = [s * 1000 for s in samples]
+            return (
+                f'{name} (ms): p50={percentile(ms, 0.5):.1f} p95={percentile(ms, 0.95):.1f} '
+                f'p99={percentile(ms, 0.99):.1f} max={ms[-1]:.1f} mean={statistics.fmean(ms):.1f} n={len(ms)}'
+            )
+
+        self.stdout.write(f"Scenario {options['scenario']}: {options['clients']} clients, "
+                          f"{report['sent']} events sent in {options['duration']:.0f}s")
+        self.stdout.write(f"Frames delivered: {report['frames']} ({report['frames'] / report['elapsed']:,.0f}/s)")
+        self.stdout.write(f"Memory per connection: {report['memory_per_connection'] / 1024:.1f} KiB")
+        if options['scenario'] == 'artposts':
+            self.stdout.write(latency_line('Write ack latency', report['ack_latency']))
+        self.stdout.write(latency_line('Delivery latency', report['delivery_latency']))
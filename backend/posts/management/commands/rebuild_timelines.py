@@ -0,0 +1,41 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import Follower
+from posts.timeline import get_timeline_store, rebuild_timeline
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Rebuild materialized home timelines from the Follower graph'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*',
+                            help='Rebuild only these users (default: every user who follows someone)')
+        parser.add_argument('--force', action='store_true',
+                            help='Rebuild timelines that already exist as well as cold ones')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of user ids loaded per batch')
+
+    def handle(self, *args, **options):
+        store = get_timeline_store()
+        usernames = options['usernames']
+
+        if usernames:
+            user_ids = User.objects.filter(username__in=usernames).values_list('id', flat=True)
+            if user_ids.count() != len(set(usernames)):
+                raise CommandError('Some of the given usernames do not exist')
+        else:
+            user_ids = Follower.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+
+        # Named users are always rebuilt; a full sweep only fills cold timelines
+        rebuild_warm = options['force'] or bool(usernames)
+        rebuilt = skipped = 0
+        for user_id in user_ids.iterator(chunk_size=options['batch_size']):
+            if not rebuild_warm and store.exists(user_id):
+                skipped += 1
+                continue
+            rebuild_timeline(user_id)
+            rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} timelines, skipped {skipped} warm ones.'))
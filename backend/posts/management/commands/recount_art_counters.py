@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from posts.models import ArtPost, ArtPostCategory, ArtLike, ArtComment, Category
+
+
+def count_of(model):
+    """Correlated COUNT(*) of `model` rows pointing at the outer ArtPost."""
+    counts = (
+        model.objects.filter(art_post=OuterRef('pk'))
+        .order_by()
+        .values('art_post')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counts), Value(0))
+
+
+class Command(BaseCommand):
+    help = 'Recompute drifted like_count/comment_count counters on ArtPost in batches, then Category.post_count'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of posts checked per batch')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report drifted posts without writing')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        last_id = 0
+        checked = fixed = 0
+
+        while True:
+            # Walk the table by primary key so each batch is an index range scan
+            batch = list(
+                ArtPost.objects.filter(pk__gt=last_id)
+                .order_by('pk')
+                .annotate(actual_likes=count_of(ArtLike), actual_comments=count_of(ArtComment))
+                .values('pk', 'like_count', 'comment_count', 'actual_likes', 'actual_comments')[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1]['pk']
+            checked += len(batch)
+
+            drifted = [
+                row['pk'] for row in batch
+                if row['like_count'] != row['actual_likes'] or row['comment_count'] != row['actual_comments']
+            ]
+            if drifted and not dry_run:
+                # Recount inside the UPDATE itself so likes/comments written since
+                # the check above are not overwritten with stale numbers
+                ArtPost.objects.filter(pk__in=drifted).update(
+                    like_count=count_of(ArtLike),
+                    comment_count=count_of(ArtComment),
+                )
+            fixed += len(drifted)
+
+        # Categories are few; check them all in one query
+        category_counts = (
+            ArtPostCategory.objects.filter(category=OuterRef('pk'))
+            .order_by()
+            .values('category')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        actual_posts = Coalesce(Subquery(category_counts), Value(0))
+        drifted_categories = [
+            row['pk'] for row in Category.objects.annotate(actual=actual_posts).values('pk', 'post_count', 'actual')
+            if row['post_count'] != row['actual']
+        ]
+        if drifted_categories and not dry_run:
+            Category.objects.filter(pk__in=drifted_categories).update(post_count=actual_posts)
+
+        verb = 'Found' if dry_run else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} posts. {verb} {fixed} drifted counters '
+            f'and {len(drifted_categories)} drifted category counts.'
+        ))
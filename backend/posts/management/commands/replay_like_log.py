@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from posts.likes import replay_logs
+
+
+class Command(BaseCommand):
+    help = ('Apply like toggles left in LIKE_BUFFER_LOG_DIR by workers of this host that stopped '
+            'before flushing. Logs of workers that are still running are skipped.')
+
+    def handle(self, *args, **options):
+        replayed = replay_logs(settings.LIKE_BUFFER_LOG_DIR)
+        self.stdout.write(self.style.SUCCESS(f'Replayed {replayed} like logs.'))
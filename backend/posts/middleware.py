@@ -0,0 +1,30 @@
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async # type: ignore
+from channels.middleware import BaseMiddleware # type: ignore
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+
+
+@database_sync_to_async
+def get_user(raw_token):
+    from rest_framework_simplejwt.exceptions import TokenError
+    from rest_framework_simplejwt.tokens import AccessToken
+    try:
+        token = AccessToken(raw_token)
+        return get_user_model().objects.get(id=token['user_id'])
+    except (TokenError, KeyError, get_user_model().DoesNotExist):
+        return AnonymousUser()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Sets scope['user'] from a SimpleJWT access token in ?token=, the way
+    browsers have to pass it to a websocket. Missing or invalid tokens leave
+    an AnonymousUser.
+    """
+
+    async def __call__(self, scope, receive, send):
+        query = parse_qs(scope.get('query_string', b'').decode())
+        raw_token = query.get('token', [None])[0]
+        scope = dict(scope, user=await get_user(raw_token) if raw_token else AnonymousUser())
+        return await super().__call__(scope, receive, send)
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:56
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    ArtPost = apps.get_model('posts', 'ArtPost')
+    ArtLike = apps.get_model('posts', 'ArtLike')
+    ArtComment = apps.get_model('posts', 'ArtComment')
+
+    def count_of(model):
+        counts = (
+            model.objects.filter(art_post=OuterRef('pk'))
+            .order_by()
+            .values('art_post')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        return Coalesce(Subquery(counts), Value(0))
+
+    ArtPost.objects.update(like_count=count_of(ArtLike), comment_count=count_of(ArtComment))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artpost',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='artpost',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
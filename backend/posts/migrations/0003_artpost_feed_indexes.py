@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0002_artpost_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='artpost',
+            index=models.Index(fields=['-posted_at', '-id'], name='artpost_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='artpost',
+            index=models.Index(fields=['user', '-posted_at', '-id'], name='artpost_user_feed_idx'),
+        ),
+    ]
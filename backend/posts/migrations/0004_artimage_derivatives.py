@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0003_artpost_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artimage',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='artimage',
+            name='derivatives_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=10),
+        ),
+    ]
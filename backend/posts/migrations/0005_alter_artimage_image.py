@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:02
+
+import blobs.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_artimage_derivatives'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='artimage',
+            name='image',
+            field=models.ImageField(storage=blobs.storage.get_content_addressed_storage, upload_to='art_images/'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_alter_artimage_image'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='artcomment',
+            index=models.Index(fields=['art_post', '-created_at', '-id'], name='artcomment_post_page_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_post_counts(apps, schema_editor):
+    Category = apps.get_model('posts', 'Category')
+    for category in Category.objects.annotate(n=Count('artpost')).iterator():
+        Category.objects.filter(pk=category.pk).update(post_count=category.n)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_artcomment_page_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        # The link table already exists as the implicit M2M table (same name,
+        # columns and unique constraint); only the migration state changes.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ArtPostCategory',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('artpost', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='posts.artpost')),
+                        ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='posts.category')),
+                    ],
+                    options={
+                        'db_table': 'posts_artpost_categories',
+                        'unique_together': {('artpost', 'category')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='artpost',
+                    name='categories',
+                    field=models.ManyToManyField(through='posts.ArtPostCategory', to='posts.category'),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='artpostcategory',
+            index=models.Index(fields=['category', 'artpost'], name='artpost_category_idx'),
+        ),
+        migrations.RunPython(backfill_post_counts, migrations.RunPython.noop),
+    ]
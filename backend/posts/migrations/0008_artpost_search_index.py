@@ -0,0 +1,58 @@
+from django.db import migrations
+
+# The DDL is spelled out here rather than imported from posts.search, so later
+# changes to the app code cannot change what this migration does.
+FTS = 'posts_artpost_fts'
+
+INSTALL = {
+    'sqlite': [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS} USING fts5("
+        f"description, content='posts_artpost', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS}_ai AFTER INSERT ON posts_artpost BEGIN "
+        f"INSERT INTO {FTS}(rowid, description) VALUES (new.id, new.description); END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS}_ad AFTER DELETE ON posts_artpost BEGIN "
+        f"INSERT INTO {FTS}({FTS}, rowid, description) VALUES ('delete', old.id, old.description); END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS}_au AFTER UPDATE OF description ON posts_artpost BEGIN "
+        f"INSERT INTO {FTS}({FTS}, rowid, description) VALUES ('delete', old.id, old.description); "
+        f"INSERT INTO {FTS}(rowid, description) VALUES (new.id, new.description); END",
+        f"INSERT INTO {FTS}({FTS}) VALUES ('rebuild')",
+    ],
+    'postgresql': [
+        "ALTER TABLE posts_artpost ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('simple', coalesce(description, ''))) STORED",
+        "CREATE INDEX IF NOT EXISTS artpost_search_vector_idx ON posts_artpost USING GIN (search_vector)",
+    ],
+}
+
+UNINSTALL = {
+    'sqlite': [
+        f"DROP TRIGGER IF EXISTS {FTS}_ai",
+        f"DROP TRIGGER IF EXISTS {FTS}_ad",
+        f"DROP TRIGGER IF EXISTS {FTS}_au",
+        f"DROP TABLE IF EXISTS {FTS}",
+    ],
+    'postgresql': [
+        "DROP INDEX IF EXISTS artpost_search_vector_idx",
+        "ALTER TABLE posts_artpost DROP COLUMN IF EXISTS search_vector",
+    ],
+}
+
+
+def run_statements(statements):
+    def run(apps, schema_editor):
+        # Other databases search with the icontains fallback and need nothing
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_category_facets'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_statements(INSTALL), run_statements(UNINSTALL)),
+    ]
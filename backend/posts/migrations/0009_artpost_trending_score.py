@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:14
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def seed_trending_scores(apps, schema_editor):
+    # Treat existing engagement as if it happened when the post was published
+    ArtPost = apps.get_model('posts', 'ArtPost')
+    weights = settings.TRENDING_WEIGHTS
+    now = timezone.now()
+    batch = []
+    for post in ArtPost.objects.filter(models.Q(like_count__gt=0) | models.Q(comment_count__gt=0)).iterator():
+        age_hours = (now - post.posted_at).total_seconds() / 3600
+        decay = 0.5 ** (age_hours / settings.TRENDING_HALF_LIFE_HOURS)
+        score = (post.like_count * weights['like_count'] + post.comment_count * weights['comment_count']) * decay
+        if score >= settings.TRENDING_MIN_SCORE:
+            post.trending_score = score
+            batch.append(post)
+    ArtPost.objects.bulk_update(batch, ['trending_score'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_artpost_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artpost',
+            name='trending_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='artpost',
+            index=models.Index(fields=['-trending_score', '-id'], name='artpost_trending_idx'),
+        ),
+        migrations.RunPython(seed_trending_scores, migrations.RunPython.noop),
+    ]
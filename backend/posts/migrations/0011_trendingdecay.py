@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_chatmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingDecay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('decayed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -1,10 +1,16 @@
 from django.db import models
+from django.conf import settings
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.contrib.auth import get_user_model
+from blobs.storage import get_content_addressed_storage
 
 User = get_user_model()
 
 class Category(models.Model):
     name = models.CharField(max_length=40)
+    # Facet count, maintained incrementally by posts.signals
+    post_count = models.PositiveIntegerField(default=0) # type: ignore
 
     def __str__(self):
         return self.name
@@ -13,16 +19,95 @@ class Category(models.Model):
 class ArtPost(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='art_posts')
     description = models.TextField()
-    categories = models.ManyToManyField(Category)
+    categories = models.ManyToManyField(Category, through='ArtPostCategory')
     posted_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized counters, kept in step with ArtLike/ArtComment writes
+    like_count = models.PositiveIntegerField(default=0) # type: ignore
+    comment_count = models.PositiveIntegerField(default=0) # type: ignore
+    # Time-decayed engagement: bumped with the counters, decayed by decay_trending_scores
+    trending_score = models.FloatField(default=0) # type: ignore
+
+    class Meta:
+        indexes = [
+            # Back the (posted_at, id) keyset used by FeedCursorPagination
+            models.Index(fields=['-posted_at', '-id'], name='artpost_feed_idx'),
+            models.Index(fields=['user', '-posted_at', '-id'], name='artpost_user_feed_idx'),
+            # Top-N trending is a range scan of this index
+            models.Index(fields=['-trending_score', '-id'], name='artpost_trending_idx'),
+        ]
 
     def __str__(self):
         return self.description
+
+    @classmethod
+    def bump_counter(cls, art_post_id, field, delta, removed_at=None):
+        """
+        Atomically add `delta` to a stored counter with an F() expression,
+        moving trending_score by the counter's weight in the same UPDATE.
+        Call it inside the same transaction as the like/comment write.
+
+        For removals pass `removed_at`, the created_at of every removed
+        like/comment: the score then loses only what those still contribute
+        after decay, not their full weight.
+        """
+        if removed_at is None:
+            score_delta = settings.TRENDING_WEIGHTS.get(field, 0) * delta
+        else:
+            decayed_at = TrendingDecay.last()
+            score_delta = -sum(cls.trending_contribution(field, created_at, decayed_at) for created_at in removed_at)
+        return cls.objects.filter(pk=art_post_id).update(**{
+            field: Greatest(F(field) + delta, 0),
+            'trending_score': Greatest(F('trending_score') + score_delta, 0.0),
+        })
+
+    @staticmethod
+    def trending_contribution(field, created_at, decayed_at):
+        """What one like/comment made at `created_at` still adds to trending_score."""
+        weight = settings.TRENDING_WEIGHTS.get(field, 0)
+        if decayed_at is None or created_at >= decayed_at:
+            # Not decayed yet
+            return weight
+        hours = (decayed_at - created_at).total_seconds() / 3600
+        return weight * 0.5 ** (hours / settings.TRENDING_HALF_LIFE_HOURS)
+
+
+class TrendingDecay(models.Model):
+    """When decay_trending_scores last ran; stored scores are decayed up to then. A single row."""
+    decayed_at = models.DateTimeField()
+
+    @classmethod
+    def last(cls):
+        return cls.objects.values_list('decayed_at', flat=True).first()
+
+class ArtPostCategory(models.Model):
+    """The ArtPost.categories link table, made explicit to index it for filtering."""
+    artpost = models.ForeignKey(ArtPost, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+
+    class Meta:
+        db_table = 'posts_artpost_categories'
+        unique_together = ['artpost', 'category']
+        indexes = [
+            # ?category= looks posts up by category first
+            models.Index(fields=['category', 'artpost'], name='artpost_category_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.artpost_id} in {self.category}"
+
     
 class ArtImage(models.Model):
+    DERIVATIVES_STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    )
     art = models.ForeignKey(ArtPost, on_delete=models.CASCADE, related_name='images')
-    image = models.ImageField(upload_to='art_images/')
+    image = models.ImageField(upload_to='art_images/', storage=get_content_addressed_storage)
+    # Resized copies written by posts.images: [{"width", "format", "name"}, ...]
+    derivatives = models.JSONField(default=list, blank=True)
+    derivatives_status = models.CharField(max_length=10, choices=DERIVATIVES_STATUS_CHOICES, default='pending')
 
     def __str__(self):
         return f"image for {self.art.user.username}" 
@@ -44,5 +129,52 @@ class ArtComment(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Back the (created_at, id) keyset used by CommentCursorPagination
+            models.Index(fields=['art_post', '-created_at', '-id'], name='artcomment_post_page_idx'),
+        ]
+
     def __str__(self):
-        return f"{self.user.username} on {self.art_post.user}"
\ No newline at end of file
+        return f"{self.user.username} on {self.art_post.user}"
+
+
+class Conversation(models.Model):
+    """
+    A chat between its participants. Its id is the conversation_id in
+    ws/chat/<id>/ and the history endpoint; only participants get in.
+    """
+    participants = models.ManyToManyField(User, related_name='conversations')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Conversation {self.id}"
+
+
+class ChatMessage(models.Model):
+    """
+    Append-only chat history for ChatConsumer. The auto-increment id is the
+    message's sequence number, and ordering by it within a conversation is
+    send order. Ids are handed out before commit, so on PostgreSQL two
+    concurrent inserts could commit out of id order; ChatConsumer therefore
+    saves under a lock on the Conversation row. Rows written around that lock
+    have no such guarantee. Numbers are not dense per conversation.
+    """
+    conversation_id = models.CharField(max_length=100)
+    sender_username = models.CharField(max_length=150)
+    content = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # History pages and reconnect backfill are range scans on (conversation, seq)
+            models.Index(fields=['conversation_id', 'id'], name='chatmessage_seq_idx'),
+        ]
+
+    @property
+    def seq(self):
+        return self.id
+
+    def __str__(self):
+        return f"{self.sender_username} in {self.conversation_id}"
+
@@ -0,0 +1,133 @@
+import base64
+from collections import OrderedDict
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Keyset pagination over (timestamp_field, id), newest first.
+
+    Every page is one indexed range query: no COUNT(*) and no OFFSET, so deep
+    pages cost the same as the first one, and rows created while a client is
+    scrolling do not shift the pages it has not fetched yet.
+    """
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    timestamp_field = None
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        field = self.timestamp_field
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            timestamp, pk = position
+            queryset = queryset.filter(
+                Q(**{f'{field}__lt': timestamp}) | Q(**{field: timestamp, 'id__lt': pk})
+            )
+
+        # Fetch one extra row to know whether there is a next page
+        results = list(queryset.order_by(f'-{field}', '-id')[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        cursor = self.encode_cursor(getattr(last, self.timestamp_field), last.id)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def encode_cursor(self, timestamp, pk):
+        raw = f'{timestamp.isoformat()}|{pk}'
+        return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            value, pk = raw.rsplit('|', 1)
+            timestamp = parse_datetime(value)
+            if timestamp is None:
+                raise ValueError(value)
+            return timestamp, int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class FeedCursorPagination(KeysetCursorPagination):
+    """Art feed pages keyed on (posted_at, id)."""
+    timestamp_field = 'posted_at'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.legacy_paginator = None
+        if request.query_params.get('page') and self.cursor_query_param not in request.query_params:
+            # Older clients still ask for ?page=N; keep serving them page numbers
+            self.legacy_paginator = PageNumberPagination()
+            return self.legacy_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.legacy_paginator is not None:
+            return self.legacy_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class CommentCursorPagination(KeysetCursorPagination):
+    """Comments of one post keyed on (created_at, id)."""
+    timestamp_field = 'created_at'
+    page_size = 20
+
+
+class SeqPagination(BasePagination):
+    """
+    Chat history pages, newest first: ?before=<seq> returns the messages just
+    older than `seq`. Like the keyset paginators above, every page is one
+    indexed range query.
+    """
+    before_query_param = 'before'
+    page_size = 50
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        before = request.query_params.get(self.before_query_param)
+        if before:
+            try:
+                queryset = queryset.filter(id__lt=int(before))
+            except ValueError:
+                raise NotFound('Invalid cursor')
+
+        results = list(queryset.order_by('-id')[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.before_query_param, self.page[-1].id)
+
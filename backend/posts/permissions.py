@@ -1,4 +1,5 @@
 from rest_framework import permissions
+from .models import Conversation
 
 class CanDelete(permissions.BasePermission):
     """
@@ -11,4 +12,22 @@ class CanDelete(permissions.BasePermission):
             return True
 
         # Write permissions are only allowed to the owner of the object.
-        return obj.user == request.user
\ No newline at end of file
+        return obj.user == request.user
+
+
+def is_conversation_participant(user, conversation_id):
+    """
+    Whether `user` is a participant of the Conversation with this id. Unknown
+    ids and anonymous users are refused.
+    """
+    if user is None or not user.is_authenticated or not str(conversation_id).isdigit():
+        return False
+    return Conversation.objects.filter(id=conversation_id, participants=user).exists()
+
+
+class IsConversationParticipant(permissions.BasePermission):
+    """Only members of the conversation in the URL may read its history."""
+    message = 'You are not a participant in this conversation.'
+
+    def has_permission(self, request, view):
+        return is_conversation_participant(request.user, view.kwargs['conversation_id'])
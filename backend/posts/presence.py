@@ -0,0 +1,111 @@
+"""
+Online and typing presence for ChatConsumer.
+
+Each live connection holds an entry per conversation ("online", and "typing"
+while the user types) that expires after a TTL unless refreshed, so crashed
+clients and lost disconnects clean themselves up. Entries are per connection
+but flips are reported per user: a user is online while any of their
+connections is, which keeps a second tab from toggling them off and on.
+
+Set PRESENCE_REDIS_URL to share presence between workers. LocalPresenceStore
+is used otherwise; it only sees the connections of its own process.
+"""
+import functools
+import threading
+import time
+from django.conf import settings
+
+PRESENCE_KEY = 'presence:{conversation_id}:{kind}'
+# Separates username and connection inside one Redis member
+SEPARATOR = '\x1f'
+
+
+class LocalPresenceStore:
+    """Presence entries in a dict behind a lock; what RedisPresenceStore keeps in sorted sets."""
+
+    def __init__(self):
+        # (conversation_id, kind) -> {(username, connection): expires_at}
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def alive(self, key, now):
+        entries = self.entries.get(key, {})
+        for member in [member for member, expires_at in entries.items() if expires_at <= now]:
+            del entries[member]
+        return entries
+
+    def touch(self, conversation_id, kind, username, connection, ttl):
+        """Add or refresh one entry; True if the user was not present before."""
+        now = time.monotonic()
+        key = (conversation_id, kind)
+        with self.lock:
+            entries = self.alive(key, now)
+            was_present = any(name == username for name, _ in entries)
+            self.entries.setdefault(key, entries)[(username, connection)] = now + ttl
+        return not was_present
+
+    def remove(self, conversation_id, kind, username, connection):
+        """
+        Drop one entry; True if the user has no live entry left. That holds
+        even when this entry had already expired, since nobody announced the
+        expiry.
+        """
+        now = time.monotonic()
+        key = (conversation_id, kind)
+        with self.lock:
+            entries = self.alive(key, now)
+            entries.pop((username, connection), None)
+            still_present = any(name == username for name, _ in entries)
+            if not entries:
+                self.entries.pop(key, None)
+        return not still_present
+
+    def members(self, conversation_id, kind):
+        with self.lock:
+            entries = self.alive((conversation_id, kind), time.monotonic())
+            return sorted({name for name, _ in entries})
+
+
+class RedisPresenceStore:
+    """Presence kept in one sorted set per conversation and kind, scored by expiry."""
+
+    def __init__(self, url):
+        import redis
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+
+    def key(self, conversation_id, kind):
+        return PRESENCE_KEY.format(conversation_id=conversation_id, kind=kind)
+
+    def alive_members(self, key, now):
+        pipe = self.redis.pipeline()
+        pipe.zremrangebyscore(key, '-inf', now)
+        pipe.zrange(key, 0, -1)
+        _, members = pipe.execute()
+        return [member.split(SEPARATOR, 1) for member in members]
+
+    def touch(self, conversation_id, kind, username, connection, ttl):
+        now = time.time()
+        key = self.key(conversation_id, kind)
+        was_present = any(name == username for name, _ in self.alive_members(key, now))
+        pipe = self.redis.pipeline()
+        pipe.zadd(key, {f'{username}{SEPARATOR}{connection}': now + ttl})
+        # The whole set goes away once its last member could have expired
+        pipe.expire(key, int(ttl) + 1)
+        pipe.execute()
+        return not was_present
+
+    def remove(self, conversation_id, kind, username, connection):
+        key = self.key(conversation_id, kind)
+        self.redis.zrem(key, f'{username}{SEPARATOR}{connection}')
+        return not any(name == username for name, _ in self.alive_members(key, time.time()))
+
+    def members(self, conversation_id, kind):
+        key = self.key(conversation_id, kind)
+        return sorted({name for name, _ in self.alive_members(key, time.time())})
+
+
+@functools.lru_cache(maxsize=None)
+def get_presence_store():
+    if settings.PRESENCE_REDIS_URL:
+        return RedisPresenceStore(settings.PRESENCE_REDIS_URL)
+    return LocalPresenceStore()
@@ -0,0 +1,235 @@
+"""
+Negotiated wire format for the websocket consumers.
+
+A client that lists "msgpack" in Sec-WebSocket-Protocol (e.g.
+`new WebSocket(url, ['msgpack'])`) is switched to MessagePack binary frames in
+both directions; everyone else keeps JSON text frames. Consumers keep working
+with plain dicts through send_json/receive_json, so event handlers are shared
+by both formats. `manage.py benchmark_ws_codecs` compares the two.
+
+Outgoing frames also go through a bounded per-connection OutboundQueue that a
+writer task drains, so a slow reader cannot make frames pile up without
+limit. When the queue is full WS_SLOW_CLIENT_POLICY decides what gives:
+
+- "drop_oldest": drop the oldest coalescible frame (deltas, typing, presence;
+  a later frame supersedes them anyway)
+- "summary": merge queued coalescible frames into one per post/user
+- "close": close the socket with WS_SLOW_CLIENT_CLOSE_CODE
+
+Frames that cannot be dropped (acks, chat messages, errors) make the sender
+wait for the writer to free a slot once there is no coalescible frame left to
+give up, so a long resume backfill is delivered in full; a client that takes
+no frame for WS_SLOW_CLIENT_SEND_TIMEOUT seconds is closed.
+"""
+import asyncio
+import logging
+import threading
+from collections import deque
+import msgpack
+from channels.generic.websocket import AsyncJsonWebsocketConsumer # type: ignore
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MSGPACK = 'msgpack'
+JSON = 'json'
+
+
+def pack(content):
+    return msgpack.packb(content, use_bin_type=True)
+
+
+def unpack(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+class OutboundStats:
+    """Process-wide slow-consumer counters, served with the websocket metrics."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.dropped_frames = 0
+        self.summarized_frames = 0
+        self.closed_connections = 0
+
+    def add(self, dropped=0, summarized=0, closed=0):
+        with self.lock:
+            self.dropped_frames += dropped
+            self.summarized_frames += summarized
+            self.closed_connections += closed
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'dropped_frames': self.dropped_frames,
+                'summarized_frames': self.summarized_frames,
+                'closed_connections': self.closed_connections,
+            }
+
+
+outbound_stats = OutboundStats()
+
+
+def coalesce_key(frame):
+    """Key under which a newer frame supersedes an older one, or None."""
+    kind = frame.get('type')
+    if kind == 'delta':
+        return ('delta', frame['art_post_id'])
+    if kind in ('typing', 'presence'):
+        return (kind, frame['username'])
+    return None
+
+
+def merge_frames(older, newer):
+    if newer['type'] != 'delta':
+        # Typing/presence: only the latest state matters
+        return newer
+    return {
+        **newer,
+        'likes': older['likes'] + newer['likes'],
+        'like_count': newer['like_count'] if newer['like_count'] is not None else older['like_count'],
+        'comments': older['comments'] + newer['comments'],
+        'recent_comments': (older['recent_comments'] + newer['recent_comments'])[
+            -settings.ARTPOST_WS_COALESCE_MAX_COMMENTS:
+        ],
+    }
+
+
+class OutboundQueue:
+    """Bounded queue of (frame, close) pairs for one connection."""
+
+    def __init__(self, max_size, policy):
+        self.max_size = max_size
+        self.policy = policy
+        self.items = deque()
+        self.dropped = 0
+        self.summarized = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def popleft(self):
+        return self.items.popleft()
+
+    def push(self, frame, close=False):
+        """Queue a frame; False means it did not fit and was not dropped."""
+        if len(self.items) < self.max_size:
+            self.items.append((frame, close))
+            return True
+        if self.policy == 'summary':
+            self.summarize()
+        elif self.policy == 'drop_oldest':
+            self.drop_oldest_coalescible()
+        if len(self.items) < self.max_size:
+            self.items.append((frame, close))
+            return True
+        if self.policy != 'close' and not close and coalesce_key(frame) is not None:
+            # Nothing left to drop but the new frame itself
+            self.dropped += 1
+            return True
+        return False
+
+    def drop_oldest_coalescible(self):
+        for index, (frame, close) in enumerate(self.items):
+            if not close and coalesce_key(frame) is not None:
+                del self.items[index]
+                self.dropped += 1
+                return
+
+    def summarize(self):
+        merged = {}
+        order = []
+        for frame, close in self.items:
+            key = None if close else coalesce_key(frame)
+            if key is None:
+                order.append((frame, close))
+            elif key in merged:
+                merged[key] = merge_frames(merged[key], frame)
+                self.summarized += 1
+            else:
+                merged[key] = frame
+                # Placeholder keeps the merged frame where its first part was
+                order.append((key, None))
+        self.items = deque(
+            (merged[item], False) if close is None else (item, close)
+            for item, close in order
+        )
+
+
+class NegotiatedWebsocketConsumer(AsyncJsonWebsocketConsumer):
+    # Preference order when a client offers several
+    supported_subprotocols = (MSGPACK, JSON)
+    binary = False
+    outbound = None
+
+    async def accept(self, subprotocol=None, headers=None):
+        if subprotocol is None:
+            offered = self.scope.get('subprotocols') or []
+            subprotocol = next((p for p in self.supported_subprotocols if p in offered), None)
+        self.binary = subprotocol == MSGPACK
+        self.outbound = OutboundQueue(settings.WS_OUTBOUND_QUEUE_SIZE, settings.WS_SLOW_CLIENT_POLICY)
+        self.outbound_ready = asyncio.Event()
+        self.outbound_space = asyncio.Event()
+        self.closing = False
+        await super().accept(subprotocol=subprotocol, headers=headers)
+        self.writer = asyncio.ensure_future(self.drain_outbound())
+
+    async def drain_outbound(self):
+        while True:
+            await self.outbound_ready.wait()
+            while self.outbound:
+                frame, close = self.outbound.popleft()
+                self.outbound_space.set()
+                await self.send_frame(frame, close)
+            self.outbound_ready.clear()
+
+    async def send_frame(self, content, close=False):
+        if self.binary:
+            await self.send(bytes_data=pack(content), close=close)
+        else:
+            await super().send_json(content, close=close)
+
+    async def close_slow_client(self):
+        outbound_stats.add(closed=1)
+        logger.warning(f"Closing slow websocket client {self.channel_name} after {self.outbound.dropped} dropped frames")
+        await self.close(code=settings.WS_SLOW_CLIENT_CLOSE_CODE)
+
+    async def websocket_disconnect(self, message):
+        if self.outbound is not None:
+            self.writer.cancel()
+            outbound_stats.add(dropped=self.outbound.dropped, summarized=self.outbound.summarized)
+        await super().websocket_disconnect(message)
+
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        if bytes_data is not None and self.binary:
+            try:
+                content = unpack(bytes_data)
+            except (ValueError, msgpack.UnpackException):
+                await self.send_json({'type': 'error', 'detail': 'Malformed MessagePack frame'})
+                return
+            await self.receive_json(content, **kwargs)
+        else:
+            await super().receive(text_data=text_data, bytes_data=bytes_data, **kwargs)
+
+    async def send_json(self, content, close=False):
+        if self.outbound is None:
+            # Not accepted yet, nothing to queue behind
+            await self.send_frame(content, close)
+            return
+        while not self.closing:
+            if self.outbound.push(content, close):
+                self.outbound_ready.set()
+                return
+            if (close or coalesce_key(content) is None) and await self.wait_for_space():
+                continue
+            self.closing = True
+            await self.close_slow_client()
+
+    async def wait_for_space(self):
+        """Hold a frame that cannot be dropped until the writer frees a slot."""
+        self.outbound_space.clear()
+        try:
+            await asyncio.wait_for(self.outbound_space.wait(), settings.WS_SLOW_CLIENT_SEND_TIMEOUT)
+        except asyncio.TimeoutError:
+            return False
+        return True
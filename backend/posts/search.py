@@ -0,0 +1,150 @@
+"""
+Ranked full-text search over ArtPost.description.
+
+Each database keeps its own index and keeps it in sync by itself, so every
+write path (ORM saves, queryset updates, bulk deletes, cascades) is covered:
+
+- SQLite: an external-content FTS5 table over posts_artpost maintained by
+  AFTER INSERT/UPDATE/DELETE triggers, ranked with bm25.
+- PostgreSQL: a stored generated tsvector column with a GIN index, ranked
+  with ts_rank.
+
+Both are created by migration posts.0008 and re-checked after every migrate,
+because SQLite drops a table's triggers when Django rebuilds it. Other
+databases fall back to an unranked icontains scan, newest first.
+"""
+import functools
+import operator
+import re
+from django.db import connection as default_connection
+from django.db.models import Q
+
+# Words only: user input never reaches the FTS query syntax
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def query_tokens(query):
+    return TOKEN_RE.findall(query.lower())[:16]
+
+
+class SQLiteSearchBackend:
+    table = 'posts_artpost_fts'
+
+    def install(self, connection, rebuild=True):
+        t = self.table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {t} USING fts5("
+                f"description, content='posts_artpost', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2')"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {t}_ai AFTER INSERT ON posts_artpost BEGIN "
+                f"INSERT INTO {t}(rowid, description) VALUES (new.id, new.description); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {t}_ad AFTER DELETE ON posts_artpost BEGIN "
+                f"INSERT INTO {t}({t}, rowid, description) VALUES ('delete', old.id, old.description); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {t}_au AFTER UPDATE OF description ON posts_artpost BEGIN "
+                f"INSERT INTO {t}({t}, rowid, description) VALUES ('delete', old.id, old.description); "
+                f"INSERT INTO {t}(rowid, description) VALUES (new.id, new.description); END"
+            )
+            if rebuild:
+                cursor.execute(f"INSERT INTO {t}({t}) VALUES ('rebuild')")
+
+    def repair(self, connection):
+        # Table rebuilds keep the rows but lose the triggers
+        if self.table in connection.introspection.table_names():
+            self.install(connection, rebuild=False)
+
+    def uninstall(self, connection):
+        with connection.cursor() as cursor:
+            for suffix in ('ai', 'ad', 'au'):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {self.table}_{suffix}")
+            cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def search(self, connection, tokens, limit, offset):
+        # Every word must match; the last one also matches as a prefix
+        match = ' '.join(f'"{token}"' for token in tokens) + '*'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s "
+                f"ORDER BY rank, rowid DESC LIMIT %s OFFSET %s",
+                [match, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend:
+    column = 'search_vector'
+    index = 'artpost_search_vector_idx'
+
+    def install(self, connection, rebuild=True):
+        # A generated column is recomputed by PostgreSQL on every write
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"ALTER TABLE posts_artpost ADD COLUMN IF NOT EXISTS {self.column} tsvector "
+                f"GENERATED ALWAYS AS (to_tsvector('simple', coalesce(description, ''))) STORED"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.index} ON posts_artpost USING GIN ({self.column})"
+            )
+
+    def repair(self, connection):
+        pass
+
+    def uninstall(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP INDEX IF EXISTS {self.index}")
+            cursor.execute(f"ALTER TABLE posts_artpost DROP COLUMN IF EXISTS {self.column}")
+
+    def search(self, connection, tokens, limit, offset):
+        tsquery = ' & '.join(tokens) + ':*'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT id FROM posts_artpost, to_tsquery('simple', %s) query "
+                f"WHERE {self.column} @@ query "
+                f"ORDER BY ts_rank({self.column}, query) DESC, id DESC LIMIT %s OFFSET %s",
+                [tsquery, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class IContainsSearchBackend:
+    """Fallback for databases without an index here: every word as a substring."""
+
+    def install(self, connection, rebuild=True):
+        pass
+
+    def repair(self, connection):
+        pass
+
+    def uninstall(self, connection):
+        pass
+
+    def search(self, connection, tokens, limit, offset):
+        from .models import ArtPost
+        matches = functools.reduce(operator.and_, (Q(description__icontains=token) for token in tokens))
+        post_ids = ArtPost.objects.using(connection.alias).filter(matches).order_by('-id')
+        return list(post_ids.values_list('id', flat=True)[offset:offset + limit])
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend(connection=None):
+    connection = connection or default_connection
+    return BACKENDS.get(connection.vendor, IContainsSearchBackend)()
+
+
+def search_post_ids(query, limit, offset=0):
+    """Ids of posts matching every word of `query`, best match first."""
+    tokens = query_tokens(query)
+    if not tokens:
+        return []
+    return get_search_backend().search(default_connection, tokens, limit, offset)
@@ -1,6 +1,8 @@
 from rest_framework import serializers 
-from .models import ArtPost, ArtImage, ArtComment, ArtLike, Category
-from accounts.models import MyProfile
+from django.core.files.storage import default_storage
+from .models import ArtPost, ArtImage, ArtComment, ArtLike, Category, ChatMessage
+from .images import schedule_derivatives
+from uploads.models import UploadSession
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -8,10 +10,27 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'name']
 
 
+class CategoryFacetSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'post_count']
+
+
 class ArtImageSerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = ArtImage
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'srcset']
+
+    def get_srcset(self, obj):
+        # Serve the original upload until the resized derivatives are ready
+        if obj.derivatives_status != 'ready' or not obj.derivatives:
+            return [{'url': obj.image.url, 'width': None, 'format': None}] if obj.image else []
+        return [
+            {'url': default_storage.url(d['name']), 'width': d['width'], 'format': d['format']}
+            for d in obj.derivatives
+        ]
 
 class CommentSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
@@ -33,12 +52,10 @@ class UserInfoSerializer(serializers.Serializer):
     avatar = serializers.SerializerMethodField()
     
     def get_avatar(self, obj):
-        try:
-            profile = MyProfile.objects.get(user=obj)
-            if profile.avatar:
-                return profile.avatar.url
-        except MyProfile.DoesNotExist:
-            pass
+        # Uses the profile loaded by select_related('user__myprofile') when available
+        profile = getattr(obj, 'myprofile', None)
+        if profile and profile.avatar:
+            return profile.avatar.url
         return None
 
 class ArtSerializer(serializers.ModelSerializer):
@@ -46,41 +63,74 @@ class ArtSerializer(serializers.ModelSerializer):
     uploaded_images = serializers.ListField(
         child=serializers.ImageField(),
         write_only=True,
-        required=True  # الآن الصور مطلوبة
+        required=False  # الصور مطلوبة: هنا أو عبر upload_ids
+    )
+    # Finalized resumable upload sessions (uploads app) used in place of uploaded_images
+    upload_ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        write_only=True,
+        required=False
     )
     comments = CommentSerializer(many=True, read_only=True)
     likes = LikeSerializer(many=True, read_only=True)
-    like_count = serializers.SerializerMethodField()
-    comment_count = serializers.SerializerMethodField()
     user = UserInfoSerializer(read_only=True)
     categories = CategorySerializer(many=True, read_only=True)
     
-    def get_like_count(self, obj):
-        return obj.likes.count()
-    
-    def get_comment_count(self, obj):
-        return obj.comments.count()
-    
     class Meta:
         model = ArtPost
         fields = [
             'id', 'user', 'description',
             'categories', 'posted_at', 'updated_at', 'images',
             'comments', 'likes',
-            'like_count', 'comment_count', 'uploaded_images'
+            'like_count', 'comment_count', 'uploaded_images', 'upload_ids'
         ]
         read_only_fields = ['user', 'posted_at', 'updated_at', 'like_count', 'comment_count']
 
+    def validate_upload_ids(self, value):
+        sessions = UploadSession.claim(self.context['request'].user, value)
+        image_field = serializers.ImageField()
+        for session in sessions:
+            with session.as_uploaded_file() as upload:
+                image_field.run_validation(upload)
+        return sessions
+
     def create(self, validated_data):
         uploaded_images = validated_data.pop('uploaded_images', [])
-        if not uploaded_images:
+        sessions = validated_data.pop('upload_ids', [])
+        if not uploaded_images and not sessions:
             raise serializers.ValidationError({'uploaded_images': 'This field is required and must not be empty.'})
         art_post = ArtPost.objects.create(**validated_data)
-        for image in uploaded_images:
-            ArtImage.objects.create(art=art_post, image=image)
+        image_ids = [ArtImage.objects.create(art=art_post, image=image).id for image in uploaded_images]
+        for session in sessions:
+            with session.as_uploaded_file() as upload:
+                image_ids.append(ArtImage.objects.create(art=art_post, image=upload).id)
+            session.discard()
+        schedule_derivatives(image_ids)
         return art_post
 
 
+class ArtFeedSerializer(serializers.ModelSerializer):
+    """
+    Lean representation used by the feed: stored counts and a short preview of
+    recent comments instead of the full like/comment lists. Expects the
+    queryset built by ArtViewSet (prefetched relations, is_liked annotation).
+    """
+    images = ArtImageSerializer(many=True, read_only=True)
+    user = UserInfoSerializer(read_only=True)
+    categories = CategorySerializer(many=True, read_only=True)
+    recent_comments = CommentSerializer(many=True, read_only=True)
+    is_liked = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = ArtPost
+        fields = [
+            'id', 'user', 'description',
+            'categories', 'posted_at', 'updated_at', 'images',
+            'recent_comments', 'like_count', 'comment_count', 'is_liked'
+        ]
+        read_only_fields = fields
+
+
 class CreateCommentSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
     
@@ -94,4 +144,14 @@ class CreateLikeSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = ArtLike
-        fields = ['user', 'art_post', 'created_at']
\ No newline at end of file
+        fields = ['user', 'art_post', 'created_at']
+
+
+class ChatMessageSerializer(serializers.ModelSerializer):
+    seq = serializers.IntegerField(source='id', read_only=True)
+
+    class Meta:
+        model = ChatMessage
+        fields = ['seq', 'conversation_id', 'sender_username', 'content', 'created_at']
+        read_only_fields = fields
+
@@ -0,0 +1,84 @@
+import logging
+from django.db import connections, transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_migrate, post_save, post_delete
+from django.dispatch import receiver
+from accounts.models import Follower
+from .images import delete_derivative_files
+from .models import ArtImage, ArtPost, ArtPostCategory, Category
+from . import search, timeline
+
+logger = logging.getLogger(__name__)
+
+
+def run_timeline_update(func, *args):
+    # A timeline store outage must not fail the write that triggered it;
+    # affected timelines can be fixed with `manage.py rebuild_timelines`
+    def update():
+        try:
+            func(*args)
+        except Exception as e:
+            logger.error(f"Timeline update {func.__name__}{args} failed: {e}")
+    transaction.on_commit(update)
+
+
+@receiver(post_save, sender=ArtPost)
+def fan_out_new_post(sender, instance, created, **kwargs):
+    if created:
+        run_timeline_update(timeline.fan_out_post, instance)
+
+
+@receiver(post_delete, sender=ArtPost)
+def discard_deleted_post(sender, instance, **kwargs):
+    run_timeline_update(timeline.discard_post, instance.id, instance.user_id)
+
+
+@receiver(post_delete, sender=ArtImage)
+def delete_image_derivatives(sender, instance, **kwargs):
+    # Derivatives are plain storage files, not blobs, so they go with the image
+    if instance.derivatives:
+        transaction.on_commit(lambda: delete_derivative_files(instance.derivatives))
+
+
+@receiver(post_save, sender=Follower)
+def add_followed_posts(sender, instance, created, **kwargs):
+    if created:
+        run_timeline_update(timeline.add_followed_posts, instance.user_id, instance.followed_user_id)
+
+
+@receiver(post_delete, sender=Follower)
+def remove_followed_posts(sender, instance, **kwargs):
+    run_timeline_update(timeline.remove_followed_posts, instance.user_id, instance.followed_user_id)
+
+
+# Category.post_count facet counters. Links created through the manager
+# (post.categories.add / set) arrive as one m2m_changed with the new ids only;
+# every removal path (remove, clear, set, cascades from ArtPost or Category
+# deletion) deletes ArtPostCategory rows and so sends post_delete per row.
+@receiver(m2m_changed, sender=ArtPostCategory)
+def count_added_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    if action != 'post_add' or not pk_set:
+        return
+    if reverse:
+        # category.artpost_set.add(*posts)
+        Category.objects.filter(pk=instance.pk).update(post_count=F('post_count') + len(pk_set))
+    else:
+        Category.objects.filter(pk__in=pk_set).update(post_count=F('post_count') + 1)
+
+
+@receiver(post_save, sender=ArtPostCategory)
+def count_created_category_link(sender, instance, created, **kwargs):
+    if created:
+        Category.objects.filter(pk=instance.category_id).update(post_count=F('post_count') + 1)
+
+
+@receiver(post_delete, sender=ArtPostCategory)
+def count_removed_category_link(sender, instance, **kwargs):
+    Category.objects.filter(pk=instance.category_id, post_count__gt=0).update(post_count=F('post_count') - 1)
+
+
+@receiver(post_migrate)
+def repair_search_index(sender, using, **kwargs):
+    if sender.name == 'posts':
+        connection = connections[using]
+        search.get_search_backend(connection).repair(connection)
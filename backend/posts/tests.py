@@ -1,3 +1,1168 @@
+import asyncio
+import os
+import subprocess
+import sys
+import shutil
+import tempfile
+import threading
+import time
+from io import BytesIO, StringIO
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.test import TestCase
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from accounts.models import Follower
+from .models import ArtPost, ArtImage, ArtComment, ArtLike, Category, ChatMessage, Conversation, TrendingDecay
+from .timeline import get_timeline_store
+from .images import generate_derivatives
+from .likes import LikeBuffer, apply_batch, get_like_buffer
+from .serializer import ArtImageSerializer
+from channels.routing import URLRouter
+from .consumers import ArtPostConsumer, ChatConsumer
+from .routing import websocket_urlpatterns
+from .middleware import JWTAuthMiddleware
+from .presence import get_presence_store
+from .protocols import OutboundQueue, pack, unpack
+from .coalescing import get_coalescer, post_group
+from .write_queue import WriteQueue, WriteRejected, get_write_queue, metrics as write_queue_metrics
+from PIL import Image
+
+User = get_user_model()
+
+
+def temp_dir(test):
+    """Create a directory that is removed when the test ends."""
+    path = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, path, ignore_errors=True)
+    return path
+
+
+class ArtFeedQueryCountTest(APITestCase):
+    url = '/api/posts/art/?view=feed'
+
+    def setUp(self):
+        self.viewer = User.objects.create_user(
+            username='viewer',
+            email='viewer@test.com',
+            password='testpass123'
+        )
+        self.category = Category.objects.create(name='Painting')
+
+    def create_posts(self, count):
+        for i in range(count):
+            author = User.objects.create_user(
+                username=f'artist{ArtPost.objects.count()}',
+                email=f'artist{ArtPost.objects.count()}@test.com',
+                password='testpass123'
+            )
+            post = ArtPost.objects.create(user=author, description=f'Post {i}')
+            post.categories.add(self.category)
+            ArtImage.objects.create(art=post, image='art_images/test.jpg')
+            for j in range(5):
+                ArtComment.objects.create(user=self.viewer, art_post=post, content=f'Comment {j}')
+            ArtLike.objects.create(user=self.viewer, art_post=post)
+            ArtPost.objects.filter(pk=post.pk).update(like_count=1, comment_count=5)
+
+    def count_feed_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.data['results']
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self.client.force_authenticate(self.viewer)
+
+        self.create_posts(2)
+        small_page_queries, results = self.count_feed_queries()
+        self.assertEqual(len(results), 2)
+
+        self.create_posts(10)
+        full_page_queries, results = self.count_feed_queries()
+        self.assertEqual(len(results), 12)
+
+        self.assertEqual(small_page_queries, full_page_queries)
+
+    def test_feed_post_representation(self):
+        self.create_posts(1)
+        _, results = self.count_feed_queries()
+        post = results[0]
+
+        self.assertEqual(post['like_count'], 1)
+        self.assertEqual(post['comment_count'], 5)
+        self.assertFalse(post['is_liked'])
+        self.assertEqual(len(post['recent_comments']), 3)
+        self.assertEqual(post['recent_comments'][0]['content'], 'Comment 4')
+        self.assertEqual(post['categories'], [{'id': self.category.id, 'name': 'Painting'}])
+        self.assertNotIn('likes', post)
+
+    def test_is_liked_for_authenticated_viewer(self):
+        self.create_posts(1)
+        self.client.force_authenticate(self.viewer)
+        _, results = self.count_feed_queries()
+        self.assertTrue(results[0]['is_liked'])
+
+    def test_full_list_query_count_does_not_grow_with_page_size(self):
+        self.url = '/api/posts/art/'
+        self.create_posts(2)
+        small_page_queries, _ = self.count_feed_queries()
+        self.create_posts(10)
+        full_page_queries, results = self.count_feed_queries()
+        self.assertEqual(small_page_queries, full_page_queries)
+        self.assertEqual(len(results[0]['likes']), 1)
+
+
+@override_settings(LIKE_BUFFER_FLUSH_INTERVAL=None)
+class ArtCounterTest(APITestCase):
+    def setUp(self):
+        self.enterContext(override_settings(LIKE_BUFFER_LOG_DIR=temp_dir(self)))
+        get_like_buffer.cache_clear()
+        self.user = User.objects.create_user(
+            username='liker',
+            email='liker@test.com',
+            password='testpass123'
+        )
+        self.post = ArtPost.objects.create(user=self.user, description='Counted')
+        self.client.force_authenticate(self.user)
+
+    def test_like_toggle_updates_counter(self):
+        response = self.client.post('/api/posts/like/', {'art_post': self.post.id})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['like_count'], 1)
+
+        response = self.client.post('/api/posts/like/', {'art_post': self.post.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['liked'])
+        get_like_buffer().flush()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+        self.assertFalse(ArtLike.objects.exists())
+
+    def test_comment_create_and_delete_update_counter(self):
+        response = self.client.post('/api/posts/comment/', {'art_post': self.post.id, 'content': 'Nice'})
+        self.assertEqual(response.status_code, 201)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+
+        comment = ArtComment.objects.get(art_post=self.post)
+        self.client.delete(f'/api/posts/comment/{comment.id}/?art_post={self.post.id}')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+
+    def test_recount_command_fixes_drift(self):
+        ArtLike.objects.create(user=self.user, art_post=self.post)
+        ArtComment.objects.create(user=self.user, art_post=self.post, content='Drift')
+        ArtPost.objects.filter(pk=self.post.pk).update(like_count=7)
+
+        call_command('recount_art_counters', batch_size=1, stdout=StringIO())
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertEqual(self.post.comment_count, 1)
+
+
+class FeedCursorPaginationTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='scroller',
+            email='scroller@test.com',
+            password='testpass123'
+        )
+        for i in range(15):
+            ArtPost.objects.create(user=self.user, description=f'Post {i}')
+        # Force ties on posted_at so the id tie-breaker is exercised
+        ArtPost.objects.update(posted_at=timezone.now())
+
+    def test_pages_do_not_overlap_when_new_posts_arrive(self):
+        first = self.client.get('/api/posts/art/?view=feed')
+        self.assertEqual(len(first.data['results']), 12)
+        self.assertIsNotNone(first.data['next'])
+
+        ArtPost.objects.create(user=self.user, description='Arrived late')
+
+        second = self.client.get(first.data['next'])
+        self.assertEqual(len(second.data['results']), 3)
+        self.assertIsNone(second.data['next'])
+
+        ids = [p['id'] for p in first.data['results'] + second.data['results']]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(set(ids), set(ArtPost.objects.exclude(description='Arrived late').values_list('id', flat=True)))
+
+    def test_deep_page_costs_the_same_as_first_page(self):
+        with CaptureQueriesContext(connection) as first_ctx:
+            first = self.client.get('/api/posts/art/?view=feed&user=scroller')
+        with CaptureQueriesContext(connection) as next_ctx:
+            self.client.get(first.data['next'])
+        self.assertEqual(len(first_ctx.captured_queries), len(next_ctx.captured_queries))
+        self.assertFalse(any('COUNT(' in q['sql'] for q in first_ctx.captured_queries))
+
+    def test_invalid_cursor_returns_404(self):
+        response = self.client.get('/api/posts/art/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+
+class CategoryFacetTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tagger', email='tagger@test.com', password='testpass123')
+        self.painting = Category.objects.create(name='Painting')
+        self.sketch = Category.objects.create(name='Sketch')
+        self.photo = Category.objects.create(name='Photo')
+        self.both = ArtPost.objects.create(user=self.user, description='Both')
+        self.both.categories.add(self.painting, self.sketch)
+        self.painted = ArtPost.objects.create(user=self.user, description='Painted')
+        self.painted.categories.add(self.painting)
+        self.photographed = ArtPost.objects.create(user=self.user, description='Photo')
+        self.photographed.categories.add(self.photo)
+
+    def counts(self):
+        return dict(Category.objects.values_list('name', 'post_count'))
+
+    def test_filter_accepts_repeated_and_comma_separated_values(self):
+        repeated = self.client.get(f'/api/posts/art/?view=feed&category={self.painting.id}&category={self.sketch.id}')
+        comma = self.client.get(f'/api/posts/art/?category={self.sketch.id},{self.photo.id}')
+        self.assertEqual([p['id'] for p in repeated.data['results']], [self.painted.id, self.both.id])
+        self.assertEqual([p['id'] for p in comma.data['results']], [self.photographed.id, self.both.id])
+
+    def test_invalid_category_returns_400(self):
+        response = self.client.get('/api/posts/art/?category=painting')
+        self.assertEqual(response.status_code, 400)
+
+    def test_counts_follow_add_remove_clear_and_delete(self):
+        self.assertEqual(self.counts(), {'Painting': 2, 'Sketch': 1, 'Photo': 1})
+
+        self.both.categories.remove(self.sketch)
+        self.painted.categories.add(self.painting)  # already linked, no change
+        self.photo.artpost_set.add(self.painted, self.both)
+        self.assertEqual(self.counts(), {'Painting': 2, 'Sketch': 0, 'Photo': 3})
+
+        self.painted.categories.clear()
+        self.photographed.delete()
+        self.assertEqual(self.counts(), {'Painting': 1, 'Sketch': 0, 'Photo': 1})
+
+    def test_facet_endpoint_reads_stored_counts(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/posts/category/')
+        self.assertEqual(
+            [(c['name'], c['post_count']) for c in response.data],
+            [('Painting', 2), ('Photo', 1), ('Sketch', 1)],
+        )
+
+    def test_recount_fixes_drifted_category_counts(self):
+        Category.objects.update(post_count=7)
+        call_command('recount_art_counters', stdout=StringIO())
+        self.assertEqual(self.counts(), {'Painting': 2, 'Sketch': 1, 'Photo': 1})
+
+
+class ArtSearchTest(APITestCase):
+    url = '/api/posts/art/search/'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='searcher', email='searcher@test.com', password='testpass123')
+        self.sunset = ArtPost.objects.create(user=self.user, description='Sunset over the harbour, oil on canvas')
+        self.harbour = ArtPost.objects.create(user=self.user, description='Harbour harbour harbour at night')
+        self.arabic = ArtPost.objects.create(user=self.user, description='لوحة غروب الشمس')
+
+    def search(self, q):
+        response = self.client.get(self.url, {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return [post['id'] for post in response.data['results']]
+
+    def test_ranked_prefix_search(self):
+        self.assertEqual(self.search('harbour'), [self.harbour.id, self.sunset.id])
+        self.assertEqual(self.search('sunset canv'), [self.sunset.id])
+        self.assertEqual(self.search('غروب'), [self.arabic.id])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.harbour.description = 'Moonlit bay'
+        self.harbour.save()
+        ArtPost.objects.filter(pk=self.arabic.pk).update(description='Harbour sketch')
+        self.sunset.delete()
+
+        self.assertEqual(self.search('harbour'), [self.arabic.id])
+        self.assertEqual(self.search('moonlit'), [self.harbour.id])
+
+    def test_query_syntax_is_not_passed_through(self):
+        self.assertEqual(self.search('(harbour"*'), [self.harbour.id, self.sunset.id])
+        self.assertEqual(self.client.get(self.url, {'q': '"*'}).data['results'], [])
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+
+    def test_other_databases_fall_back_to_icontains(self):
+        with mock.patch.dict('posts.search.BACKENDS', clear=True):
+            self.assertEqual(self.search('harbour'), [self.harbour.id, self.sunset.id])
+            self.assertEqual(self.search('sunset canv'), [self.sunset.id])
+
+
+class TrendingTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='trendy', email='trendy@test.com', password='testpass123')
+        self.quiet = ArtPost.objects.create(user=self.user, description='Quiet')
+        self.liked = ArtPost.objects.create(user=self.user, description='Liked')
+        self.discussed = ArtPost.objects.create(user=self.user, description='Discussed')
+
+    def score(self, post):
+        return ArtPost.objects.values_list('trending_score', flat=True).get(pk=post.pk)
+
+    def test_counter_writes_move_the_score(self):
+        self.client.force_authenticate(self.user)
+        self.client.post('/api/posts/comment/', {'art_post': self.discussed.id, 'content': 'Nice'})
+        ArtPost.bump_counter(self.liked.id, 'like_count', 2)
+        self.assertEqual(self.score(self.discussed), 3.0)
+        self.assertEqual(self.score(self.liked), 2.0)
+
+        ArtPost.bump_counter(self.liked.id, 'like_count', -5)
+        self.assertEqual(self.score(self.liked), 0.0)
+
+    @override_settings(TRENDING_HALF_LIFE_HOURS=1, TRENDING_MIN_SCORE=0.5)
+    def test_decay_halves_per_half_life_and_drops_the_tail(self):
+        ArtPost.objects.filter(pk=self.liked.pk).update(trending_score=4)
+        ArtPost.objects.filter(pk=self.discussed.pk).update(trending_score=0.8)
+        call_command('decay_trending_scores', elapsed_minutes=60, stdout=StringIO())
+        self.assertAlmostEqual(self.score(self.liked), 2.0)
+        self.assertEqual(self.score(self.discussed), 0.0)
+
+    @override_settings(TRENDING_HALF_LIFE_HOURS=1, TRENDING_MIN_SCORE=0.1)
+    def test_decay_uses_the_time_since_the_last_run(self):
+        TrendingDecay.objects.create(decayed_at=timezone.now() - timezone.timedelta(hours=2))
+        ArtPost.objects.filter(pk=self.liked.pk).update(trending_score=4)
+        call_command('decay_trending_scores', stdout=StringIO())
+        self.assertAlmostEqual(self.score(self.liked), 1.0, places=3)
+
+        # Run again straight away: almost nothing has passed, almost no decay
+        call_command('decay_trending_scores', stdout=StringIO())
+        self.assertAlmostEqual(self.score(self.liked), 1.0, places=3)
+        self.assertEqual(TrendingDecay.objects.count(), 1)
+
+    @override_settings(TRENDING_HALF_LIFE_HOURS=1)
+    def test_removing_an_old_like_takes_off_its_decayed_weight(self):
+        decayed_at = timezone.now()
+        TrendingDecay.objects.create(decayed_at=decayed_at)
+        like = ArtLike.objects.create(user=self.user, art_post=self.liked)
+        ArtLike.objects.filter(pk=like.pk).update(created_at=decayed_at - timezone.timedelta(hours=1))
+        # One like, decayed by one half-life, plus later engagement
+        ArtPost.objects.filter(pk=self.liked.pk).update(like_count=1, trending_score=2.5)
+
+        apply_batch({(self.user.id, self.liked.id): False})
+        self.assertAlmostEqual(self.score(self.liked), 2.0)
+
+    def test_endpoint_ranks_by_stored_score(self):
+        ArtPost.objects.filter(pk=self.liked.pk).update(trending_score=2)
+        ArtPost.objects.filter(pk=self.discussed.pk).update(trending_score=5)
+        response = self.client.get('/api/posts/art/trending/')
+        self.assertEqual([p['id'] for p in response.data['results']], [self.discussed.id, self.liked.id])
+
+
+class HomeTimelineTest(APITestCase):
+    url = '/api/posts/art/timeline/'
+
+    def setUp(self):
+        get_timeline_store.cache_clear()
+        self.viewer = User.objects.create_user(username='reader', email='reader@test.com', password='testpass123')
+        self.followed = User.objects.create_user(username='followed', email='followed@test.com', password='testpass123')
+        self.stranger = User.objects.create_user(username='stranger', email='stranger@test.com', password='testpass123')
+        Follower.objects.create(user=self.viewer, followed_user=self.followed)
+        self.client.force_authenticate(self.viewer)
+
+    def tearDown(self):
+        get_timeline_store.cache_clear()
+
+    def create_post(self, user, description):
+        with self.captureOnCommitCallbacks(execute=True):
+            return ArtPost.objects.create(user=user, description=description)
+
+    def timeline_descriptions(self, url=None):
+        response = self.client.get(url or self.url)
+        self.assertEqual(response.status_code, 200)
+        return [p['description'] for p in response.data['results']], response.data['next']
+
+    def test_fan_out_on_write(self):
+        # Warm the viewer's timeline first so the posts below arrive by fan-out
+        self.timeline_descriptions()
+        self.create_post(self.followed, 'Followed post')
+        self.create_post(self.stranger, 'Stranger post')
+        self.create_post(self.viewer, 'Own post')
+
+        descriptions, _ = self.timeline_descriptions()
+        self.assertEqual(descriptions, ['Own post', 'Followed post'])
+
+    def test_cold_timeline_is_rebuilt_on_read(self):
+        self.create_post(self.followed, 'Before the timeline existed')
+        get_timeline_store.cache_clear()
+
+        descriptions, _ = self.timeline_descriptions()
+        self.assertEqual(descriptions, ['Before the timeline existed'])
+
+    def test_unfollow_removes_posts(self):
+        self.timeline_descriptions()
+        self.create_post(self.followed, 'Followed post')
+        with self.captureOnCommitCallbacks(execute=True):
+            Follower.objects.filter(user=self.viewer).delete()
+
+        descriptions, _ = self.timeline_descriptions()
+        self.assertEqual(descriptions, [])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_celebrity_posts_are_merged_on_read(self):
+        self.timeline_descriptions()
+        for i in range(13):
+            self.create_post(self.followed, f'Celebrity post {i}')
+        self.assertNotIn(self.viewer.id, [
+            user_id for user_id, entries in get_timeline_store().timelines.items() if entries
+        ])
+
+        first, next_url = self.timeline_descriptions()
+        second, _ = self.timeline_descriptions(next_url)
+        self.assertEqual(len(first), 12)
+        self.assertEqual(second, ['Celebrity post 0'])
+
+    def all_timeline_descriptions(self):
+        descriptions, next_url = self.timeline_descriptions()
+        while next_url:
+            page, next_url = self.timeline_descriptions(next_url)
+            descriptions += page
+        return descriptions
+
+    def test_deleted_posts_leave_timelines(self):
+        self.timeline_descriptions()
+        posts = [self.create_post(self.followed, f'Post {i}') for i in range(30)]
+        with self.captureOnCommitCallbacks(execute=True):
+            for post in posts[-5:]:
+                post.delete()
+
+        self.assertNotIn(posts[-1].id, [-post_id for _, post_id in get_timeline_store().timelines[self.viewer.id]])
+        self.assertEqual(self.all_timeline_descriptions(), [f'Post {i}' for i in reversed(range(25))])
+
+    def test_stale_entries_do_not_end_pagination(self):
+        self.timeline_descriptions()
+        posts = [self.create_post(self.followed, f'Post {i}') for i in range(30)]
+        # Deleted without the timeline hearing about it (e.g. a store outage)
+        with mock.patch('posts.signals.timeline.discard_post'):
+            with self.captureOnCommitCallbacks(execute=True):
+                for post in posts[-5:]:
+                    post.delete()
+
+        self.assertEqual(self.all_timeline_descriptions(), [f'Post {i}' for i in reversed(range(25))])
+
+    def test_rebuild_command(self):
+        self.create_post(self.followed, 'Followed post')
+        get_timeline_store.cache_clear()
+
+        out = StringIO()
+        call_command('rebuild_timelines', stdout=out)
+        self.assertIn('Rebuilt 1 timelines', out.getvalue())
+        self.assertTrue(get_timeline_store().exists(self.viewer.id))
+
+
+@override_settings(ART_IMAGE_DERIVATIVE_WIDTHS=[320, 640, 1080])
+class ArtImageDerivativeTest(APITestCase):
+    def setUp(self):
+        self.enterContext(override_settings(MEDIA_ROOT=temp_dir(self)))
+        self.user = User.objects.create_user(username='painter', email='painter@test.com', password='testpass123')
+        self.post = ArtPost.objects.create(user=self.user, description='Large canvas')
+
+    def make_upload(self, width, height):
+        buffer = BytesIO()
+        Image.new('RGB', (width, height), 'orange').save(buffer, 'PNG')
+        return SimpleUploadedFile('canvas.png', buffer.getvalue(), content_type='image/png')
+
+    def test_srcset_falls_back_to_original_while_pending(self):
+        art_image = ArtImage.objects.create(art=self.post, image=self.make_upload(800, 600))
+        srcset = ArtImageSerializer(art_image).data['srcset']
+        self.assertEqual(srcset, [{'url': art_image.image.url, 'width': None, 'format': None}])
+
+    def test_generate_derivatives_skips_upscaling(self):
+        art_image = ArtImage.objects.create(art=self.post, image=self.make_upload(800, 600))
+        generate_derivatives(art_image.id)
+
+        art_image.refresh_from_db()
+        self.assertEqual(art_image.derivatives_status, 'ready')
+        self.assertEqual(
+            sorted((d['width'], d['format']) for d in art_image.derivatives),
+            [(320, 'jpeg'), (320, 'webp'), (640, 'jpeg'), (640, 'webp')],
+        )
+        with Image.open(default_storage.open(art_image.derivatives[0]['name'])) as derivative:
+            self.assertEqual(derivative.size, (320, 240))
+
+        srcset = ArtImageSerializer(art_image).data['srcset']
+        self.assertEqual(len(srcset), 4)
+
+    def test_derivatives_are_deleted_with_the_image_and_on_regeneration(self):
+        art_image = ArtImage.objects.create(art=self.post, image=self.make_upload(800, 600))
+        first = generate_derivatives(art_image.id)
+        second = generate_derivatives(art_image.id)
+        # The old set is removed first, so the new one reuses its names
+        self.assertEqual([d['name'] for d in second], [d['name'] for d in first])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.delete()
+        self.assertFalse(any(default_storage.exists(d['name']) for d in second))
+
+    def test_create_post_schedules_derivatives(self):
+        self.client.force_authenticate(self.user)
+        with mock.patch('posts.serializer.schedule_derivatives') as schedule:
+            response = self.client.post('/api/posts/art/', {
+                'description': 'Uploaded',
+                'uploaded_images': [self.make_upload(400, 400)],
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        schedule.assert_called_once_with([response.data['images'][0]['id']])
+
+
+class CommentListCacheTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='commenter', email='commenter@test.com', password='testpass123')
+        self.post = ArtPost.objects.create(user=self.user, description='Discussed')
+        for i in range(25):
+            commenter = User.objects.create_user(username=f'c{i}', email=f'c{i}@test.com', password='testpass123')
+            ArtComment.objects.create(user=commenter, art_post=self.post, content=f'Comment {i}')
+        self.url = f'/api/posts/comment/?art_post={self.post.id}'
+
+    def test_paginated_with_one_query_per_page(self):
+        with self.assertNumQueries(1):
+            first = self.client.get(self.url)
+        self.assertEqual(len(first.data['results']), 20)
+        self.assertEqual(first.data['results'][0]['user'], 'c24')
+
+        second = self.client.get(first.data['next'])
+        self.assertEqual(len(second.data['results']), 5)
+        self.assertIsNone(second.data['next'])
+
+    def test_write_bumps_generation_instead_of_serving_stale_page(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+        self.client.force_authenticate(self.user)
+        self.client.post('/api/posts/comment/', {'art_post': self.post.id, 'content': 'Fresh'})
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['results'][0]['content'], 'Fresh')
+
+
+@override_settings(LIKE_BUFFER_FLUSH_INTERVAL=None)
+class LikeBufferTest(APITestCase):
+    def setUp(self):
+        self.log_dir = temp_dir(self)
+        self.buffer = LikeBuffer(self.log_dir, fsync=False)
+        self.author = User.objects.create_user(username='popular', email='popular@test.com', password='testpass123')
+        self.post = ArtPost.objects.create(user=self.author, description='Viral')
+        self.fans = [
+            User.objects.create_user(username=f'fan{i}', email=f'fan{i}@test.com', password='testpass123')
+            for i in range(5)
+        ]
+
+    def test_toggles_are_projected_then_flushed_in_one_batch(self):
+        for fan in self.fans:
+            liked, like_count = self.buffer.toggle(fan.id, self.post.id)
+            self.assertTrue(liked)
+        self.assertEqual(like_count, 5)
+        self.assertEqual(self.buffer.toggle(self.fans[0].id, self.post.id), (False, 4))
+        self.assertFalse(ArtLike.objects.exists())
+
+        with self.assertNumQueries(7):
+            # savepoint, users, posts, existing likes, bulk insert, counter, release
+            self.buffer.flush()
+        self.assertEqual(ArtLike.objects.count(), 4)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 4)
+
+    def test_flush_is_idempotent_against_existing_rows(self):
+        ArtLike.objects.create(user=self.fans[0], art_post=self.post)
+        ArtPost.objects.filter(pk=self.post.pk).update(like_count=1)
+
+        self.assertEqual(self.buffer.set_like(self.fans[0].id, self.post.id, True), (True, 1))
+        self.buffer.flush()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+
+    def test_failed_log_rotation_keeps_pending_toggles(self):
+        self.buffer.toggle(self.fans[0].id, self.post.id)
+        with mock.patch('posts.likes.os.replace', side_effect=OSError('read-only file system')):
+            with self.assertRaises(OSError):
+                self.buffer.flush()
+        # The log was reopened and nothing buffered was lost
+        self.assertEqual(self.buffer.toggle(self.fans[1].id, self.post.id), (True, 2))
+        self.buffer.flush()
+        self.assertEqual(ArtLike.objects.count(), 2)
+
+    def test_concurrent_toggles_of_one_like_are_serialized(self):
+        def slow_state(buffer, user_id, post_id):
+            # Reads the state, then takes as long as a database round trip
+            state = buffer.pending.get((user_id, post_id), False)
+            time.sleep(0.05)
+            return state
+
+        results = []
+        with mock.patch.object(LikeBuffer, 'current_state', slow_state):
+            threads = [
+                threading.Thread(target=lambda: results.append(self.buffer.toggle(self.fans[0].id, self.post.id, 0)))
+                for _ in range(2)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(sorted(results), [(False, 0), (True, 1)])
+
+    def test_replay_log_recovers_unflushed_toggles(self):
+        self.buffer.toggle(self.fans[0].id, self.post.id)
+        self.buffer.toggle(self.fans[1].id, self.post.id)
+        self.buffer.toggle(self.fans[1].id, self.post.id)
+
+        # The log of a worker that is still running is left to it
+        with self.settings(LIKE_BUFFER_LOG_DIR=self.log_dir):
+            call_command('replay_like_log', stdout=StringIO())
+        self.assertFalse(ArtLike.objects.exists())
+
+        # Simulate a crash: the buffer is lost, its log stays on disk under a pid that is gone
+        os.close(self.buffer.log_fd)
+        dead = subprocess.Popen([sys.executable, '-c', ''])
+        dead.wait()
+        os.rename(self.buffer.log_path, self.buffer.log_path.replace(f'-{os.getpid()}.', f'-{dead.pid}.'))
+
+        with self.settings(LIKE_BUFFER_LOG_DIR=self.log_dir):
+            call_command('replay_like_log', stdout=StringIO())
+
+        self.assertEqual(list(ArtLike.objects.values_list('user_id', flat=True)), [self.fans[0].id])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertEqual(os.listdir(self.log_dir), [])
+
+
+    def test_restart_with_the_same_pid_applies_the_old_log(self):
+        self.buffer.toggle(self.fans[0].id, self.post.id)
+        os.close(self.buffer.log_fd)
+
+        restarted = LikeBuffer(self.log_dir, fsync=False)
+        restarted.toggle(self.fans[1].id, self.post.id)
+        restarted.flush()
+        self.assertEqual(ArtLike.objects.count(), 2)
+        self.assertEqual(os.listdir(self.log_dir), [os.path.basename(restarted.log_path)])
+
+
+IN_MEMORY_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, ARTPOST_WS_MAX_SUBSCRIPTIONS=3, ARTPOST_WS_COALESCE_WINDOW=0)
+class ArtPostSubscriptionTest(TestCase):
+    def setUp(self):
+        get_coalescer.cache_clear()
+        get_write_queue.cache_clear()
+        self.user = User.objects.create_user(username='watcher', email='watcher@test.com', password='testpass123')
+        self.watched = ArtPost.objects.create(user=self.user, description='Watched')
+        self.other = ArtPost.objects.create(user=self.user, description='Other')
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(ArtPostConsumer.as_asgi(), '/ws/artposts/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_events_reach_only_subscribers_of_the_post(self):
+        watcher = await self.connect()
+        bystander = await self.connect()
+        await watcher.send_json_to({'type': 'subscribe', 'art_post_ids': [self.watched.id]})
+        self.assertEqual(await watcher.receive_json_from(), {'type': 'subscriptions', 'art_post_ids': [self.watched.id]})
+
+        await bystander.send_json_to({
+            'type': 'comment', 'art_post_id': self.watched.id, 'user_id': self.user.id, 'content': 'Hi',
+        })
+        event = await watcher.receive_json_from()
+        self.assertEqual((event['type'], event['art_post_id'], event['comments']), ('delta', self.watched.id, 1))
+        self.assertEqual((await bystander.receive_json_from())['type'], 'ack')
+        self.assertTrue(await bystander.receive_nothing())
+
+        await watcher.send_json_to({'type': 'unsubscribe', 'art_post_ids': [self.watched.id]})
+        self.assertEqual(await watcher.receive_json_from(), {'type': 'subscriptions', 'art_post_ids': []})
+        await get_channel_layer().group_send(post_group(self.watched.id), {
+            'type': 'post_delta', 'art_post_id': self.watched.id,
+            'likes': 1, 'like_count': 1, 'comments': 0, 'recent_comments': [],
+        })
+        self.assertTrue(await watcher.receive_nothing())
+        await watcher.disconnect()
+        await bystander.disconnect()
+        await get_write_queue().close()
+
+    async def test_limit_and_cleanup_on_disconnect(self):
+        communicator = await self.connect()
+        await communicator.send_json_to({'type': 'subscribe', 'art_post_ids': [1, 2, 3, 4, 5]})
+        error = await communicator.receive_json_from()
+        self.assertEqual((error['type'], error['art_post_ids']), ('error', [4, 5]))
+        self.assertEqual((await communicator.receive_json_from())['art_post_ids'], [1, 2, 3])
+
+        await communicator.send_json_to({'type': 'subscribe', 'art_post_ids': 'all'})
+        self.assertEqual((await communicator.receive_json_from())['type'], 'error')
+
+        layer = get_channel_layer()
+        self.assertEqual(len(layer.groups[post_group(1)]), 1)
+        await communicator.disconnect()
+        self.assertNotIn(post_group(1), layer.groups)
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+    ARTPOST_WS_COALESCE_WINDOW=0.5,
+    ARTPOST_WS_COALESCE_MAX_COMMENTS=2,
+    ARTPOST_WS_WRITE_BATCH_WINDOW=0,
+    LIKE_BUFFER_FLUSH_INTERVAL=None,
+    LIKE_BUFFER_FSYNC=False,
+)
+class ArtPostCoalescingTest(TestCase):
+    def setUp(self):
+        get_coalescer.cache_clear()
+        get_write_queue.cache_clear()
+        self.log_dir = temp_dir(self)
+        get_like_buffer.cache_clear()
+        self.author = User.objects.create_user(username='popular', email='popular@test.com', password='testpass123')
+        self.fans = [
+            User.objects.create_user(username=f'fan{i}', email=f'fan{i}@test.com', password='testpass123')
+            for i in range(5)
+        ]
+        self.post = ArtPost.objects.create(user=self.author, description='Going viral')
+
+    def tearDown(self):
+        with self.settings(LIKE_BUFFER_LOG_DIR=self.log_dir):
+            get_like_buffer().flush()
+        get_like_buffer.cache_clear()
+
+    async def test_burst_is_sent_as_one_delta_frame(self):
+        with self.settings(LIKE_BUFFER_LOG_DIR=self.log_dir):
+            viewer = WebsocketCommunicator(ArtPostConsumer.as_asgi(), '/ws/artposts/')
+            await viewer.connect()
+            await viewer.send_json_to({'type': 'subscribe', 'art_post_ids': [self.post.id]})
+            await viewer.receive_json_from()
+
+            sender = WebsocketCommunicator(ArtPostConsumer.as_asgi(), '/ws/artposts/')
+            await sender.connect()
+            # The repeated like changes nothing and must not be counted
+            for fan in self.fans + self.fans[:1]:
+                await sender.send_json_to({'type': 'like', 'art_post_id': self.post.id, 'user_id': fan.id})
+            for text in ('one', 'two', 'three'):
+                await sender.send_json_to({
+                    'type': 'comment', 'art_post_id': self.post.id, 'user_id': self.author.id, 'content': text,
+                })
+
+            frame = await viewer.receive_json_from(timeout=2)
+            self.assertEqual((frame['likes'], frame['like_count'], frame['comments']), (5, 5, 3))
+            self.assertEqual([c['content'] for c in frame['recent_comments']], ['two', 'three'])
+            self.assertTrue(await viewer.receive_nothing(timeout=0.3))
+            await viewer.disconnect()
+            await sender.disconnect()
+            await get_write_queue().close()
+
+
+@override_settings(LIKE_BUFFER_FLUSH_INTERVAL=None, LIKE_BUFFER_FSYNC=False)
+class WebsocketWriteQueueTest(APITestCase):
+    def setUp(self):
+        self.log_dir = temp_dir(self)
+        get_like_buffer.cache_clear()
+        self.author = User.objects.create_user(username='busy', email='busy@test.com', password='testpass123')
+        self.fans = [
+            User.objects.create_user(username=f'liker{i}', email=f'liker{i}@test.com', password='testpass123')
+            for i in range(4)
+        ]
+        self.post = ArtPost.objects.create(user=self.author, description='Busy')
+
+    def tearDown(self):
+        get_like_buffer.cache_clear()
+
+    async def test_concurrent_writes_share_one_batch(self):
+        queue = WriteQueue(batch_size=50, batch_window=0.1, max_depth=100)
+        batches_before = write_queue_metrics.snapshot()['batches']
+        writes = [queue.submit('like', fan.id, self.post.id) for fan in self.fans]
+        # A repeated like is absorbed instead of failing the batch
+        writes.append(queue.submit('like', self.fans[0].id, self.post.id))
+        writes += [queue.submit('comment', self.author.id, self.post.id, f'c{i}') for i in range(3)]
+
+        with self.settings(LIKE_BUFFER_LOG_DIR=self.log_dir):
+            results = await asyncio.gather(*writes)
+            await queue.close()
+
+        self.assertEqual(results[-1]['content'], 'c2')
+        self.assertEqual(results[3]['like_count'], 4)
+        self.assertEqual(write_queue_metrics.snapshot()['batches'], batches_before + 1)
+
+        post = await ArtPost.objects.aget(pk=self.post.pk)
+        self.assertEqual((post.like_count, post.comment_count), (4, 3))
+        self.assertEqual(await ArtLike.objects.filter(art_post=self.post).acount(), 4)
+
+    async def test_unknown_post_is_rejected_without_failing_the_batch(self):
+        queue = WriteQueue(batch_size=50, batch_window=0.05, max_depth=100)
+        results = await asyncio.gather(
+            queue.submit('comment', self.author.id, 999999, 'lost'),
+            queue.submit('comment', self.author.id, self.post.id, 'kept'),
+            return_exceptions=True,
+        )
+        await queue.close()
+        self.assertIsInstance(results[0], WriteRejected)
+        self.assertEqual(results[1]['content'], 'kept')
+
+    async def test_failed_like_flush_does_not_reject_saved_comments(self):
+        queue = WriteQueue(batch_size=50, batch_window=0.05, max_depth=100)
+        with mock.patch.object(LikeBuffer, 'flush', side_effect=OSError('disk full')), \
+                self.settings(LIKE_BUFFER_LOG_DIR=self.log_dir):
+            results = await asyncio.gather(
+                queue.submit('comment', self.author.id, self.post.id, 'saved'),
+                queue.submit('like', self.fans[0].id, self.post.id),
+                return_exceptions=True,
+            )
+            await queue.close()
+        self.assertEqual(results[0]['content'], 'saved')
+        self.assertIsInstance(results[1], WriteRejected)
+        self.assertEqual(await ArtComment.objects.filter(art_post=self.post).acount(), 1)
+
+    def test_metrics_endpoint_is_staff_only(self):
+        self.client.force_authenticate(self.author)
+        self.assertEqual(self.client.get('/api/posts/ws-metrics/').status_code, 403)
+        self.author.is_staff = True
+        self.author.save()
+        response = self.client.get('/api/posts/ws-metrics/')
+        self.assertIn('queue_depth', response.json())
+        self.assertIn('p95', response.json()['flush_latency_ms'])
+
+
+def create_conversation(*usernames):
+    """A Conversation between new users; returns its id and each member's token."""
+    conversation = Conversation.objects.create()
+    tokens = {}
+    for username in usernames:
+        user = User.objects.create_user(username=username, email=f'{username}@test.com', password='testpass123')
+        conversation.participants.add(user)
+        tokens[username] = str(AccessToken.for_user(user))
+    return str(conversation.id), tokens
+
+
+def chat_communicator(conversation_id, query=''):
+    return WebsocketCommunicator(
+        JWTAuthMiddleware(URLRouter(websocket_urlpatterns)), f'/ws/chat/{conversation_id}/?{query}'
+    )
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, CHAT_RESUME_LIMIT=3)
+class ChatHistoryTest(APITestCase):
+    def setUp(self):
+        get_presence_store.cache_clear()
+        self.room, self.tokens = create_conversation('ali', 'mona')
+
+    async def connect(self, username='ali', since=None):
+        query = f'token={self.tokens[username]}'
+        if since is not None:
+            query += f'&since={since}'
+        communicator = chat_communicator(self.room, query)
+        await communicator.connect()
+        self.assertEqual((await communicator.receive_json_from())['type'], 'presence_snapshot')
+        return communicator
+
+    async def receive(self, communicator):
+        """The next frame that is not a presence flip."""
+        while True:
+            frame = await communicator.receive_json_from()
+            if frame['type'] != 'presence':
+                return frame
+
+    async def send(self, communicator, text):
+        await communicator.send_json_to({'type': 'message', 'content': text})
+        return await self.receive(communicator)
+
+    async def test_messages_are_stored_and_missed_ones_replayed(self):
+        first = await self.connect()
+        seen = await self.send(first, 'one')
+        self.assertEqual((seen['type'], seen['content']), ('message', 'one'))
+        await first.disconnect()
+
+        other = await self.connect('mona')
+        for text in ('two', 'three', 'four', 'five'):
+            await self.send(other, text)
+
+        again = await self.connect(since=seen['seq'])
+        replayed = [await self.receive(again) for _ in range(4)]
+        self.assertEqual([m['content'] for m in replayed[:3]], ['two', 'three', 'four'])
+        self.assertEqual(replayed[3], {'type': 'resumed', 'last_seq': replayed[2]['seq'], 'has_more': True})
+
+        live = await self.send(other, 'six')
+        self.assertEqual((await self.receive(again))['seq'], live['seq'])
+        await other.disconnect()
+        await again.disconnect()
+
+    def test_history_endpoint_pages_by_seq(self):
+        for i in range(60):
+            ChatMessage.objects.create(conversation_id=self.room, sender_username='ali', content=f'm{i}')
+        elsewhere, _ = create_conversation('ali2')
+        ChatMessage.objects.create(conversation_id=elsewhere, sender_username='ali2', content='elsewhere')
+        self.client.force_authenticate(User.objects.get(username='ali'))
+
+        first = self.client.get(f'/api/posts/chat/{self.room}/messages/')
+        self.assertEqual(first.data['results'][0]['content'], 'm59')
+        self.assertEqual(len(first.data['results']), 50)
+        second = self.client.get(first.data['next'])
+        self.assertEqual([m['content'] for m in second.data['results']], [f'm{i}' for i in range(9, -1, -1)])
+        self.assertIsNone(second.data['next'])
+
+    def test_history_is_members_only(self):
+        ChatMessage.objects.create(conversation_id=self.room, sender_username='mona', content='secret')
+        url = f'/api/posts/chat/{self.room}/messages/'
+
+        self.client.force_authenticate(User.objects.create_user(username='c', email='c@test.com', password='testpass123'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_authenticate(User.objects.get(username='mona'))
+        self.assertEqual([m['content'] for m in self.client.get(url).data['results']], ['secret'])
+        # Ids without a conversation record are refused, not treated as open rooms
+        for unknown in ('room1', '9999'):
+            self.assertEqual(self.client.get(f'/api/posts/chat/{unknown}/messages/').status_code, 403)
+
+    async def test_conversation_refuses_outsiders(self):
+        _, outsider = await database_sync_to_async(create_conversation)('outsider')
+        for conversation_id, query in (
+            (self.room, f'token={outsider["outsider"]}&since=0'),
+            (self.room, 'since=0'),
+            ('room1', f'token={self.tokens["ali"]}'),
+            ('9999', f'token={self.tokens["ali"]}'),
+        ):
+            connected, code = await chat_communicator(conversation_id, query).connect()
+            self.assertEqual((connected, code), (False, 4003))
+
+    async def test_anonymous_sockets_cannot_write_history(self):
+        # Even if an anonymous socket got in, it could not store a message under a claimed name
+        with mock.patch('posts.consumers.is_conversation_participant', return_value=True):
+            communicator = chat_communicator(self.room)
+            await communicator.connect()
+        await communicator.receive_json_from()
+        await communicator.send_json_to({'type': 'message', 'content': 'hi', 'sender_username': 'ali'})
+        self.assertEqual((await communicator.receive_json_from())['type'], 'error')
+        self.assertFalse(await database_sync_to_async(ChatMessage.objects.exists)())
+        await communicator.disconnect()
+
+    @override_settings(CHAT_RESUME_LIMIT=50, WS_OUTBOUND_QUEUE_SIZE=8)
+    async def test_resume_longer_than_the_outbound_queue_is_delivered(self):
+        await database_sync_to_async(ChatMessage.objects.bulk_create)([
+            ChatMessage(conversation_id=self.room, sender_username='ali', content=f'm{i}') for i in range(20)
+        ])
+        again = await self.connect(since=0)
+        replayed = [await self.receive(again) for _ in range(21)]
+        self.assertEqual([m['content'] for m in replayed[:20]], [f'm{i}' for i in range(20)])
+        self.assertEqual(replayed[20], {'type': 'resumed', 'last_seq': replayed[19]['seq'], 'has_more': False})
+        await again.disconnect()
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+    PRESENCE_TYPING_TTL=0.3,
+    PRESENCE_TYPING_MIN_INTERVAL=0.2,
+)
+class ChatPresenceTest(APITestCase):
+    def setUp(self):
+        get_presence_store.cache_clear()
+        self.room, self.tokens = create_conversation('sara', 'omar')
+
+    async def connect(self, username):
+        communicator = chat_communicator(self.room, f'token={self.tokens[username]}')
+        await communicator.connect()
+        return communicator
+
+    async def test_identity_comes_from_the_token(self):
+        # A claimed ?username= or a bad token does not get in
+        for query in ('username=omar', 'token=not-a-token'):
+            connected, code = await chat_communicator(self.room, query).connect()
+            self.assertEqual((connected, code), (False, 4003))
+
+        omar = await self.connect('omar')
+        await omar.receive_json_from()
+        await omar.receive_json_from()
+        sara = await self.connect('sara')
+        self.assertEqual((await sara.receive_json_from())['online'], ['omar', 'sara'])
+        self.assertEqual((await omar.receive_json_from())['username'], 'sara')
+        await sara.send_json_to({'type': 'message', 'content': 'hi', 'sender_username': 'omar'})
+        frame = await omar.receive_json_from()
+        self.assertEqual((frame['type'], frame['sender_username']), ('message', 'sara'))
+        await omar.disconnect()
+        await sara.disconnect()
+
+    async def test_snapshot_on_join_and_online_flips(self):
+        sara = await self.connect('sara')
+        self.assertEqual((await sara.receive_json_from())['online'], ['sara'])
+        self.assertEqual(await sara.receive_json_from(), {'type': 'presence', 'username': 'sara', 'online': True})
+
+        omar = await self.connect('omar')
+        self.assertEqual((await sara.receive_json_from())['username'], 'omar')
+        snapshot = await omar.receive_json_from()
+        self.assertEqual((snapshot['online'], snapshot['typing']), (['omar', 'sara'], []))
+        await omar.receive_json_from()
+
+        # A second tab does not flip sara's state
+        second_tab = await self.connect('sara')
+        await second_tab.receive_json_from()
+        await second_tab.disconnect()
+        self.assertTrue(await omar.receive_nothing())
+
+        await sara.disconnect()
+        self.assertEqual(await omar.receive_json_from(), {'type': 'presence', 'username': 'sara', 'online': False})
+        await omar.disconnect()
+
+    @override_settings(PRESENCE_TTL=0.2)
+    async def test_flips_are_announced_after_an_entry_expired(self):
+        sara = await self.connect('sara')
+        await sara.receive_json_from()
+        await sara.receive_json_from()
+        omar = await self.connect('omar')
+        await sara.receive_json_from()
+        await omar.receive_json_from()
+        await omar.receive_json_from()
+
+        # No heartbeats: both entries expire, then sara comes back with a frame
+        await asyncio.sleep(0.3)
+        await sara.send_json_to({'type': 'heartbeat'})
+        self.assertEqual(await omar.receive_json_from(), {'type': 'presence', 'username': 'sara', 'online': True})
+
+        # Leaving after another expiry still takes her offline
+        await asyncio.sleep(0.3)
+        await sara.disconnect()
+        self.assertEqual(await omar.receive_json_from(), {'type': 'presence', 'username': 'sara', 'online': False})
+        await omar.disconnect()
+
+    async def test_keystrokes_are_debounced_into_flips(self):
+        sara = await self.connect('sara')
+        await sara.receive_json_from()
+        await sara.receive_json_from()
+
+        for _ in range(10):
+            await sara.send_json_to({'type': 'typing', 'is_typing': True})
+        self.assertEqual(await sara.receive_json_from(), {'type': 'typing', 'username': 'sara', 'is_typing': True})
+        self.assertTrue(await sara.receive_nothing(timeout=0.1))
+
+        # Stop and start again inside the min interval: nothing to announce
+        await sara.send_json_to({'type': 'typing', 'is_typing': False})
+        await sara.send_json_to({'type': 'typing', 'is_typing': True})
+        self.assertTrue(await sara.receive_nothing(timeout=0.15))
+
+        # No stop frame: typing times out after PRESENCE_TYPING_TTL
+        frame = await sara.receive_json_from(timeout=1)
+        self.assertEqual(frame, {'type': 'typing', 'username': 'sara', 'is_typing': False})
+        await sara.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class WebsocketProtocolTest(TestCase):
+    async def test_msgpack_is_negotiated_and_json_stays_default(self):
+        binary = WebsocketCommunicator(ArtPostConsumer.as_asgi(), '/ws/artposts/', subprotocols=['msgpack', 'json'])
+        connected, subprotocol = await binary.connect()
+        self.assertEqual((connected, subprotocol), (True, 'msgpack'))
+        await binary.send_to(bytes_data=pack({'type': 'subscribe', 'art_post_ids': [7]}))
+        self.assertEqual(unpack(await binary.receive_from()), {'type': 'subscriptions', 'art_post_ids': [7]})
+
+        await binary.send_to(bytes_data=b'\xc1')
+        self.assertEqual(unpack(await binary.receive_from())['type'], 'error')
+        await binary.disconnect()
+
+        text = WebsocketCommunicator(ArtPostConsumer.as_asgi(), '/ws/artposts/')
+        connected, subprotocol = await text.connect()
+        self.assertIsNone(subprotocol)
+        await text.send_json_to({'type': 'subscribe', 'art_post_ids': [7]})
+        self.assertEqual((await text.receive_json_from())['art_post_ids'], [7])
+        await text.disconnect()
+
+    def test_benchmark_command_reports_both_codecs(self):
+        out = StringIO()
+        call_command('benchmark_ws_codecs', iterations=10, stdout=out)
+        self.assertIn('msgpack', out.getvalue())
+        self.assertIn('presence snapshot', out.getvalue())
+
+
+def delta(post_id, likes=1, comments=()):
+    return {
+        'type': 'delta', 'art_post_id': post_id, 'likes': likes, 'like_count': None,
+        'comments': len(comments), 'recent_comments': list(comments),
+    }
+
+
+@override_settings(ARTPOST_WS_COALESCE_MAX_COMMENTS=2)
+class OutboundQueueTest(TestCase):
+    def frames(self, queue):
+        return [frame for frame, _ in queue.items]
+
+    def test_drop_oldest_gives_up_coalescible_frames_only(self):
+        queue = OutboundQueue(3, 'drop_oldest')
+        ack = {'type': 'ack', 'ref': '1'}
+        for frame in (ack, delta(1), delta(2)):
+            self.assertTrue(queue.push(frame))
+        self.assertTrue(queue.push(delta(3)))
+        self.assertEqual(self.frames(queue), [ack, delta(2), delta(3)])
+        self.assertEqual(queue.dropped, 1)
+
+        full_of_acks = OutboundQueue(2, 'drop_oldest')
+        full_of_acks.push(ack)
+        full_of_acks.push(ack)
+        self.assertTrue(full_of_acks.push(delta(1)))
+        self.assertFalse(full_of_acks.push({'type': 'message', 'seq': 9}))
+
+    def test_summary_merges_per_post_in_place(self):
+        queue = OutboundQueue(4, 'summary')
+        message = {'type': 'message', 'seq': 1}
+        for frame in (delta(1, comments=['a']), message, delta(2), delta(1, likes=4, comments=['b', 'c'])):
+            queue.push(frame)
+        self.assertTrue(queue.push(delta(2, likes=2)))
+
+        merged_first, kept, merged_second, newest = self.frames(queue)
+        self.assertEqual((merged_first['likes'], merged_first['comments']), (5, 3))
+        self.assertEqual(merged_first['recent_comments'], ['b', 'c'])
+        self.assertEqual((kept, merged_second['art_post_id'], newest['likes']), (message, 2, 2))
+        self.assertEqual(queue.summarized, 1)
+
+    def test_close_policy_refuses_when_full(self):
+        queue = OutboundQueue(1, 'close')
+        queue.push(delta(1))
+        self.assertFalse(queue.push(delta(2)))
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, WS_OUTBOUND_QUEUE_SIZE=5, WS_SLOW_CLIENT_POLICY='close')
+class SlowClientTest(TestCase):
+    async def test_slow_reader_is_closed_with_policy_code(self):
+        stalled = asyncio.Event()
+
+        async def stalled_send(consumer, content, close=False):
+            await stalled.wait()
+
+        with mock.patch.object(ArtPostConsumer, 'send_frame', stalled_send):
+            communicator = WebsocketCommunicator(ArtPostConsumer.as_asgi(), '/ws/artposts/')
+            await communicator.connect()
+            await communicator.send_json_to({'type': 'subscribe', 'art_post_ids': [5]})
+            # The subscription ack itself is stuck in the stalled send
+            await asyncio.sleep(0.1)
+            layer = get_channel_layer()
+            for i in range(7):
+                await layer.group_send(post_group(5), {
+                    'type': 'post_delta', 'art_post_id': 5, 'likes': 1, 'like_count': i,
+                    'comments': 0, 'recent_comments': [],
+                })
+            output = await communicator.receive_output(timeout=2)
+        self.assertEqual(output, {'type': 'websocket.close', 'code': 4008})
+        await communicator.disconnect()
+
+    @override_settings(WS_SLOW_CLIENT_SEND_TIMEOUT=0.2)
+    async def test_reader_that_takes_nothing_is_closed_after_the_timeout(self):
+        stalled = asyncio.Event()
+
+        async def stalled_send(consumer, content, close=False):
+            await stalled.wait()
+
+        room, tokens = await database_sync_to_async(create_conversation)('ali')
+        await database_sync_to_async(ChatMessage.objects.bulk_create)([
+            ChatMessage(conversation_id=room, sender_username='ali', content=f'm{i}') for i in range(20)
+        ])
+        with mock.patch.object(ChatConsumer, 'send_frame', stalled_send):
+            communicator = chat_communicator(room, f'token={tokens["ali"]}&since=0')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            output = await communicator.receive_output(timeout=2)
+        self.assertEqual(output, {'type': 'websocket.close', 'code': 4008})
+        await communicator.disconnect()
 
-# Create your tests here.
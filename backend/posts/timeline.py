@@ -0,0 +1,283 @@
+"""
+Materialized home timelines built from the Follower graph.
+
+New posts are fanned out on write into a bounded, per-user sorted set of
+(score=posted_at in microseconds, member=post id). Authors with more than
+TIMELINE_FANOUT_LIMIT followers are not fanned out; their posts are merged in
+on read with one indexed query instead. Reads therefore touch at most one page
+worth of entries, however many accounts the viewer follows.
+
+Timelines live in Redis when TIMELINE_REDIS_URL is set. Without it
+LocalTimelineStore keeps them in this process, which is enough for a single
+runserver and the test suite but loses every timeline on restart.
+"""
+import bisect
+import functools
+import threading
+from django.conf import settings
+from django.db.models import Q
+from accounts.models import Follower
+from .models import ArtPost
+
+TIMELINE_KEY = 'timeline:{user_id}'
+CELEBRITIES_KEY = 'timeline:celebrities'
+
+
+def to_score(posted_at):
+    # Integer microseconds are exact in a Redis double score
+    return int(posted_at.timestamp() * 1_000_000)
+
+
+class LocalTimelineStore:
+    """In-memory stand-in for RedisTimelineStore, local to one process."""
+
+    def __init__(self, max_length):
+        self.max_length = max_length
+        self.timelines = {}
+        self.celebrities = set()
+        self.lock = threading.Lock()
+
+    def push(self, user_ids, post_id, score):
+        entry = (-score, -post_id)
+        with self.lock:
+            for user_id in user_ids:
+                timeline = self.timelines.get(user_id)
+                if timeline is not None and entry not in timeline:
+                    bisect.insort(timeline, entry)
+                    del timeline[self.max_length:]
+
+    def extend(self, user_id, entries):
+        with self.lock:
+            timeline = self.timelines.setdefault(user_id, [])
+            merged = set(timeline) | {(-score, -post_id) for post_id, score in entries}
+            timeline[:] = sorted(merged)[:self.max_length]
+
+    def replace(self, user_id, entries):
+        timeline = sorted((-score, -post_id) for post_id, score in entries)
+        with self.lock:
+            self.timelines[user_id] = timeline[:self.max_length]
+
+    def remove(self, user_id, post_ids):
+        post_ids = set(post_ids)
+        with self.lock:
+            timeline = self.timelines.get(user_id)
+            if timeline is not None:
+                timeline[:] = [entry for entry in timeline if -entry[1] not in post_ids]
+
+    def discard(self, user_ids, post_id):
+        with self.lock:
+            for user_id in user_ids:
+                timeline = self.timelines.get(user_id)
+                if timeline is not None:
+                    timeline[:] = [entry for entry in timeline if -entry[1] != post_id]
+
+    def exists(self, user_id):
+        return user_id in self.timelines
+
+    def range(self, user_id, max_score, limit):
+        with self.lock:
+            timeline = self.timelines.get(user_id, [])
+            start = 0
+            if max_score is not None:
+                start = bisect.bisect_left(timeline, (-max_score, float('-inf')))
+            return [(-post_id, -score) for score, post_id in timeline[start:start + limit]]
+
+    def set_celebrity(self, user_id, is_celebrity):
+        with self.lock:
+            if is_celebrity:
+                self.celebrities.add(user_id)
+            else:
+                self.celebrities.discard(user_id)
+
+    def get_celebrities(self):
+        with self.lock:
+            return set(self.celebrities)
+
+
+class RedisTimelineStore:
+    """Timelines kept as bounded Redis sorted sets, shared by all workers."""
+
+    def __init__(self, url, max_length):
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self.max_length = max_length
+
+    def key(self, user_id):
+        return TIMELINE_KEY.format(user_id=user_id)
+
+    def push(self, user_ids, post_id, score):
+        keys = [self.key(user_id) for user_id in user_ids]
+        pipe = self.redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.exists(key)
+        warm_keys = [key for key, exists in zip(keys, pipe.execute()) if exists]
+
+        pipe = self.redis.pipeline(transaction=False)
+        for key in warm_keys:
+            pipe.zadd(key, {post_id: score})
+            pipe.zremrangebyrank(key, 0, -(self.max_length + 1))
+        pipe.execute()
+
+    def extend(self, user_id, entries):
+        if entries:
+            key = self.key(user_id)
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.zadd(key, {post_id: score for post_id, score in entries})
+            pipe.zremrangebyrank(key, 0, -(self.max_length + 1))
+            pipe.execute()
+
+    def replace(self, user_id, entries):
+        key = self.key(user_id)
+        pipe = self.redis.pipeline()
+        pipe.delete(key)
+        if entries:
+            pipe.zadd(key, {post_id: score for post_id, score in entries})
+            pipe.zremrangebyrank(key, 0, -(self.max_length + 1))
+        else:
+            # Mark the timeline as built even when it is empty
+            pipe.zadd(key, {0: 0})
+        pipe.execute()
+
+    def remove(self, user_id, post_ids):
+        if post_ids:
+            self.redis.zrem(self.key(user_id), *post_ids)
+
+    def discard(self, user_ids, post_id):
+        pipe = self.redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.zrem(self.key(user_id), post_id)
+        pipe.execute()
+
+    def exists(self, user_id):
+        return bool(self.redis.exists(self.key(user_id)))
+
+    def range(self, user_id, max_score, limit):
+        rows = self.redis.zrevrangebyscore(
+            self.key(user_id),
+            '+inf' if max_score is None else max_score,
+            '(0',
+            start=0,
+            num=limit,
+            withscores=True,
+        )
+        return [(int(member), int(score)) for member, score in rows]
+
+    def set_celebrity(self, user_id, is_celebrity):
+        if is_celebrity:
+            self.redis.sadd(CELEBRITIES_KEY, user_id)
+        else:
+            self.redis.srem(CELEBRITIES_KEY, user_id)
+
+    def get_celebrities(self):
+        return {int(member) for member in self.redis.smembers(CELEBRITIES_KEY)}
+
+
+@functools.lru_cache(maxsize=None)
+def get_timeline_store():
+    if settings.TIMELINE_REDIS_URL:
+        return RedisTimelineStore(settings.TIMELINE_REDIS_URL, settings.TIMELINE_MAX_LENGTH)
+    return LocalTimelineStore(settings.TIMELINE_MAX_LENGTH)
+
+
+def fan_out_post(post):
+    """
+    Push a new post into the author's and every follower's timeline. Cold
+    timelines are left alone; they are rebuilt in full on first read.
+    """
+    store = get_timeline_store()
+    follower_ids = Follower.objects.filter(followed_user_id=post.user_id).values_list('user_id', flat=True)
+    # Only checks whether a row exists past the limit, not the full count
+    is_celebrity = follower_ids[settings.TIMELINE_FANOUT_LIMIT:].exists()
+    store.set_celebrity(post.user_id, is_celebrity)
+
+    score = to_score(post.posted_at)
+    store.push([post.user_id], post.id, score)
+    if is_celebrity:
+        # Followers merge this author's posts on read instead
+        return
+
+    batch = []
+    for follower_id in follower_ids.iterator(chunk_size=1000):
+        batch.append(follower_id)
+        if len(batch) == 1000:
+            store.push(batch, post.id, score)
+            batch = []
+    if batch:
+        store.push(batch, post.id, score)
+
+
+def discard_post(post_id, author_id):
+    """Take a deleted post out of the author's and every follower's timeline."""
+    store = get_timeline_store()
+    store.discard([author_id], post_id)
+    follower_ids = Follower.objects.filter(followed_user_id=author_id).values_list('user_id', flat=True)
+    batch = []
+    for follower_id in follower_ids.iterator(chunk_size=1000):
+        batch.append(follower_id)
+        if len(batch) == 1000:
+            store.discard(batch, post_id)
+            batch = []
+    if batch:
+        store.discard(batch, post_id)
+
+
+def recent_post_entries(author_filter, limit, before=None):
+    queryset = ArtPost.objects.filter(author_filter)
+    if before is not None:
+        posted_at, pk = before
+        queryset = queryset.filter(Q(posted_at__lt=posted_at) | Q(posted_at=posted_at, id__lte=pk))
+    rows = queryset.order_by('-posted_at', '-id').values_list('id', 'posted_at')[:limit]
+    return [(post_id, to_score(posted_at)) for post_id, posted_at in rows]
+
+
+def rebuild_timeline(user_id):
+    """Rebuild one user's timeline from the posts of the accounts they follow."""
+    store = get_timeline_store()
+    celebrities = store.get_celebrities()
+    followed = Follower.objects.filter(user_id=user_id).exclude(
+        followed_user_id__in=celebrities
+    ).values('followed_user_id')
+    entries = recent_post_entries(
+        Q(user_id__in=followed) | Q(user_id=user_id),
+        settings.TIMELINE_MAX_LENGTH,
+    )
+    store.replace(user_id, entries)
+    return len(entries)
+
+
+def add_followed_posts(user_id, followed_user_id):
+    store = get_timeline_store()
+    if not store.exists(user_id) or followed_user_id in store.get_celebrities():
+        return
+    store.extend(user_id, recent_post_entries(Q(user_id=followed_user_id), settings.TIMELINE_MAX_LENGTH))
+
+
+def remove_followed_posts(user_id, followed_user_id):
+    post_ids = ArtPost.objects.filter(user_id=followed_user_id).order_by('-posted_at').values_list(
+        'id', flat=True
+    )[:settings.TIMELINE_MAX_LENGTH]
+    get_timeline_store().remove(user_id, list(post_ids))
+
+
+def read_timeline(user_id, limit, before=None):
+    """
+    Return up to `limit` post ids, newest first, at or before the
+    (posted_at, id) position `before`. Cold timelines are rebuilt first.
+    """
+    store = get_timeline_store()
+    if not store.exists(user_id):
+        rebuild_timeline(user_id)
+
+    max_score = to_score(before[0]) if before is not None else None
+    entries = store.range(user_id, max_score, limit)
+
+    celebrities = store.get_celebrities()
+    if celebrities:
+        followed_celebrities = Follower.objects.filter(
+            user_id=user_id, followed_user_id__in=celebrities
+        ).values('followed_user_id')
+        entries += recent_post_entries(Q(user_id__in=followed_celebrities), limit, before)
+
+    # An author may have posts in both sources if they crossed the fan-out limit
+    entries = sorted(set(entries), key=lambda entry: (entry[1], entry[0]), reverse=True)
+    return [post_id for post_id, _ in entries[:limit]]
@@ -1,10 +1,16 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ArtViewSet, CommentViewSet, LikeViewSet
+from .views import (
+    ArtViewSet, CategoryViewSet, ChatHistoryView, CommentViewSet, LikeViewSet, WebsocketWriteMetricsView,
+)
 
 router = DefaultRouter()
 router.register('art', ArtViewSet, basename='art')
+router.register('category', CategoryViewSet, basename='category')
 router.register('comment', CommentViewSet, basename='comment')
 router.register('like', LikeViewSet, basename='like')
 
-urlpatterns = router.urls
\ No newline at end of file
+urlpatterns = router.urls + [
+    path('chat/<str:conversation_id>/messages/', ChatHistoryView.as_view(), name='chat-history'),
+    path('ws-metrics/', WebsocketWriteMetricsView.as_view(), name='ws-metrics'),
+]
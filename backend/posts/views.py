@@ -1,68 +1,208 @@
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
-from .serializer import ArtSerializer, CreateCommentSerializer, CreateLikeSerializer
-from .models import ArtPost, ArtComment, ArtLike
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.decorators import action
+from .serializer import (
+    ArtSerializer, ArtFeedSerializer, CategoryFacetSerializer, ChatMessageSerializer,
+    CreateCommentSerializer, CreateLikeSerializer,
+)
+from .models import ArtPost, ArtPostCategory, ArtComment, ArtLike, Category, ChatMessage
 from rest_framework import status
-from rest_framework.viewsets import ModelViewSet
-from .permissions import CanDelete
+from rest_framework.generics import ListAPIView
+from rest_framework.views import APIView
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
+from .permissions import CanDelete, IsConversationParticipant
+from .pagination import FeedCursorPagination, CommentCursorPagination, SeqPagination
+from .likes import get_like_buffer
+from .caching import COMMENT_PAGE_TTL, bump_comment_generation, comment_page_key
+from .timeline import read_timeline
+from .search import search_post_ids
+from .write_queue import metrics as write_queue_metrics
+from .protocols import outbound_stats
 from django.shortcuts import get_object_or_404
 from rest_framework.exceptions import ValidationError
+from rest_framework.utils.urls import replace_query_param
 from django.core.cache import cache
-from accounts.models import CustomUser
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch, Value
+
+# Number of comments embedded in each post of the lean feed
+FEED_COMMENT_PREVIEW = 3
+
 
 class ArtViewSet(ModelViewSet):
-    queryset = ArtPost.objects.all().order_by('-posted_at')
+    queryset = ArtPost.objects.all().order_by('-posted_at', '-id')
     serializer_class = ArtSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
-    
+    pagination_class = FeedCursorPagination
+
+    def is_feed_view(self):
+        # ?view=feed switches the list to the lean ArtFeedSerializer
+        if self.action in ('timeline', 'search', 'trending'):
+            return True
+        return self.action == 'list' and self.request.query_params.get('view') == 'feed'
+
+    def get_serializer_class(self):
+        if self.is_feed_view():
+            return ArtFeedSerializer
+        return ArtSerializer
+
     def get_queryset(self):
-        queryset = ArtPost.objects.all().order_by('-posted_at')
-        
+        queryset = ArtPost.objects.all().order_by('-posted_at', '-id')
+
         # Filter by user if username is provided
         username = self.request.query_params.get('user')
         if username:
-            try:
-                user = CustomUser.objects.get(username=username)
-                queryset = queryset.filter(user=user)
-            except CustomUser.DoesNotExist:
-                return ArtPost.objects.none()
-        
-        return queryset
+            queryset = queryset.filter(user__username=username)
+
+        # ?category=1&category=2 or ?category=1,2 -> posts in any of them
+        category_ids = self.get_category_ids()
+        if category_ids:
+            tagged = ArtPostCategory.objects.filter(category_id__in=category_ids).values('artpost_id')
+            queryset = queryset.filter(id__in=tagged)
+
+        # Load authors, avatars, images and categories up front so the page
+        # costs a fixed number of queries instead of several per post
+        queryset = queryset.select_related('user__myprofile').prefetch_related('images', 'categories')
+
+        if self.is_feed_view():
+            return self.annotate_feed(queryset)
+
+        return queryset.prefetch_related(
+            Prefetch('comments', queryset=ArtComment.objects.select_related('user')),
+            Prefetch('likes', queryset=ArtLike.objects.select_related('user')),
+        )
+
+    def get_category_ids(self):
+        values = []
+        for value in self.request.query_params.getlist('category'):
+            values.extend(part.strip() for part in value.split(',') if part.strip())
+        try:
+            return {int(value) for value in values}
+        except ValueError:
+            raise ValidationError({'category': 'Category ids must be integers.'})
+
+    def annotate_feed(self, queryset):
+        user = self.request.user
+        if user.is_authenticated:
+            is_liked = Exists(ArtLike.objects.filter(art_post=OuterRef('pk'), user=user))
+        else:
+            is_liked = Value(False)
+
+        recent_comments = ArtComment.objects.select_related('user').order_by('-created_at', '-id')
+        return queryset.annotate(is_liked=is_liked).prefetch_related(
+            Prefetch(
+                'comments',
+                queryset=recent_comments[:FEED_COMMENT_PREVIEW],
+                to_attr='recent_comments',
+            )
+        )
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def timeline(self, request):
+        """Posts from the accounts the current user follows, newest first."""
+        paginator = self.paginator
+        before = paginator.decode_cursor(request)
+        # One extra id for the next-page check and one for the cursor row itself
+        wanted = paginator.page_size + 2
+        limit = wanted
+        while True:
+            post_ids = read_timeline(request.user.id, limit=limit, before=before)
+            live_ids = list(ArtPost.objects.filter(id__in=post_ids).values_list('id', flat=True))
+            # Entries of posts deleted behind the store's back must not end the page early
+            if len(live_ids) >= wanted or len(post_ids) < limit or limit >= settings.TIMELINE_MAX_LENGTH:
+                break
+            limit = min(limit * 2, settings.TIMELINE_MAX_LENGTH)
+        queryset = self.get_queryset().filter(id__in=live_ids)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Posts whose description matches ?q=, best match first."""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': 'A search query is required.'})
+        try:
+            page_number = max(int(request.query_params.get('page', 1)), 1)
+        except ValueError:
+            raise ValidationError({'page': 'A valid page number is required.'})
+
+        page_size = self.paginator.page_size
+        post_ids = search_post_ids(query, limit=page_size + 1, offset=(page_number - 1) * page_size)
+        has_next = len(post_ids) > page_size
+        post_ids = post_ids[:page_size]
+
+        posts = {post.id: post for post in self.get_queryset().filter(id__in=post_ids)}
+        ranked = [posts[post_id] for post_id in post_ids if post_id in posts]
+        serializer = self.get_serializer(ranked, many=True)
+        next_url = None
+        if has_next:
+            next_url = replace_query_param(request.build_absolute_uri(), 'page', page_number + 1)
+        return Response({'next': next_url, 'results': serializer.data})
+
+    @action(detail=False, methods=['get'])
+    def trending(self, request):
+        """Top TRENDING_LIMIT posts by stored trending_score, read off its index."""
+        queryset = self.get_queryset().filter(trending_score__gt=0).order_by('-trending_score', '-id')
+        serializer = self.get_serializer(queryset[:settings.TRENDING_LIMIT], many=True)
+        return Response({'results': serializer.data})
+
+class CategoryViewSet(ReadOnlyModelViewSet):
+    """Category facets: each category with its stored post count, busiest first."""
+    queryset = Category.objects.order_by('-post_count', 'name')
+    serializer_class = CategoryFacetSerializer
+    pagination_class = None
+
+
 class CommentViewSet(ModelViewSet):
     serializer_class = CreateCommentSerializer
     permission_classes = [IsAuthenticatedOrReadOnly, CanDelete]
+    pagination_class = CommentCursorPagination
 
     def get_queryset(self):
         post_id = self.request.query_params.get('art_post')
         if not post_id:
             return ArtComment.objects.none()
-        return ArtComment.objects.filter(art_post=post_id)
+        # StringRelatedField renders the username, so load users in the same query
+        return ArtComment.objects.filter(art_post=post_id).select_related('user')
 
     def list(self, request, *args, **kwargs):
         post_id = request.query_params.get('art_post')
         if not post_id:
             return Response([])
 
-        cache_key = f'comments_{post_id}'
+        cursor = request.query_params.get(self.paginator.cursor_query_param)
+        cache_key = comment_page_key(post_id, cursor)
         cached_data = cache.get(cache_key)
-        if cached_data:
+        if cached_data is not None:
             return Response(cached_data)
 
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        cache.set(cache_key, serializer.data, timeout=60*5)
-        return Response(serializer.data)
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        response = self.get_paginated_response(serializer.data)
+        cache.set(cache_key, response.data, timeout=COMMENT_PAGE_TTL)
+        return response
 
     def perform_create(self, serializer):
         art_post_id = self.request.data.get('art_post')
         art_post = get_object_or_404(ArtPost, id=art_post_id)
-        serializer.save(user=self.request.user, art_post=art_post)
-        # Clear cache when new comment is added
-        cache.delete(f'comments_{art_post_id}')
+        with transaction.atomic():
+            serializer.save(user=self.request.user, art_post=art_post)
+            ArtPost.bump_counter(art_post.id, 'comment_count', 1)
+        # Move readers to a new cache generation instead of deleting pages
+        bump_comment_generation(art_post.id)
+
+    def perform_destroy(self, instance):
+        art_post_id = instance.art_post_id
+        with transaction.atomic():
+            instance.delete()
+            ArtPost.bump_counter(art_post_id, 'comment_count', -1, removed_at=[instance.created_at])
+        bump_comment_generation(art_post_id)
 
 
 class LikeViewSet(ModelViewSet):
@@ -90,29 +230,41 @@ class LikeViewSet(ModelViewSet):
         cache.set(cache_key, serializer.data, timeout=60*5)
         return Response(serializer.data)
 
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return self.perform_create(serializer)
+
     def perform_create(self, serializer):
-        art_post_id = self.request.data.get('art_post')
-        art_post = get_object_or_404(ArtPost, id=art_post_id)
-        like_qs = ArtLike.objects.filter(user=self.request.user, art_post=art_post)
-        if like_qs.exists():
-            # إذا كان معجب بالفعل، احذف اللايك (toggle off)
-            like_qs.delete()
-            cache.delete(f'likes_{art_post_id}')
-            # احسب العدد الجديد مباشرة
-            new_count = ArtLike.objects.filter(art_post=art_post).count()
-            return Response({'detail': 'Like removed', 'liked': False, 'like_count': new_count}, status=status.HTTP_200_OK)
-        else:
+        # Toggles go through the write-behind buffer and are flushed in batches
+        art_post = serializer.validated_data['art_post']
+        liked, like_count = get_like_buffer().toggle(self.request.user.id, art_post.id, art_post.like_count)
+        if liked:
             # إذا لم يكن معجب، أضف لايك (toggle on)
-            serializer.save(user=self.request.user, art_post=art_post)
-            cache.delete(f'likes_{art_post_id}')
-            # احسب العدد الجديد مباشرة
-            new_count = ArtLike.objects.filter(art_post=art_post).count()
-            return Response({'detail': 'Like added', 'liked': True, 'like_count': new_count}, status=status.HTTP_201_CREATED)
+            return Response({'detail': 'Like added', 'liked': True, 'like_count': like_count}, status=status.HTTP_201_CREATED)
+        # إذا كان معجب بالفعل، احذف اللايك (toggle off)
+        return Response({'detail': 'Like removed', 'liked': False, 'like_count': like_count}, status=status.HTTP_200_OK)
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
-        art_post_id = instance.art_post.id
-        self.perform_destroy(instance)
-        # Clear cache when like is removed
-        cache.delete(f'likes_{art_post_id}')
-        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        get_like_buffer().set_like(instance.user_id, instance.art_post_id, False)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class WebsocketWriteMetricsView(APIView):
+    """Write-queue depth and flush latency plus slow-client counters for this process."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({**write_queue_metrics.snapshot(), 'outbound': outbound_stats.snapshot()})
+
+
+class ChatHistoryView(ListAPIView):
+    """Stored messages of one conversation, newest first, paged by seq; members only."""
+    serializer_class = ChatMessageSerializer
+    permission_classes = [IsAuthenticated, IsConversationParticipant]
+    pagination_class = SeqPagination
+
+    def get_queryset(self):
+        return ChatMessage.objects.filter(conversation_id=self.kwargs['conversation_id'])
+
@@ -0,0 +1,229 @@
+"""
+Batched persistence for ArtPostConsumer writes.
+
+Likes and comments received over the websocket are put on an in-process
+asyncio queue instead of each running its own ORM queries. A writer task
+takes whatever has queued up (after waiting ARTPOST_WS_WRITE_BATCH_WINDOW for
+more to arrive) and persists it in one thread hop: users and posts are looked
+up once per batch, comments are bulk-created, likes go through the like
+buffer and are flushed with bulk_create(ignore_conflicts=True). Each sender
+is acknowledged only once its own write is committed.
+
+Queue depth and flush latency are kept in `metrics` and served to staff at
+/api/posts/ws-metrics/.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter, deque
+from channels.db import database_sync_to_async # type: ignore
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from core.loops import per_event_loop
+from .caching import bump_comment_generation
+from .likes import get_like_buffer
+from .models import ArtComment, ArtPost
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+class WriteRejected(Exception):
+    pass
+
+
+class WriteRequest:
+    __slots__ = ('kind', 'user_id', 'art_post_id', 'content', 'future')
+
+    def __init__(self, kind, user_id, art_post_id, content, future):
+        self.kind = kind
+        self.user_id = user_id
+        self.art_post_id = art_post_id
+        self.content = content
+        self.future = future
+
+
+class WriteQueueMetrics:
+    """Process-wide counters for every write queue in this process."""
+
+    def __init__(self, samples=1000):
+        self.lock = threading.Lock()
+        self.queue_depth = 0
+        self.batches = 0
+        self.writes = 0
+        self.failed_batches = 0
+        self.latencies = deque(maxlen=samples)
+
+    def queued(self, n):
+        with self.lock:
+            self.queue_depth += n
+
+    def flushed(self, size, seconds, failed=False):
+        with self.lock:
+            self.batches += 1
+            self.writes += size
+            self.failed_batches += int(failed)
+            self.latencies.append(seconds)
+
+    def snapshot(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            snapshot = {
+                'queue_depth': self.queue_depth,
+                'batches': self.batches,
+                'writes': self.writes,
+                'failed_batches': self.failed_batches,
+            }
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000, 2)
+
+        snapshot['flush_latency_ms'] = {'p50': percentile(0.5), 'p95': percentile(0.95), 'max': percentile(1)}
+        return snapshot
+
+
+metrics = WriteQueueMetrics()
+
+
+def persist_batch(batch):
+    """
+    Write one batch and resolve each request's result; runs in a worker thread.
+    Comments and likes are saved separately, so a failure in one part rejects
+    only that part's requests and never a write that was already committed.
+    """
+    user_ids = {request.user_id for request in batch}
+    post_ids = {request.art_post_id for request in batch}
+    live_users = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+    like_counts = dict(ArtPost.objects.filter(id__in=post_ids).values_list('id', 'like_count'))
+
+    results = {}
+    likes = []
+    comments = []
+    for request in batch:
+        if request.user_id not in live_users:
+            results[request] = WriteRejected('User does not exist')
+        elif request.art_post_id not in like_counts:
+            results[request] = WriteRejected('Post does not exist')
+        elif request.kind == 'like':
+            likes.append(request)
+        else:
+            comments.append(request)
+
+    for part, persist in ((comments, persist_comments), (likes, persist_likes)):
+        if not part:
+            continue
+        try:
+            persist(part, like_counts, results)
+        except Exception as e:
+            logger.error(f"Saving {len(part)} websocket {part[0].kind}s failed: {e}")
+            for request in part:
+                results.setdefault(request, WriteRejected('Could not save, please retry'))
+    return results
+
+
+def persist_comments(comments, like_counts, results):
+    with transaction.atomic():
+        created = ArtComment.objects.bulk_create([
+            ArtComment(user_id=request.user_id, art_post_id=request.art_post_id, content=request.content)
+            for request in comments
+        ])
+        per_post = Counter(request.art_post_id for request in comments)
+        for post_id, added in per_post.items():
+            ArtPost.bump_counter(post_id, 'comment_count', added)
+    # Committed: ack now, so a failure below cannot make clients retry saved comments
+    for request, comment in zip(comments, created):
+        results[request] = {'id': comment.id, 'user_id': comment.user_id, 'content': comment.content}
+    for post_id in per_post:
+        bump_comment_generation(post_id)
+
+
+def persist_likes(likes, like_counts, results):
+    like_buffer = get_like_buffer()
+    states = like_buffer.current_states([(request.user_id, request.art_post_id) for request in likes])
+    acks = {}
+    for request in likes:
+        key = (request.user_id, request.art_post_id)
+        _, like_count = like_buffer.record(
+            request.user_id, request.art_post_id, True, states[key], like_counts[request.art_post_id]
+        )
+        # 0 for a repeat like, so deltas count only likes that changed something
+        acks[request] = {'like_count': like_count, 'change': int(not states[key])}
+        states[key] = True
+    # Acks promise the like is in the database, so flush now rather than
+    # waiting for the background flusher
+    like_buffer.flush()
+    results.update(acks)
+
+
+class WriteQueue:
+    def __init__(self, batch_size, batch_window, max_depth):
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.queue = asyncio.Queue(maxsize=max_depth)
+        self.task = None
+
+    async def submit(self, kind, user_id, art_post_id, content=None):
+        """Queue one write and wait until its batch is persisted."""
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+        future = asyncio.get_running_loop().create_future()
+        # A full queue makes senders wait here, which slows chatty sockets down
+        await self.queue.put(WriteRequest(kind, user_id, art_post_id, content, future))
+        metrics.queued(1)
+        result = await future
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def take_batch(self, limit):
+        batch = []
+        while len(batch) < limit and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            if self.batch_window > 0:
+                await asyncio.sleep(self.batch_window)
+            batch += self.take_batch(self.batch_size - 1)
+            metrics.queued(-len(batch))
+
+            started = time.perf_counter()
+            try:
+                results = await database_sync_to_async(persist_batch)(batch)
+            except Exception as e:
+                logger.error(f"Websocket write batch of {len(batch)} failed: {e}")
+                metrics.flushed(len(batch), time.perf_counter() - started, failed=True)
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_result(WriteRejected('Could not save, please retry'))
+                continue
+            metrics.flushed(len(batch), time.perf_counter() - started)
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_result(results[request])
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+@per_event_loop
+def get_write_queue():
+    """The write queue of the running event loop."""
+    return WriteQueue(
+        settings.ARTPOST_WS_WRITE_BATCH_SIZE,
+        settings.ARTPOST_WS_WRITE_BATCH_WINDOW,
+        settings.ARTPOST_WS_WRITE_QUEUE_SIZE,
+    )
@@ -1,4 +1,5 @@
 from django.contrib import admin
-from .models import Story
+from .models import Story, StoryVideoJob
 
-admin.site.register(Story)
\ No newline at end of file
+admin.site.register(Story)
+admin.site.register(StoryVideoJob)
@@ -0,0 +1,33 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from story.models import StoryVideoJob
+from story.processing import run_job
+
+
+class Command(BaseCommand):
+    help = 'Run story video jobs left queued (e.g. by a restart), requeueing stalled or failed ones first'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true',
+                            help='Also retry jobs whose previous attempt failed')
+        parser.add_argument('--stale-minutes', type=int, default=30,
+                            help='Requeue jobs that have been running longer than this')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(minutes=options['stale_minutes'])
+        StoryVideoJob.objects.filter(status='running', started_at__lt=cutoff).update(status='queued')
+        if options['retry_failed']:
+            StoryVideoJob.objects.filter(status='failed').update(status='queued', error='')
+
+        job_ids = StoryVideoJob.objects.filter(status='queued').order_by('created_at').values_list('id', flat=True)
+        done = failed = 0
+        for job_id in job_ids.iterator(chunk_size=500):
+            if not run_job(job_id):
+                continue
+            if StoryVideoJob.objects.filter(id=job_id, status='done').exists():
+                done += 1
+            else:
+                failed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {done} story videos, {failed} failed.'))
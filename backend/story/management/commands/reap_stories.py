@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from story.models import Story
+
+
+class Command(BaseCommand):
+    help = 'Delete expired stories and stories whose file is gone, with their files; schedule it every few minutes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.STORY_REAPER_BATCH_SIZE,
+                            help='Number of stories deleted per transaction')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        expired = self.delete_expired(batch_size)
+        orphaned = self.delete_orphaned(batch_size)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {expired} expired and {orphaned} orphaned stories.'))
+
+    def delete_batch(self, ids):
+        # Files are released by blobs.signals once the batch commits
+        with transaction.atomic():
+            Story.objects.filter(id__in=ids).delete()
+        return len(ids)
+
+    def delete_expired(self, batch_size):
+        now = timezone.now()
+        deleted = 0
+        while True:
+            batch = list(Story.objects.filter(expires_at__lte=now).values_list('id', flat=True)[:batch_size])
+            if not batch:
+                return deleted
+            deleted += self.delete_batch(batch)
+
+    def delete_orphaned(self, batch_size):
+        # Stories without a file, or whose file was removed from disk, would 404 in the client
+        deleted = 0
+        while True:
+            batch = list(Story.objects.filter(file='').values_list('id', flat=True)[:batch_size])
+            if not batch:
+                break
+            deleted += self.delete_batch(batch)
+
+        # Only live stories with media are worth a stat; expired ones were just deleted
+        live_with_media = Story.objects.filter(expires_at__gt=timezone.now()).exclude(file='')
+        last_id = 0
+        while True:
+            stories = list(live_with_media.filter(id__gt=last_id).order_by('id').only('id', 'file')[:batch_size])
+            if not stories:
+                return deleted
+            last_id = stories[-1].id # type: ignore
+            orphans = [story.id for story in stories if not story.file_exists()] # type: ignore
+            if orphans:
+                deleted += self.delete_batch(orphans)
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:02
+
+import blobs.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('story', '0003_story_is_trimmed'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='story',
+            name='file',
+            field=models.FileField(storage=blobs.storage.get_content_addressed_storage, upload_to='stories'),
+        ),
+    ]
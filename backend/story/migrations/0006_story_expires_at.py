@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:37
+
+import story.models
+from django.conf import settings
+from datetime import timedelta
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_expiry(apps, schema_editor):
+    # Existing stories keep the 24 hours they were created with
+    Story = apps.get_model('story', 'Story')
+    Story.objects.update(expires_at=F('created_at') + timedelta(hours=24))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('story', '0005_story_status_storyvideojob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='story',
+            name='expires_at',
+            field=models.DateTimeField(default=story.models.default_expiry),
+        ),
+        migrations.RunPython(backfill_expiry, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='story',
+            index=models.Index(fields=['expires_at'], name='story_expires_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('story', '0006_story_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='story',
+            name='hls_playlist',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -1,22 +1,43 @@
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
+from blobs.storage import get_content_addressed_storage
+
+
+def default_expiry():
+    return timezone.now() + timezone.timedelta(hours=settings.STORY_LIFETIME_HOURS) # type: ignore
 
 class Story(models.Model):
     MEDIA_TYPE_CHOICES = (
         ('image', 'Image'),
         ('video', 'Video'),
     )
+    STATUS_CHOICES = (
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    )
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    file = models.FileField(upload_to='stories')
+    file = models.FileField(upload_to='stories', storage=get_content_addressed_storage)
     media_type = models.CharField(max_length=10, choices=MEDIA_TYPE_CHOICES, blank=True, null=True)
     duration = models.IntegerField(default=60, help_text='Duration in seconds (for videos)') # type: ignore
     is_trimmed = models.BooleanField(default=False, help_text='Whether video was trimmed in frontend') # type: ignore
     created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(default=default_expiry)
+    # Videos stay hidden while story.processing trims them
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='ready')
+    failure_reason = models.CharField(max_length=255, blank=True)
+    # Storage name of the HLS master playlist once story.processing has packaged the video
+    hls_playlist = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        indexes = [
+            # Listing (expires_at > now) and the reaper (expires_at <= now) are both range scans
+            models.Index(fields=['expires_at'], name='story_expires_idx'),
+        ]
 
     def is_expired(self):
-        expiry_time = self.created_at + timezone.timedelta(hours=24) # type: ignore
-        return timezone.now() > expiry_time
+        return timezone.now() > self.expires_at
 
     def file_exists(self):
         """Check if the file actually exists on disk"""
@@ -34,3 +55,28 @@ class Story(models.Model):
                 self.media_type = 'video'
                 # Duration will be set by the view during processing
         super().save(*args, **kwargs)
+
+
+class StoryVideoJob(models.Model):
+    """One run of story.processing over a story's video; the backlog is the queued rows."""
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    story = models.ForeignKey(Story, on_delete=models.CASCADE, related_name='video_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0) # type: ignore
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='storyvideojob_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Story {self.story_id} video job ({self.status})" # type: ignore
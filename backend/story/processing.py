@@ -0,0 +1,149 @@
+"""
+Background processing of story videos.
+
+StoryCreateView saves a video story as `processing` and queues a
+StoryVideoJob. Once the request's transaction commits the job is handed to a
+thread pool of STORY_VIDEO_WORKERS, so at most that many ffprobe/ffmpeg runs
+happen at once and no HTTP worker waits on a re-encode. The job validates and,
+if needed, trims the video, then flips the story to `ready` or to `failed`
+with a reason. Ready videos are then packaged as HLS at STORY_HLS_LEVELS;
+until that lands the serializer's `playlist` is None and clients play
+`media`. Jobs are rows, so anything a restart interrupted is picked up again
+by process_story_videos.
+"""
+import logging
+import os
+import posixpath
+import tempfile
+import uuid
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+from core import workers
+from .models import Story, StoryVideoJob
+from .video_processor import VideoIngest
+
+logger = logging.getLogger(__name__)
+
+
+class StoryProcessingError(Exception):
+    """A video that can not be made into a story; the message is the failure reason."""
+
+
+def enqueue_story_video(story):
+    """Record a job for `story` and start it once the current transaction commits."""
+    job = StoryVideoJob.objects.create(story=story)
+    transaction.on_commit(lambda: workers.submit('story-video', settings.STORY_VIDEO_WORKERS, run_job, job.id))
+    return job
+
+
+def run_job(job_id):
+    """Process one queued job; returns False if another worker already claimed it."""
+    claimed = StoryVideoJob.objects.filter(id=job_id, status='queued').update(
+        status='running', started_at=timezone.now(), attempts=F('attempts') + 1,
+    )
+    if not claimed:
+        return False
+
+    job = StoryVideoJob.objects.select_related('story').get(id=job_id)
+    try:
+        process_story_video(job.story)
+    except Exception as e:
+        reason = str(e) if isinstance(e, StoryProcessingError) else 'Video processing failed'
+        logger.error(f"Story {job.story.id} video processing failed: {e}") # type: ignore
+        Story.objects.filter(id=job.story.id).update(status='failed', failure_reason=reason) # type: ignore
+        StoryVideoJob.objects.filter(id=job_id).update(status='failed', error=str(e), finished_at=timezone.now())
+        return True
+
+    StoryVideoJob.objects.filter(id=job_id).update(status='done', error='', finished_at=timezone.now())
+    return True
+
+
+def process_story_video(story):
+    """Validate and trim the story's stored video in place, mark it ready, then package HLS."""
+    with VideoIngest(path=story.file.path, owns_path=False) as video:
+        if not video.is_valid:
+            raise StoryProcessingError('Invalid video file')
+
+        final = video
+        story.is_trimmed = False
+        if video.needs_trim():
+            logger.info(f"Story {story.id} video is longer than 60 seconds, trimming...")
+            trimmed = video.trim()
+            # The trimmed copy's own probe is the final check
+            if trimmed is None or not trimmed.is_valid:
+                # Keep the original rather than lose the story
+                logger.error(f"Trimmed video for story {story.id} is invalid, keeping the original")
+            else:
+                trimmed_file = trimmed.open(story.file.name)
+                try:
+                    # The replaced blob is released by blobs.signals when the story is saved
+                    story.file.save(os.path.basename(story.file.name), trimmed_file, save=False)
+                finally:
+                    trimmed_file.close()
+                story.is_trimmed = True
+                final = trimmed
+
+        # The MP4 is playable from here on; HLS follows when packaging finishes
+        story.status = 'ready'
+        story.failure_reason = ''
+        story.save(update_fields=['file', 'is_trimmed', 'status', 'failure_reason'])
+
+        # Packaging reuses the final file and its probe (size, audio) already on disk
+        package_story_hls(story, final)
+
+
+def package_story_hls(story, video):
+    """Segment `video` into HLS renditions in storage and point the story at the playlist."""
+    prefix = f'stories/hls/{story.id}/{uuid.uuid4().hex[:12]}'
+    with tempfile.TemporaryDirectory() as output_dir:
+        levels = video.package_hls(output_dir, settings.STORY_HLS_LEVELS, settings.STORY_HLS_SEGMENT_SECONDS)
+        if levels is None:
+            logger.error(f"Story {story.id} keeps serving the MP4, HLS packaging failed")
+            return None
+        # Playlists refer to segments by relative path, so the tree is stored as-is
+        for root, _, files in os.walk(output_dir):
+            for filename in files:
+                path = os.path.join(root, filename)
+                relative = os.path.relpath(path, output_dir).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    default_storage.save(f'{prefix}/{relative}', File(f))
+
+    playlist = f'{prefix}/master.m3u8'
+    previous = story.hls_playlist
+    Story.objects.filter(id=story.id).update(hls_playlist=playlist)
+    story.hls_playlist = playlist
+    if previous:
+        delete_hls_files(previous)
+    logger.info(f"Story {story.id} packaged as HLS at {', '.join(str(l['height']) + 'p' for l in levels)}")
+    return playlist
+
+
+def delete_hls_files(playlist):
+    """Remove a packaged HLS tree given its master playlist name."""
+    def delete_dir(directory):
+        dirs, files = default_storage.listdir(directory)
+        for filename in files:
+            default_storage.delete(f'{directory}/{filename}')
+        for subdir in dirs:
+            delete_dir(f'{directory}/{subdir}')
+
+    directory = posixpath.dirname(playlist)
+    try:
+        delete_dir(directory)
+    except FileNotFoundError:
+        pass
+
+
+def backlog():
+    """Job counts by status and the age of the oldest queued job."""
+    counts = dict(StoryVideoJob.objects.values_list('status').annotate(n=Count('id')).order_by())
+    oldest = StoryVideoJob.objects.filter(status='queued').aggregate(oldest=Min('created_at'))['oldest']
+    return {
+        'workers': settings.STORY_VIDEO_WORKERS,
+        **{status: counts.get(status, 0) for status, _ in StoryVideoJob.STATUS_CHOICES},
+        'oldest_queued_seconds': (timezone.now() - oldest).total_seconds() if oldest else None,
+    }
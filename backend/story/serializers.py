@@ -1,4 +1,5 @@
 from rest_framework import serializers 
+from django.core.files.storage import default_storage
 from .models import Story
 from accounts.models import CustomUser
 
@@ -17,10 +18,14 @@ class StorySerializer(serializers.ModelSerializer):
     is_expired = serializers.SerializerMethodField()
     user = SimpleUserSerializer(read_only=True)
     media = serializers.SerializerMethodField()
+    playlist = serializers.SerializerMethodField()
     
     class Meta:
         model = Story
-        fields = ['id', 'user', 'file', 'media', 'media_type', 'duration', 'created_at', 'is_expired']
+        fields = ['id', 'user', 'file', 'media', 'playlist', 'media_type', 'duration', 'created_at', 'is_expired', 'status', 'failure_reason']
+        read_only_fields = ['status', 'failure_reason']
+        # The view takes the file from `media`/`file` or a resumable `upload_id`
+        extra_kwargs = {'file': {'required': False}}
 
     def get_media(self, obj):
         # Return the file URL as media for frontend compatibility
@@ -28,5 +33,34 @@ class StorySerializer(serializers.ModelSerializer):
             return obj.file.url
         return None
 
+    def get_playlist(self, obj):
+        # HLS master playlist once a video is packaged; None for images and
+        # for videos still (or never) packaged, which play from `media`
+        if obj.media_type == 'video' and obj.hls_playlist:
+            return default_storage.url(obj.hls_playlist)
+        return None
+
     def get_is_expired(self, obj):
         return obj.is_expired()
+
+
+class StoryTraySerializer(serializers.ModelSerializer):
+    """
+    One tray entry: an author with active stories, serialized from their
+    latest story (the preview). The view sets story_count and latest_at.
+    """
+    user = SimpleUserSerializer(read_only=True)
+    story_count = serializers.IntegerField(read_only=True)
+    latest_at = serializers.DateTimeField(read_only=True)
+    preview = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Story
+        fields = ['user', 'story_count', 'latest_at', 'preview']
+
+    def get_preview(self, obj):
+        return {
+            'id': obj.id,
+            'media': obj.file.url if obj.file else None,
+            'media_type': obj.media_type,
+        }
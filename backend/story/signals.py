@@ -0,0 +1,12 @@
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .models import Story
+from .processing import delete_hls_files
+
+
+@receiver(post_delete, sender=Story)
+def delete_story_hls(sender, instance, **kwargs):
+    # Segments are plain storage files, not blobs, so they go with the story
+    if instance.hls_playlist:
+        transaction.on_commit(lambda: delete_hls_files(instance.hls_playlist))
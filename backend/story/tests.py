@@ -1,3 +1,376 @@
-from django.test import TestCase
+import json
+import os
+import subprocess
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from accounts.models import Follower
+from .models import Story, StoryVideoJob
+from .processing import run_job
+from .serializers import StorySerializer
+from .video_processor import VideoIngest
 
-# Create your tests here.
+User = get_user_model()
+
+
+def temp_dir(test):
+    """Create a directory that is removed when the test ends."""
+    path = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, path, ignore_errors=True)
+    return path
+
+
+class FakeFFmpeg:
+    """
+    Stands in for subprocess.run: ffprobe reports `durations` in order, ffmpeg
+    writes a stub trimmed file or a stub HLS tree.
+    """
+
+    def __init__(self, *durations, width=1280, height=720, audio=True):
+        self.durations = list(durations)
+        video = {'codec_type': 'video', 'width': width, 'height': height}
+        self.streams = [video] + ([{'codec_type': 'audio'}] if audio else [])
+        self.calls = []
+
+    def __call__(self, cmd, **kwargs):
+        self.calls.append(cmd)
+        if cmd[0] == 'ffprobe':
+            payload = {'format': {'duration': str(self.durations.pop(0))}, 'streams': self.streams}
+            return subprocess.CompletedProcess(cmd, 0, stdout=json.dumps(payload), stderr='')
+        if '-master_pl_name' in cmd:
+            output_dir = os.path.dirname(os.path.dirname(cmd[-1]))
+            os.makedirs(os.path.join(output_dir, 'v0'))
+            for name in ('master.m3u8', 'v0/index.m3u8', 'v0/segment_000.ts'):
+                with open(os.path.join(output_dir, name), 'wb') as output:
+                    output.write(name.encode())
+            return subprocess.CompletedProcess(cmd, 0, stdout='', stderr='')
+        with open(cmd[-1], 'wb') as output:
+            output.write(b'trimmed video')
+        return subprocess.CompletedProcess(cmd, 0, stdout='', stderr='')
+
+    def count(self, program):
+        return sum(1 for cmd in self.calls if cmd[0] == program)
+
+    def hls_command(self):
+        return next(cmd for cmd in self.calls if '-master_pl_name' in cmd)
+
+
+class VideoIngestTest(TestCase):
+    def test_probe_runs_once(self):
+        fake = FakeFFmpeg(95.5)
+        upload = SimpleUploadedFile('clip.mp4', b'video bytes', content_type='video/mp4')
+        with mock.patch('story.video_processor.subprocess.run', fake):
+            with VideoIngest(upload) as video:
+                self.assertTrue(video.is_valid)
+                self.assertEqual(video.duration, 95.5)
+                self.assertTrue(video.needs_trim())
+                self.assertEqual(len(video.video_streams), 1)
+                path = video.local_path()
+        self.assertEqual(fake.count('ffprobe'), 1)
+
+        # The spooled copy is removed on exit
+        self.assertFalse(os.path.exists(path))
+
+    def test_on_disk_upload_is_not_copied(self):
+        with tempfile.NamedTemporaryFile(suffix='.mp4') as temp_file:
+            upload = mock.Mock(spec=['name', 'temporary_file_path', 'chunks'])
+            upload.name = 'clip.mp4'
+            upload.temporary_file_path.return_value = temp_file.name
+            with mock.patch('story.video_processor.subprocess.run', FakeFFmpeg(10)):
+                with VideoIngest(upload) as video:
+                    self.assertEqual(video.local_path(), temp_file.name)
+                    self.assertFalse(video.needs_trim())
+            upload.chunks.assert_not_called()
+            # Files the ingest did not create are left alone
+            self.assertTrue(os.path.exists(temp_file.name))
+
+    @override_settings(STORY_HLS_LEVELS=[
+        {'height': 720, 'video_bitrate': '2800k', 'audio_bitrate': '128k'},
+        {'height': 360, 'video_bitrate': '800k', 'audio_bitrate': '96k'},
+        {'height': 540, 'video_bitrate': '1400k', 'audio_bitrate': '128k'},
+    ])
+    def test_hls_levels_never_upscale(self):
+        fake = FakeFFmpeg(10, width=960, height=540, audio=False)
+        levels = self.package(fake)
+        self.assertEqual([level['height'] for level in levels], [360, 540])
+        cmd = fake.hls_command()
+        self.assertIn('[v0]scale=-2:360[v0out];[v1]scale=-2:540[v1out]', cmd[cmd.index('-filter_complex') + 1])
+        self.assertEqual(cmd[cmd.index('-var_stream_map') + 1], 'v:0 v:1')
+        self.assertNotIn('0:a:0', cmd)
+        self.assertEqual(fake.count('ffprobe'), 1)
+
+    @override_settings(STORY_HLS_LEVELS=[
+        {'height': 360, 'video_bitrate': '800k', 'audio_bitrate': '96k'},
+        {'height': 720, 'video_bitrate': '2800k', 'audio_bitrate': '128k'},
+    ])
+    def test_hls_levels_scale_the_short_side_of_portrait_video(self):
+        fake = FakeFFmpeg(10, width=1080, height=1920)
+        self.assertEqual([level['height'] for level in self.package(fake)], [360, 720])
+        cmd = fake.hls_command()
+        self.assertIn('[v0]scale=360:-2[v0out];[v1]scale=720:-2[v1out]', cmd[cmd.index('-filter_complex') + 1])
+
+        # Rotation metadata turns a landscape-coded stream into portrait playback
+        fake = FakeFFmpeg(10, width=1920, height=1080)
+        fake.streams[0]['side_data_list'] = [{'rotation': -90}]
+        self.package(fake)
+        cmd = fake.hls_command()
+        self.assertIn('[v1]scale=720:-2[v1out]', cmd[cmd.index('-filter_complex') + 1])
+
+    @override_settings(STORY_HLS_LEVELS=[
+        {'height': 540, 'video_bitrate': '1400k', 'audio_bitrate': '128k'},
+        {'height': 360, 'video_bitrate': '800k', 'audio_bitrate': '96k'},
+    ])
+    def test_source_below_every_level_keeps_its_own_size(self):
+        fake = FakeFFmpeg(10, width=426, height=240)
+        levels = self.package(fake)
+        self.assertEqual(levels, [{'height': 240, 'video_bitrate': '800k', 'audio_bitrate': '96k'}])
+        cmd = fake.hls_command()
+        self.assertIn('[v0]scale=-2:240[v0out]', cmd[cmd.index('-filter_complex') + 1])
+
+    def package(self, fake):
+        upload = SimpleUploadedFile('clip.mp4', b'video bytes', content_type='video/mp4')
+        with mock.patch('story.video_processor.subprocess.run', fake):
+            with VideoIngest(upload) as video, tempfile.TemporaryDirectory() as output_dir:
+                return video.package_hls(output_dir, settings.STORY_HLS_LEVELS, 4)
+
+    def test_failed_probe_is_invalid(self):
+        def run(cmd, **kwargs):
+            raise subprocess.CalledProcessError(1, cmd)
+        upload = SimpleUploadedFile('clip.mp4', b'not a video', content_type='video/mp4')
+        with mock.patch('story.video_processor.subprocess.run', run):
+            with VideoIngest(upload) as video:
+                self.assertFalse(video.is_valid)
+                self.assertEqual(video.duration, 0)
+
+
+class StoryVideoProcessingTest(APITestCase):
+    def setUp(self):
+        self.enterContext(override_settings(MEDIA_ROOT=temp_dir(self)))
+        self.user = User.objects.create_user(username='storyteller', email='story@test.com', password='testpass123')
+        self.client.force_authenticate(self.user)
+
+    def post_video(self):
+        upload = SimpleUploadedFile('clip.mp4', b'original video', content_type='video/mp4')
+        with mock.patch('story.processing.workers.submit') as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/stories/create/', {'media': upload}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        job = StoryVideoJob.objects.get(story_id=response.data['id'])
+        submit.assert_called_once_with('story-video', settings.STORY_VIDEO_WORKERS, run_job, job.id)
+        return job
+
+    def active_story_ids(self):
+        return [story['id'] for story in self.client.get('/api/stories/').data['results']]
+
+    def test_upload_returns_before_processing(self):
+        with mock.patch('story.video_processor.subprocess.run') as run:
+            job = self.post_video()
+        run.assert_not_called()
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(job.story.status, 'processing')
+        self.assertEqual(self.active_story_ids(), [])
+
+    def test_long_video_trimmed_then_ready(self):
+        job = self.post_video()
+        # One probe of the upload, one of the trimmed copy
+        fake = FakeFFmpeg(120, 60)
+        with mock.patch('story.video_processor.subprocess.run', fake):
+            self.assertTrue(run_job(job.id))
+        self.assertEqual(fake.count('ffprobe'), 2)
+        # Trim, then HLS packaging of the trimmed copy
+        self.assertEqual(fake.count('ffmpeg'), 2)
+
+        job.refresh_from_db()
+        story = job.story
+        story.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('done', 1))
+        self.assertEqual(story.status, 'ready')
+        self.assertTrue(story.is_trimmed)
+        with story.file.open('rb') as f:
+            self.assertEqual(f.read(), b'trimmed video')
+        self.assertEqual(self.active_story_ids(), [story.id])
+
+        # A job only runs once
+        self.assertFalse(run_job(job.id))
+
+    def test_short_video_kept_as_is(self):
+        job = self.post_video()
+        fake = FakeFFmpeg(30)
+        with mock.patch('story.video_processor.subprocess.run', fake):
+            run_job(job.id)
+        # Only HLS packaging
+        self.assertEqual(fake.count('ffmpeg'), 1)
+
+        story = Story.objects.get()
+        self.assertEqual(story.status, 'ready')
+        self.assertFalse(story.is_trimmed)
+        with story.file.open('rb') as f:
+            self.assertEqual(f.read(), b'original video')
+
+    def test_invalid_video_fails_with_reason(self):
+        job = self.post_video()
+
+        def run(cmd, **kwargs):
+            raise subprocess.CalledProcessError(1, cmd)
+        with mock.patch('story.video_processor.subprocess.run', run):
+            run_job(job.id)
+
+        job.refresh_from_db()
+        story = Story.objects.get()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual((story.status, story.failure_reason), ('failed', 'Invalid video file'))
+        self.assertEqual(self.active_story_ids(), [])
+
+        out = StringIO()
+        with mock.patch('story.video_processor.subprocess.run', FakeFFmpeg(30)):
+            call_command('process_story_videos', '--retry-failed', stdout=out)
+        self.assertIn('Processed 1 story videos, 0 failed', out.getvalue())
+        self.assertEqual(self.active_story_ids(), [story.id])
+
+    def test_backlog_is_admin_only(self):
+        self.post_video()
+        self.assertEqual(self.client.get('/api/stories/processing/').status_code, 403)
+
+        admin = User.objects.create_user(username='ops', email='ops@test.com', password='testpass123', is_staff=True)
+        self.client.force_authenticate(admin)
+        response = self.client.get('/api/stories/processing/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['queued'], response.data['running']), (1, 0))
+        self.assertIsNotNone(response.data['oldest_queued_seconds'])
+
+
+    def test_playlist_is_empty_until_packaged(self):
+        job = self.post_video()
+        story = Story.objects.get()
+        self.assertIsNone(StorySerializer(story).data['playlist'])
+
+        with mock.patch('story.video_processor.subprocess.run', FakeFFmpeg(30)):
+            run_job(job.id)
+        story.refresh_from_db()
+        self.assertTrue(story.hls_playlist.endswith('/master.m3u8'))
+        self.assertEqual(StorySerializer(story).data['playlist'], default_storage.url(story.hls_playlist))
+        segment = story.hls_playlist.replace('master.m3u8', 'v0/segment_000.ts')
+        self.assertTrue(default_storage.exists(segment))
+
+        # Packaged files go with the story
+        with self.captureOnCommitCallbacks(execute=True):
+            story.delete()
+        self.assertFalse(default_storage.exists(story.hls_playlist))
+        self.assertFalse(default_storage.exists(segment))
+
+    def test_failed_packaging_keeps_mp4(self):
+        job = self.post_video()
+        fake = FakeFFmpeg(30)
+
+        def run(cmd, **kwargs):
+            if '-master_pl_name' in cmd:
+                raise subprocess.CalledProcessError(1, cmd, stderr='encoder error')
+            return fake(cmd, **kwargs)
+        with mock.patch('story.video_processor.subprocess.run', run):
+            run_job(job.id)
+
+        story = Story.objects.get()
+        self.assertEqual((story.status, story.hls_playlist), ('ready', ''))
+        data = StorySerializer(story).data
+        self.assertEqual((data['playlist'], data['media']), (None, story.file.url))
+
+class StoryExpiryTest(APITestCase):
+    def setUp(self):
+        self.enterContext(override_settings(MEDIA_ROOT=temp_dir(self)))
+        self.user = User.objects.create_user(username='storyteller', email='story@test.com', password='testpass123')
+        self.other = User.objects.create_user(username='friend', email='friend@test.com', password='testpass123')
+
+    def create_story(self, user, content, **fields):
+        upload = SimpleUploadedFile('photo.png', content, content_type='image/png')
+        return Story.objects.create(user=user, file=upload, **fields)
+
+    def test_image_stories_have_no_playlist(self):
+        story = self.create_story(self.user, b'photo')
+        self.assertEqual(story.media_type, 'image')
+        self.assertIsNone(StorySerializer(story).data['playlist'])
+
+    def test_listing_is_one_query_and_skips_expired(self):
+        live = self.create_story(self.user, b'live')
+        other = self.create_story(self.other, b'other')
+        self.create_story(self.user, b'expired', expires_at=timezone.now() - timedelta(minutes=1))
+        self.create_story(self.user, b'processing', status='processing')
+
+        # One count and one page query, however many authors are on the page
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/stories/')
+        self.assertEqual([story['id'] for story in response.data['results']], [other.id, live.id])
+
+    def test_reaper_deletes_expired_and_orphaned(self):
+        live = self.create_story(self.user, b'live')
+        expired = self.create_story(self.user, b'expired', expires_at=timezone.now() - timedelta(minutes=1))
+        orphan = self.create_story(self.other, b'orphan')
+        Story.objects.create(user=self.other)
+        expired_path = expired.file.path
+        os.unlink(orphan.file.path)
+
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            with mock.patch('story.models.Story.file_exists', autospec=True, side_effect=Story.file_exists) as stat:
+                call_command('reap_stories', '--batch-size', '1', stdout=out)
+        # Only live stories with a file are looked up on disk
+        self.assertEqual(sorted(call.args[0].id for call in stat.call_args_list), [live.id, orphan.id])
+        self.assertIn('Deleted 1 expired and 2 orphaned stories', out.getvalue())
+        self.assertEqual(list(Story.objects.values_list('id', flat=True)), [live.id])
+        self.assertFalse(os.path.exists(expired_path))
+        self.assertTrue(live.file_exists())
+
+
+class StoryTrayTest(APITestCase):
+    def setUp(self):
+        self.enterContext(override_settings(MEDIA_ROOT=temp_dir(self)))
+        cache.clear()
+        self.viewer = User.objects.create_user(username='viewer', email='viewer@test.com', password='testpass123')
+        self.first = User.objects.create_user(username='first', email='first@test.com', password='testpass123')
+        self.second = User.objects.create_user(username='second', email='second@test.com', password='testpass123')
+        self.stranger = User.objects.create_user(username='stranger', email='stranger@test.com', password='testpass123')
+        Follower.objects.create(user=self.viewer, followed_user=self.first)
+        Follower.objects.create(user=self.viewer, followed_user=self.second)
+        self.client.force_authenticate(self.viewer)
+
+    def create_story(self, user, content, **fields):
+        upload = SimpleUploadedFile('photo.png', content, content_type='image/png')
+        return Story.objects.create(user=user, file=upload, **fields)
+
+    def test_one_entry_per_followed_author(self):
+        self.create_story(self.first, b'first 1')
+        self.create_story(self.second, b'second 1')
+        latest = self.create_story(self.first, b'first 2')
+        self.create_story(self.first, b'expired', expires_at=timezone.now() - timedelta(minutes=1))
+        self.create_story(self.stranger, b'stranger')
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/stories/tray/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(entry['user']['username'], entry['story_count']) for entry in response.data],
+            [('first', 2), ('second', 1)],
+        )
+        self.assertEqual(response.data[0]['preview']['id'], latest.id)
+        self.assertEqual(response.data[0]['latest_at'], latest.created_at.isoformat().replace('+00:00', 'Z'))
+
+    def test_tray_is_cached_per_viewer(self):
+        self.create_story(self.first, b'first 1')
+        self.client.get('/api/stories/tray/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/stories/tray/')
+        self.assertEqual(len(response.data), 1)
+
+        # Another viewer gets their own tray
+        self.client.force_authenticate(self.stranger)
+        self.assertEqual(self.client.get('/api/stories/tray/').data, [])
@@ -1,8 +1,10 @@
 from django.urls import path
-from .views import ActiveStoryListView, StoryCreateView, StoryDeleteView
+from .views import ActiveStoryListView, StoryCreateView, StoryDeleteView, StoryTrayView, StoryVideoBacklogView
 
 urlpatterns = [
     path('', ActiveStoryListView.as_view(), name='active-stories'),
+    path('tray/', StoryTrayView.as_view(), name='story-tray'),
     path('create/', StoryCreateView.as_view(), name='create-story'),
     path('<int:pk>/delete/', StoryDeleteView.as_view(), name='delete-story'),
+    path('processing/', StoryVideoBacklogView.as_view(), name='story-video-backlog'),
 ]
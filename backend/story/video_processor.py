@@ -1,210 +1,287 @@
 import os
+import json
 import tempfile
 import subprocess
 import logging
 from django.core.files import File
-from django.core.files.temp import NamedTemporaryFile
-from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
-def trim_video_to_60_seconds(video_file):
+# Stories play for at most this many seconds
+MAX_STORY_SECONDS = 60
+
+
+class VideoIngest:
     """
-    Trim video file to first 60 seconds using FFmpeg
-    Returns a File object with the trimmed video
+    One uploaded video, put on disk once and probed once.
+
+    Uploads that already live on disk (large multipart uploads, resumable
+    upload sessions) are used in place; anything else is spooled to a single
+    temp file. `ffprobe` runs at most once per file and its format, streams and
+    duration are reused for validation, the trim decision and trimming. A
+    trimmed copy is another VideoIngest, so its final check is its own single
+    probe. Use it as a context manager; temp files are removed on exit.
     """
-    temp_input_path = None
-    temp_output_path = None
-    
-    try:
-        # Create a temporary file for the input
-        with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as temp_input:
-            for chunk in video_file.chunks():
-                temp_input.write(chunk)
-            temp_input_path = temp_input.name
-        
-        # Create a temporary file for the output
-        with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as temp_output:
-            temp_output_path = temp_output.name
-        
-        # First try: Use copy codecs (faster, no re-encoding)
-        try:
-            cmd = [
-                'ffmpeg', '-i', temp_input_path,
-                '-t', '60',  # Duration limit
-                '-c', 'copy',  # Copy codecs (faster)
-                '-avoid_negative_ts', 'make_zero',  # Handle negative timestamps
-                '-y',  # Overwrite output
-                temp_output_path
-            ]
-            result = subprocess.run(cmd, check=True, capture_output=True, text=True)
-            logger.info(f"Video trimmed successfully using copy codecs")
-            
-        except subprocess.CalledProcessError as e:
-            logger.warning(f"Copy codecs failed: {e.stderr}, trying re-encode")
-            
-            # Second try: Re-encode with specific codecs
+
+    def __init__(self, video_file=None, path=None, owns_path=True):
+        self.video_file = video_file
+        self.path = path
+        # A `path` handed in is deleted on exit unless owns_path is False
+        self.owns_path = path is not None and owns_path
+        self._probe = None
+        self.probed = False
+        self.derived = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+
+    def cleanup(self):
+        for ingest in self.derived:
+            ingest.cleanup()
+        if self.owns_path and self.path and os.path.exists(self.path):
             try:
-                cmd = [
-                    'ffmpeg', '-i', temp_input_path,
-                    '-t', '60',  # Duration limit
-                    '-c:v', 'libx264',  # Video codec
-                    '-c:a', 'aac',  # Audio codec
-                    '-preset', 'fast',  # Faster encoding
-                    '-crf', '23',  # Good quality
-                    '-avoid_negative_ts', 'make_zero',
-                    '-y',  # Overwrite output
-                    temp_output_path
-                ]
-                subprocess.run(cmd, check=True, capture_output=True, text=True)
-                logger.info(f"Video trimmed successfully using re-encode")
-                
-            except subprocess.CalledProcessError as e:
-                logger.error(f"Re-encode also failed: {e.stderr}")
-                raise Exception(f"Failed to trim video: {e.stderr}")
-        
-        # Verify the output file exists and has content
-        if not os.path.exists(temp_output_path) or os.path.getsize(temp_output_path) == 0:
-            raise Exception("Trimmed video file is empty or doesn't exist")
-        
-        # Verify the video file is valid using ffprobe
-        try:
-            verify_cmd = [
+                os.unlink(self.path)
+            except OSError as e:
+                logger.warning(f"Failed to delete temp video file: {e}")
+        self.path = None
+
+    def local_path(self):
+        if self.path is None:
+            if hasattr(self.video_file, 'temporary_file_path'):
+                self.path = self.video_file.temporary_file_path()
+            else:
+                suffix = os.path.splitext(self.video_file.name)[1] or '.mp4'
+                with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as temp_file:
+                    self.owns_path = True
+                    self.path = temp_file.name
+                    for chunk in self.video_file.chunks():
+                        temp_file.write(chunk)
+        return self.path
+
+    @property
+    def probe(self):
+        """ffprobe's format and streams, or None if ffprobe rejects the file."""
+        if not self.probed:
+            self.probed = True
+            cmd = [
                 'ffprobe', '-v', 'quiet',
                 '-print_format', 'json',
                 '-show_format',
                 '-show_streams',
-                temp_output_path
+                self.local_path(),
             ]
-            verify_result = subprocess.run(verify_cmd, capture_output=True, text=True, check=True)
-            logger.info(f"Video file verified successfully")
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Video file verification failed: {e.stderr}")
-            raise Exception("Trimmed video file is corrupted")
-        
-        # Read the trimmed video and create a File object
-        with open(temp_output_path, 'rb') as f:
-            trimmed_file = File(f, name=video_file.name)
-        
-        return trimmed_file
-        
-    except Exception as e:
-        logger.error(f"Error trimming video: {e}")
-        # Return original file if trimming fails
-        return video_file
-        
-    finally:
-        # Clean up temporary files
-        if temp_input_path and os.path.exists(temp_input_path):
             try:
-                os.unlink(temp_input_path)
-            except Exception as e:
-                logger.warning(f"Failed to delete temp input file: {e}")
-        
-        if temp_output_path and os.path.exists(temp_output_path):
+                result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+                self._probe = json.loads(result.stdout)
+            except (OSError, subprocess.CalledProcessError, ValueError) as e:
+                logger.error(f"Video probe failed: {e}")
+                self._probe = None
+        return self._probe
+
+    @property
+    def is_valid(self):
+        return self.probe is not None and 'format' in self.probe
+
+    @property
+    def duration(self):
+        try:
+            return float(self.probe['format']['duration'])
+        except (TypeError, KeyError, ValueError):
+            return 0
+
+    @property
+    def video_streams(self):
+        return [s for s in (self.probe or {}).get('streams', []) if s.get('codec_type') == 'video']
+
+    def needs_trim(self, limit=MAX_STORY_SECONDS):
+        return self.duration > limit
+
+    def trim(self, limit=MAX_STORY_SECONDS):
+        """Trim to the first `limit` seconds; returns the trimmed VideoIngest or None."""
+        with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as temp_output:
+            output = VideoIngest(path=temp_output.name)
+        self.derived.append(output)
+        base = ['ffmpeg', '-i', self.local_path(), '-t', str(limit)]
+        tail = ['-avoid_negative_ts', 'make_zero', '-y', output.path]
+
+        # First try: Use copy codecs (faster, no re-encoding)
+        try:
+            subprocess.run(base + ['-c', 'copy'] + tail, check=True, capture_output=True, text=True)
+            logger.info("Video trimmed successfully using copy codecs")
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.warning(f"Copy codecs failed: {getattr(e, 'stderr', e)}, trying re-encode")
+            # Second try: Re-encode with specific codecs
             try:
-                os.unlink(temp_output_path)
-            except Exception as e:
-                logger.warning(f"Failed to delete temp output file: {e}")
+                subprocess.run(
+                    base + ['-c:v', 'libx264', '-c:a', 'aac', '-preset', 'fast', '-crf', '23'] + tail,
+                    check=True, capture_output=True, text=True,
+                )
+                logger.info("Video trimmed successfully using re-encode")
+            except (OSError, subprocess.CalledProcessError) as e:
+                logger.error(f"Re-encode also failed: {getattr(e, 'stderr', e)}")
+                return None
+
+        if not os.path.exists(output.path) or os.path.getsize(output.path) == 0:
+            logger.error("Trimmed video file is empty or doesn't exist")
+            return None
+        return output
+
+    @property
+    def has_audio(self):
+        return any(s.get('codec_type') == 'audio' for s in (self.probe or {}).get('streams', []))
+
+    @property
+    def dimensions(self):
+        """(width, height) as played, after any rotation the stream asks for."""
+        streams = self.video_streams
+        if not streams:
+            return 0, 0
+        stream = streams[0]
+        width, height = int(stream.get('width') or 0), int(stream.get('height') or 0)
+        rotation = stream.get('tags', {}).get('rotate') or next(
+            (side['rotation'] for side in stream.get('side_data_list', []) if 'rotation' in side), 0
+        )
+        if int(float(rotation)) % 180:
+            return height, width
+        return width, height
+
+    @property
+    def short_side(self):
+        return min(self.dimensions)
+
+    @property
+    def is_portrait(self):
+        width, height = self.dimensions
+        return height > width
+
+    def hls_levels(self, levels):
+        """
+        The configured levels that do not upscale the source. A level's height
+        is its short side, so a 1080x1920 portrait clip gets the 720 level at
+        720 wide. A source below every level keeps one rendition at its own
+        size (rounded down to even for libx264), with the smallest level's
+        bitrates.
+        """
+        levels = sorted(levels, key=lambda level: level['height'])
+        short_side = self.short_side
+        if not short_side:
+            return levels
+        kept = [level for level in levels if level['height'] <= short_side]
+        return kept or [{**levels[0], 'height': short_side - short_side % 2}]
+
+    def package_hls(self, output_dir, levels, segment_seconds):
+        """
+        Segment into HLS under output_dir with one libx264/aac rendition per
+        level: master.m3u8 plus v<n>/index.m3u8 and its .ts segments. Keyframes
+        are forced every segment_seconds so all renditions switch cleanly.
+        Returns the levels written, or None if ffmpeg failed.
+        """
+        levels = self.hls_levels(levels)
+        count = len(levels)
+        split = f"[0:v]split={count}" + ''.join(f'[v{i}]' for i in range(count))
+        # Scale the short side to the level; -2 keeps the long side even and in ratio
+        size = '{}:-2' if self.is_portrait else '-2:{}'
+        scales = [f'[v{i}]scale={size.format(level["height"])}[v{i}out]' for i, level in enumerate(levels)]
+        cmd = ['ffmpeg', '-i', self.local_path(), '-filter_complex', ';'.join([split] + scales)]
+        stream_map = []
+        for i, level in enumerate(levels):
+            cmd += [
+                '-map', f'[v{i}out]',
+                f'-c:v:{i}', 'libx264',
+                f'-b:v:{i}', level['video_bitrate'],
+                f'-maxrate:v:{i}', level['video_bitrate'],
+                f'-bufsize:v:{i}', level['video_bitrate'],
+            ]
+            if self.has_audio:
+                cmd += ['-map', '0:a:0', f'-c:a:{i}', 'aac', f'-b:a:{i}', level['audio_bitrate']]
+                stream_map.append(f'v:{i},a:{i}')
+            else:
+                stream_map.append(f'v:{i}')
+        cmd += [
+            '-preset', 'veryfast',
+            '-sc_threshold', '0',
+            '-force_key_frames', f'expr:gte(t,n_forced*{segment_seconds})',
+            '-f', 'hls',
+            '-hls_time', str(segment_seconds),
+            '-hls_playlist_type', 'vod',
+            '-hls_segment_filename', os.path.join(output_dir, 'v%v', 'segment_%03d.ts'),
+            '-master_pl_name', 'master.m3u8',
+            '-var_stream_map', ' '.join(stream_map),
+            '-y', os.path.join(output_dir, 'v%v', 'index.m3u8'),
+        ]
+        try:
+            subprocess.run(cmd, check=True, capture_output=True, text=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.error(f"HLS packaging failed: {getattr(e, 'stderr', e)}")
+            return None
+        if not os.path.exists(os.path.join(output_dir, 'master.m3u8')):
+            logger.error("HLS packaging wrote no master playlist")
+            return None
+        return levels
+
+    def open(self, name):
+        """A File over this video for storage; close it once it is saved."""
+        return File(open(self.local_path(), 'rb'), name=os.path.basename(name))
+
+
+def trim_video_to_60_seconds(video_file):
+    """
+    Trim video file to first 60 seconds using FFmpeg
+    Returns a File object with the trimmed video, or the original on failure
+    """
+    with VideoIngest(video_file) as video:
+        trimmed = video.trim()
+        if trimmed is None or not trimmed.is_valid:
+            return video_file
+        trimmed_file = trimmed.open(video_file.name)
+        # The open handle keeps the data readable after the temp file is removed
+        return trimmed_file
+
 
 def get_video_duration(video_file):
     """
     Get video duration using FFmpeg
     Returns duration in seconds
     """
-    temp_path = None
-    
-    try:
-        # Create a temporary file
-        with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as temp_file:
-            for chunk in video_file.chunks():
-                temp_file.write(chunk)
-            temp_path = temp_file.name
-        
-        # Get video duration using FFmpeg
-        cmd = [
-            'ffprobe', '-v', 'quiet',
-            '-show_entries', 'format=duration',
-            '-of', 'csv=p=0',
-            temp_path
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        duration = float(result.stdout.strip())
-        
-        return duration
-        
-    except Exception as e:
-        logger.error(f"Error getting video duration: {e}")
-        return 0
-        
-    finally:
-        # Clean up
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.unlink(temp_path)
-            except Exception as e:
-                logger.warning(f"Failed to delete temp duration file: {e}")
+    with VideoIngest(video_file) as video:
+        return video.duration
+
 
 def should_trim_video(video_file):
     """
     Check if video should be trimmed (longer than 60 seconds)
     """
-    duration = get_video_duration(video_file)
-    return duration > 60
+    return get_video_duration(video_file) > MAX_STORY_SECONDS
+
 
 def is_video_file(file):
     """
     Check if uploaded file is a video
     """
     video_extensions = ['.mp4', '.avi', '.mov', '.wmv', '.flv', '.webm', '.mkv']
-    video_mime_types = ['video/mp4', 'video/avi', 'video/quicktime', 'video/x-ms-wmv', 
+    video_mime_types = ['video/mp4', 'video/avi', 'video/quicktime', 'video/x-ms-wmv',
                        'video/x-flv', 'video/webm', 'video/x-matroska']
-    
+
     # Check file extension
     file_name = file.name.lower()
     if any(file_name.endswith(ext) for ext in video_extensions):
         return True
-    
+
     # Check MIME type
     if hasattr(file, 'content_type') and file.content_type:
         if any(mime_type in file.content_type.lower() for mime_type in video_mime_types):
             return True
-    
+
     return False
 
+
 def validate_video_file(video_file):
     """
     Validate video file using ffprobe
     Returns True if valid, False otherwise
     """
-    temp_path = None
-    
-    try:
-        # Create a temporary file
-        with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as temp_file:
-            for chunk in video_file.chunks():
-                temp_file.write(chunk)
-            temp_path = temp_file.name
-        
-        # Validate using ffprobe
-        cmd = [
-            'ffprobe', '-v', 'quiet',
-            '-print_format', 'json',
-            '-show_format',
-            temp_path
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        
-        return True
-        
-    except Exception as e:
-        logger.error(f"Video file validation failed: {e}")
-        return False
-        
-    finally:
-        # Clean up
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.unlink(temp_path)
-            except Exception as e:
-                logger.warning(f"Failed to delete temp validation file: {e}") 
\ No newline at end of file
+    with VideoIngest(video_file) as video:
+        return video.is_valid
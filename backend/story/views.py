@@ -1,10 +1,17 @@
-from rest_framework import generics, permissions, status
+from rest_framework import generics, permissions
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework.exceptions import ValidationError
 from .models import Story
-from .serializers import StorySerializer
-from .video_processor import trim_video_to_60_seconds, is_video_file, should_trim_video, validate_video_file
+from .serializers import StorySerializer, StoryTraySerializer
+from accounts.models import Follower
+from uploads.models import UploadSession
+from .processing import backlog, enqueue_story_video
+from .video_processor import is_video_file
 from django.utils import timezone
-from django.db.models import Q
+from django.core.cache import cache
+from django.conf import settings
+from django.db.models import Count, Max
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,111 +21,105 @@ class ActiveStoryListView(generics.ListAPIView):
     permission_classes = [permissions.AllowAny]
 
     def get_queryset(self):
-        time_limit = timezone.now() - timezone.timedelta(hours=24)
-        stories = Story.objects.filter(created_at__gte=time_limit).order_by('-created_at')
-        
-        # Filter out stories with missing files
-        valid_stories = []
-        for story in stories:
-            if story.file and story.file_exists():
-                valid_stories.append(story)
-            else:
-                # Delete orphaned story entries
-                story.delete()
-        
-        return Story.objects.filter(id__in=[s.id for s in valid_stories]).order_by('-created_at')
+        # One indexed query; expired and orphaned stories are removed by reap_stories
+        return (
+            Story.objects.filter(expires_at__gt=timezone.now(), status='ready')
+            .select_related('user__myprofile')
+            .order_by('-created_at')
+        )
 
 
+
+class StoryTrayView(APIView):
+    """
+    The story tray: one entry per followed author with active stories, most
+    recent first. Two queries whatever the number of authors, cached per
+    viewer for STORY_TRAY_CACHE_TTL seconds.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        cache_key = f'story_tray_{request.user.id}'
+        cached_data = cache.get(cache_key)
+        if cached_data is not None:
+            return Response(cached_data)
+
+        authors = list(
+            Story.objects.filter(
+                user__in=Follower.objects.filter(user=request.user).values('followed_user'),
+                expires_at__gt=timezone.now(),
+                status='ready',
+            )
+            .values('user')
+            .annotate(story_count=Count('id'), latest_at=Max('created_at'), latest_id=Max('id'))
+            .order_by('-latest_at')[:settings.STORY_TRAY_LIMIT]
+        )
+        previews = Story.objects.select_related('user__myprofile').in_bulk([a['latest_id'] for a in authors])
+        entries = []
+        for author in authors:
+            story = previews.get(author['latest_id'])
+            if story is None:
+                # Reaped between the two queries
+                continue
+            story.story_count = author['story_count']
+            story.latest_at = author['latest_at']
+            entries.append(story)
+
+        data = StoryTraySerializer(entries, many=True, context={'request': request}).data
+        cache.set(cache_key, data, timeout=settings.STORY_TRAY_CACHE_TTL)
+        return Response(data)
+
 class StoryCreateView(generics.CreateAPIView):
     serializer_class = StorySerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_upload(self):
+        """
+        The story file: a multipart `media`/`file` field, or the id of a
+        finalized resumable upload session in `upload_id`.
+        """
+        file = self.request.FILES.get('media') or self.request.FILES.get('file')
+        if file:
+            return file, None
+        upload_id = self.request.data.get('upload_id')
+        if upload_id:
+            session = UploadSession.claim(self.request.user, [upload_id])[0]
+            return session.as_uploaded_file(), session
+        raise ValidationError({'file': 'No file provided'})
+
     def perform_create(self, serializer):
+        file, session = self.get_upload()
         try:
-            # Get the file from request
-            file = self.request.FILES.get('media') or self.request.FILES.get('file')
-            
-            if not file:
-                raise ValueError("No file provided")
-            
-            # Check if it's a video file
-            if is_video_file(file):
-                logger.info(f"Processing video file: {file.name}")
-                
-                # Validate video file first
-                if not validate_video_file(file):
-                    logger.error(f"Invalid video file: {file.name}")
-                    raise ValueError("Invalid video file")
-                
-                # Check if video needs trimming
-                if should_trim_video(file):
-                    logger.info(f"Video {file.name} is longer than 60 seconds, trimming...")
-                    
-                    # Trim video to 60 seconds
-                    trimmed_file = trim_video_to_60_seconds(file)
-                    
-                    # Validate trimmed file
-                    if not validate_video_file(trimmed_file):
-                        logger.error(f"Trimmed video file is invalid: {file.name}")
-                        # Use original file if trimmed file is invalid
-                        serializer.save(
-                            user=self.request.user,
-                            file=file,
-                            media_type='video',
-                            duration=60,
-                            is_trimmed=False
-                        )
-                    else:
-                        # Save with trimmed file
-                        serializer.save(
-                            user=self.request.user,
-                            file=trimmed_file,
-                            media_type='video',
-                            duration=60,
-                            is_trimmed=True
-                        )
-                        logger.info(f"Video {file.name} trimmed and saved successfully")
-                    
-                else:
-                    logger.info(f"Video {file.name} is already 60 seconds or less, saving as-is")
-                    # Video is already 60 seconds or less, save as-is
-                    serializer.save(
-                        user=self.request.user,
-                        file=file,
-                        media_type='video',
-                        duration=60,
-                        is_trimmed=False
-                    )
-            else:
-                # For images, save as-is
-                logger.info(f"Processing image file: {file.name}")
-                serializer.save(
-                    user=self.request.user,
-                    file=file,
-                    media_type='image',
-                    duration=60,
-                    is_trimmed=False
-                )
-                
-        except Exception as e:
-            logger.error(f"Error creating story: {e}")
-            # If any error occurs, try to save with original file
-            try:
-                file = self.request.FILES.get('media') or self.request.FILES.get('file')
-                if file:
-                    serializer.save(
-                        user=self.request.user,
-                        file=file,
-                        media_type='video' if is_video_file(file) else 'image',
-                        duration=60,
-                        is_trimmed=False
-                    )
-                else:
-                    raise e
-            except Exception as fallback_error:
-                logger.error(f"Fallback save also failed: {fallback_error}")
-                raise e
+            self.save_story(serializer, file)
+        finally:
+            if session is not None:
+                file.close()
+        if session is not None:
+            session.discard()
 
+    def save_story(self, serializer, file):
+        if is_video_file(file):
+            # Validation and trimming run in story.processing; until then the story is hidden
+            logger.info(f"Queueing video file for processing: {file.name}")
+            story = serializer.save(
+                user=self.request.user,
+                file=file,
+                media_type='video',
+                duration=60,
+                is_trimmed=False,
+                status='processing'
+            )
+            enqueue_story_video(story)
+        else:
+            # For images, save as-is
+            logger.info(f"Processing image file: {file.name}")
+            serializer.save(
+                user=self.request.user,
+                file=file,
+                media_type='image',
+                duration=60,
+                is_trimmed=False
+            )
 
 class StoryDeleteView(generics.DestroyAPIView):
     queryset = Story.objects.all()
@@ -126,4 +127,12 @@ class StoryDeleteView(generics.DestroyAPIView):
 
     def get_queryset(self):
         # المستخدم يقدر يحذف ستوريه بس
-        return super().get_queryset().filter(user=self.request.user)
\ No newline at end of file
+        return super().get_queryset().filter(user=self.request.user)
+
+
+class StoryVideoBacklogView(APIView):
+    """Story video jobs by status, for watching the processing backlog."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(backlog())
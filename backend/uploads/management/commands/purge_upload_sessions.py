@@ -0,0 +1,17 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from uploads.models import UploadSession
+
+
+class Command(BaseCommand):
+    help = 'Delete upload sessions (and their partial files) untouched for CHUNKED_UPLOAD_EXPIRY_HOURS'
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=settings.CHUNKED_UPLOAD_EXPIRY_HOURS)
+        purged = 0
+        for session in UploadSession.objects.filter(updated_at__lt=cutoff).iterator(chunk_size=500):
+            session.discard()
+            purged += 1
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} stale upload sessions.'))
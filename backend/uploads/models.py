@@ -0,0 +1,69 @@
+import os
+import uuid
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import models
+from rest_framework import serializers
+
+
+class SessionUploadedFile(UploadedFile):
+    """An assembled session file; exposes its path so nothing reads it into memory."""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+class UploadSession(models.Model):
+    """A resumable upload: chunks are appended to a .part file until it is complete."""
+    STATUS_CHOICES = (
+        ('active', 'Active'),
+        ('complete', 'Complete'),
+    )
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    total_size = models.BigIntegerField()
+    received_bytes = models.BigIntegerField(default=0) # type: ignore
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='active')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received_bytes}/{self.total_size})"
+
+    @property
+    def path(self):
+        return os.path.join(settings.CHUNKED_UPLOAD_DIR, f'{self.id}.part')
+
+    def as_uploaded_file(self):
+        """Open the assembled file the way Django hands over a multipart upload."""
+        return SessionUploadedFile(
+            open(self.path, 'rb'),
+            name=self.filename,
+            content_type=self.content_type or None,
+            size=self.total_size,
+        )
+
+    def discard(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.delete()
+
+    @classmethod
+    def claim(cls, user, session_ids):
+        """
+        Return the user's complete sessions for `session_ids`, in order, or
+        raise a ValidationError naming the ones that are missing or unfinished.
+        """
+        valid_ids = []
+        for session_id in session_ids:
+            try:
+                valid_ids.append(uuid.UUID(str(session_id)))
+            except ValueError:
+                pass
+        sessions = {str(s.id): s for s in cls.objects.filter(id__in=valid_ids, user=user, status='complete')}
+        missing = [str(session_id) for session_id in session_ids if str(session_id) not in sessions]
+        if missing:
+            raise serializers.ValidationError(f"Upload sessions not found or not finalized: {', '.join(missing)}")
+        return [sessions[str(session_id)] for session_id in session_ids]
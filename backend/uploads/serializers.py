@@ -0,0 +1,17 @@
+from django.conf import settings
+from rest_framework import serializers
+from .models import UploadSession
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'content_type', 'total_size', 'received_bytes', 'status', 'created_at']
+        read_only_fields = ['id', 'received_bytes', 'status', 'created_at']
+
+    def validate_total_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError('total_size must be positive.')
+        if value > settings.CHUNKED_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f'Uploads are limited to {settings.CHUNKED_UPLOAD_MAX_SIZE} bytes.')
+        return value
@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from rest_framework.test import APITestCase
+from PIL import Image
+from posts.models import ArtPost
+from story.models import Story
+from .models import UploadSession
+
+User = get_user_model()
+
+
+def temp_dir(test):
+    """Create a directory that is removed when the test ends."""
+    path = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, path, ignore_errors=True)
+    return path
+
+
+@override_settings(CHUNKED_UPLOAD_MAX_CHUNK=1024)
+class ResumableUploadTest(APITestCase):
+    def setUp(self):
+        self.enterContext(override_settings(MEDIA_ROOT=temp_dir(self), CHUNKED_UPLOAD_DIR=temp_dir(self)))
+        self.user = User.objects.create_user(username='mobile', email='mobile@test.com', password='testpass123')
+        self.client.force_authenticate(self.user)
+        buffer = BytesIO()
+        # Noise keeps the PNG larger than a few chunks
+        Image.frombytes('RGB', (64, 64), os.urandom(64 * 64 * 3)).save(buffer, 'PNG')
+        self.data = buffer.getvalue()
+
+    def start_session(self, filename='art.png'):
+        response = self.client.post('/api/uploads/', {
+            'filename': filename, 'content_type': 'image/png', 'total_size': len(self.data),
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def put_chunk(self, session_id, start, end):
+        return self.client.put(
+            f'/api/uploads/{session_id}/',
+            data=self.data[start:end + 1],
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{len(self.data)}',
+        )
+
+    def upload_all(self, session_id):
+        for start in range(0, len(self.data), 1000):
+            end = min(start + 1000, len(self.data)) - 1
+            response = self.put_chunk(session_id, start, end)
+            self.assertEqual(response.status_code, 200)
+        response = self.client.post(f'/api/uploads/{session_id}/finalize/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_resume_after_unexpected_offset(self):
+        session_id = self.start_session()
+        self.assertEqual(self.put_chunk(session_id, 0, 999).data['received_bytes'], 1000)
+
+        # A retried or out-of-order chunk is rejected with the offset to resume from
+        response = self.put_chunk(session_id, 0, 999)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['received_bytes'], 1000)
+
+        response = self.client.post(f'/api/uploads/{session_id}/finalize/')
+        self.assertEqual(response.status_code, 409)
+
+    def test_oversized_chunk_is_rejected(self):
+        session_id = self.start_session()
+        response = self.put_chunk(session_id, 0, 1999)
+        self.assertEqual(response.status_code, 413)
+
+    def test_finalized_upload_creates_art_post(self):
+        session_id = self.start_session()
+        self.upload_all(session_id)
+        path = UploadSession.objects.get(pk=session_id).path
+
+        with mock.patch('posts.serializer.schedule_derivatives'):
+            response = self.client.post('/api/posts/art/', {
+                'description': 'Uploaded in chunks', 'upload_ids': [session_id],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        post = ArtPost.objects.get(pk=response.data['id'])
+        with post.images.get().image.open('rb') as stored:
+            self.assertEqual(stored.read(), self.data)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_finalized_upload_creates_story(self):
+        session_id = self.start_session(filename='story.png')
+        self.upload_all(session_id)
+
+        response = self.client.post('/api/stories/create/', {'upload_id': session_id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Story.objects.get().media_type, 'image')
+
+    def test_unfinalized_session_cannot_be_used(self):
+        session_id = self.start_session()
+        response = self.client.post('/api/stories/create/', {'upload_id': session_id}, format='json')
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,8 @@
+from django.urls import path
+from .views import UploadSessionCreateView, UploadSessionView, UploadSessionFinalizeView
+
+urlpatterns = [
+    path('', UploadSessionCreateView.as_view(), name='upload-session-create'),
+    path('<uuid:pk>/', UploadSessionView.as_view(), name='upload-session'),
+    path('<uuid:pk>/finalize/', UploadSessionFinalizeView.as_view(), name='upload-session-finalize'),
+]
@@ -0,0 +1,92 @@
+import os
+import re
+from django.conf import settings
+from django.db.models import F
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .models import UploadSession
+from .serializers import UploadSessionSerializer
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class UploadSessionCreateView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = UploadSessionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        session = serializer.save(user=request.user)
+        os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+        open(session.path, 'wb').close()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class UploadSessionView(APIView):
+    """
+    GET reports how many bytes have arrived so a client can resume.
+    PUT appends one chunk described by a `Content-Range: bytes start-end/total`
+    header; the body is streamed straight to the .part file.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_session(self, request, pk):
+        return get_object_or_404(UploadSession, pk=pk, user=request.user)
+
+    def get(self, request, pk):
+        return Response(UploadSessionSerializer(self.get_session(request, pk)).data)
+
+    def put(self, request, pk):
+        session = self.get_session(request, pk)
+        if session.status != 'active':
+            return Response({'detail': 'Upload already finalized'}, status=status.HTTP_409_CONFLICT)
+
+        match = CONTENT_RANGE_RE.match(request.headers.get('Content-Range', ''))
+        if not match:
+            return Response({'detail': 'Content-Range header must be "bytes start-end/total"'}, status=status.HTTP_400_BAD_REQUEST)
+        start, end, total = (int(value) for value in match.groups())
+        length = end - start + 1
+
+        if total != session.total_size or end < start or end >= total:
+            return Response({'detail': 'Invalid byte range'}, status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        if length > settings.CHUNKED_UPLOAD_MAX_CHUNK:
+            return Response({'detail': f'Chunks are limited to {settings.CHUNKED_UPLOAD_MAX_CHUNK} bytes'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        if start != session.received_bytes:
+            # Tell the client where to resume from
+            return Response({'detail': 'Unexpected offset', 'received_bytes': session.received_bytes}, status=status.HTTP_409_CONFLICT)
+
+        written = 0
+        stream = request.stream
+        with open(session.path, 'r+b') as part:
+            part.seek(start)
+            while stream is not None and written < length:
+                chunk = stream.read(min(READ_CHUNK_SIZE, length - written))
+                if not chunk:
+                    break
+                part.write(chunk)
+                written += len(chunk)
+            part.truncate()
+
+        if written != length:
+            return Response({'detail': 'Chunk body shorter than Content-Range', 'received_bytes': session.received_bytes}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Only advance if no other request moved the offset meanwhile
+        UploadSession.objects.filter(pk=session.pk, received_bytes=start).update(received_bytes=F('received_bytes') + length)
+        session.refresh_from_db(fields=['received_bytes'])
+        return Response({'received_bytes': session.received_bytes})
+
+
+class UploadSessionFinalizeView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, pk):
+        session = get_object_or_404(UploadSession, pk=pk, user=request.user)
+        if session.received_bytes != session.total_size or os.path.getsize(session.path) != session.total_size:
+            return Response({'detail': 'Upload is incomplete', 'received_bytes': session.received_bytes}, status=status.HTTP_409_CONFLICT)
+        session.status = 'complete'
+        session.save(update_fields=['status', 'updated_at'])
+        return Response(UploadSessionSerializer(session).data)